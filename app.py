@@ -1,9 +1,14 @@
+import os
+import re
+import time
+
 import streamlit as st
-import numpy as np
-import pandas as pd
-from sklearn.preprocessing import LabelEncoder
-import joblib
-from PIL import Image
+from metrics import configure_from_env, metrics, timer
+from model_registry import get_serving_model, get_preprocessor, prewarm
+
+# Subsystems used by a single page or action (scoring, rules, tax, identity
+# index, drift, shadow scoring, result cache, explanations, bulk jobs) are
+# imported where they are used, so a page run only loads what it needs
 
 # Must be the first Streamlit command
 st.set_page_config(
@@ -13,13 +18,19 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Load the label encoders
-label_encoder_occupation = joblib.load("label_encoder_occupation.joblib")
-label_encoder_marital = joblib.load("label_encoder_marital_status.joblib")
-label_encoder_children = joblib.load("label_encoder_children.joblib")
+# Load the preprocessor and model and run one prediction in the background
+# while the page renders; only the first run in the process starts it
+prewarm()
+
+def load_preprocessor():
+    # Column schema, category maps and derived-feature formulas in one
+    # artifact; shared process-wide and reloaded only when the file changes
+    return get_preprocessor()
 
 def load_best_model():
-    return joblib.load("best_model.joblib")
+    # Shared process-wide (memory-mapped when best_model.shared.joblib is
+    # up to date); reloaded only when best_model.joblib changes
+    return get_serving_model()
 
 def predict_income(model, input_data):
     predicted = model.predict(input_data.reshape(1, -1))[0]
@@ -36,323 +47,35 @@ def predict_income(model, input_data):
     return predicted
 
 def classify_fraud(reported_income, predicted_income, age, occupation):
-    # Direct high risk check for large discrepancies
-    if reported_income > predicted_income * 2:
-        return "High Risk of Fraud", "red"
-    # 1. Calculate percentage difference between reported and predicted income
-    income_difference = abs(reported_income - predicted_income)
-    percentage_difference = (income_difference / predicted_income) * 100
-    
-    # 2. Check tax slab differences
-    def get_tax_slab(income):
-        if income <= 300000: return "0%"
-        elif income <= 600000: return "5%"
-        elif income <= 900000: return "10%"
-        elif income <= 1200000: return "15%"
-        elif income <= 1500000: return "20%"
-        else: return "30%"
-    
-    # 3. Set occupation-specific thresholds (made more stringent)
-    base_thresholds = {
-        "Salaried": {"variance": 3},  # Reduced from 5
-        "Self-employed": {"variance": 7},  # Reduced from 10
-        "Business": {"variance": 10}  # Reduced from 15
-    }
-
-    # 4. Collect fraud indicators
-    fraud_indicators = []
-    
-    # Check 1: Tax slab mismatch
-    if get_tax_slab(reported_income) != get_tax_slab(predicted_income):
-        fraud_indicators.append("tax_slab_mismatch")
-    
-    # Check 2: Income difference exceeds threshold
-    if percentage_difference > base_thresholds[occupation]["variance"]:
-        fraud_indicators.append("income_variance")
-    
-    # Check 3: Severe underreporting (made more stringent)
-    if reported_income < (predicted_income * 0.95):  # Changed from 0.9 to 0.95
-        fraud_indicators.append("severe_underreporting")
-    
-    # Check 4: Age-based income consistency
-    if age < 30 and reported_income > 1000000:  # High income for young age
-        fraud_indicators.append("age_income_mismatch")
-    
-    # Check 5: Occupation-based income consistency
-    if occupation == "Salaried" and reported_income > 2000000:  # Very high salary
-        fraud_indicators.append("occupation_income_mismatch")
-    
-    # 5. Final Risk Classification
-    if len(fraud_indicators) == 0:
-        return "No Fraud Detected", "green"     # No indicators triggered
-    elif len(fraud_indicators) == 1:
-        return "Low Risk of Fraud", "yellow"    # One indicator triggered
-    elif len(fraud_indicators) == 2:
-        return "Medium Risk of Fraud", "#ff9800"  # Two indicators triggered
-    else:
-        return "High Risk of Fraud", "red"      # Three or more indicators triggered
+    # Indicators and thresholds are declared in fraud_rules.json; each one
+    # that fires raises the risk level by one
+    from fraud_rules import get_rule_engine
+    from scoring import RISK_COLORS, RISK_LABELS
+    level = get_rule_engine().classify(reported_income, predicted_income, age, occupation)[0]
+    return str(RISK_LABELS[level]), str(RISK_COLORS[level])
 
 def calculate_tax(income):
-    tax_slabs = [(250000, 0.05), (500000, 0.2), (1000000, 0.3)]
-    tax = 0
-    prev_limit = 250000  # Start from exemption limit
-    
-    if income <= 250000:
-        return 0  # No tax
-    
-    for limit, rate in tax_slabs:
-        if income > limit:
-            tax += (limit - prev_limit) * rate
-            prev_limit = limit
-        else:
-            tax += (income - prev_limit) * rate
-            break
-    
-    tax += tax * 0.04  # Adding 4% Cess
-    return round(tax, 2)
+    # Slabs, cess and rounding come from the "app" regime in tax_engine.py
+    from tax_engine import tax_liability
+    return tax_liability(income)
 
-# Update the Custom CSS section with better styling
-st.markdown("""
-    <style>
-    /* Main container styling */
-    .main {
-        background-color: #f8f9fa;
-        font-family: 'Segoe UI', sans-serif;
-    }
-    
-    /* Card styling */
-    .stApp {
-        background-color: #f8f9fa;
-    }
-    
-    .card {
-        background-color: white;
-        padding: 1.5rem;
-        border-radius: 10px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        margin-bottom: 1rem;
-    }
-    
-    /* Tab styling */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 2px;
-        background-color: white;
-        padding: 0.5rem;
-        border-radius: 10px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        height: 50px;
-        padding: 0 20px;
-        background-color: #f8f9fa;
-        border-radius: 5px;
-        color: #1565c0;
-        font-weight: 500;
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background-color: #1565c0;
-        color: white;
-    }
-    
-    /* Form styling */
-    .stTextInput > div > div {
-        background-color: white;
-        padding: 0.5rem;
-        border: 1px solid #e0e0e0;
-        border-radius: 5px;
-    }
-    
-    .stNumberInput > div > div {
-        background-color: white;
-        padding: 0.5rem;
-        border: 1px solid #e0e0e0;
-        border-radius: 5px;
-    }
-    
-    /* Slider styling */
-    .stSlider {
-        padding: 1rem 0;
-    }
-    
-    .stSlider > div > div > div {
-        background-color: #1565c0;
-    }
-    
-    /* Button styling */
-    .stButton > button {
-        background-color: #1565c0;
-        color: white;
-        border: none;
-        padding: 0.5rem 2rem;
-        border-radius: 5px;
-        font-weight: 500;
-        width: 200px;
-        height: 45px;
-    }
-    
-    .stButton > button:hover {
-        background-color: #1976d2;
-    }
-    
-    /* Text styling */
-    h1 {
-        color: #1565c0;
-        font-size: 2rem !important;
-        font-weight: 600 !important;
-        margin-bottom: 1.5rem !important;
-    }
-    
-    h2 {
-        color: #1976d2;
-        font-size: 1.5rem !important;
-        font-weight: 500 !important;
-        margin: 1rem 0 !important;
-    }
-    
-    label {
-        color: #424242 !important;
-        font-weight: 500 !important;
-    }
-    
-    /* Results styling */
-    .results-card {
-        background-color: white;
-        padding: 1.5rem;
-        border-radius: 10px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        margin-top: 2rem;
-    }
-    
-    .income-item {
-        padding: 1rem;
-        border-radius: 5px;
-        background-color: #f8f9fa;
-        margin: 0.5rem 0;
-    }
-    
-    /* Increase font size for input labels */
-    .stSelectbox label, .stNumberInput label, .stTextInput label, .stSlider label {
-        color: #000000 !important;
-        font-weight: 500 !important;
-        font-size: 20px !important;
-        margin-bottom: 10px !important;
-    }
-    
-    /* Increase font size for input fields */
-    .stTextInput input, .stNumberInput input, .stSelectbox > div > div {
-        font-size: 18px !important;
-        color: #000000 !important;
-    }
-    
-    /* Increase font size for tab labels */
-    .stTabs [data-baseweb="tab"] {
-        font-size: 22px !important;
-    }
-    
-    /* Make all regular text larger */
-    .stMarkdown p {
-        font-size: 20px !important;
-        color: #000000 !important;
-    }
-    
-    /* Button text size */
-    .stButton > button {
-        font-size: 20px !important;
-    }
-
-    /* Input field styling */
-    .stTextInput input, .stNumberInput input, .stSelectbox > div > div {
-        background-color: white !important;
-        color: black !important;
-        font-size: 16px !important;
-        padding: 8px 12px !important;
-        border: 1px solid #ccc !important;
-        border-radius: 4px !important;
-        caret-color: black !important;
-    }
-
-    /* Dropdown/Selectbox styling */
-    .stSelectbox > div > div {
-        background-color: white !important;
-        color: black !important;
-    }
-
-    /* Dropdown options styling */
-    .stSelectbox [data-baseweb="select"] {
-        background-color: white !important;
-        color: black !important;
-    }
-
-    .stSelectbox [data-baseweb="popup"] ul {
-        background-color: white !important;
-    }
-
-    .stSelectbox [data-baseweb="popup"] li {
-        color: black !important;
-    }
-
-    /* Slider styling */
-    .stSlider [data-baseweb="slider"] {
-        background-color: #e0e0e0 !important;
-    }
-
-    .stSlider [data-baseweb="thumb"] {
-        background-color: #1565c0 !important;
-    }
-
-    /* Number input buttons */
-    .stNumberInput button {
-        color: black !important;
-        background-color: #f0f0f0 !important;
-        border: 1px solid #ccc !important;
-    }
+# Custom CSS lives in static/app.css and is inlined on every rerun. It
+# cannot be sent once per session: Streamlit removes any element a rerun
+# does not emit, and a linked file is no alternative because the static
+# server sends .css as text/plain with nosniff, which browsers refuse as a
+# stylesheet. So the file is read and minified once per process, which
+# keeps the per-rerun block small.
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "app.css")
+_stylesheet = None
 
-    /* Labels */
-    .stTextInput label, .stNumberInput label, .stSelectbox label {
-        color: black !important;
-        font-weight: 500 !important;
-    }
-
-    /* Make error messages black with better visibility */
-    div[data-baseweb="notification"] {
-        background-color: #ffd9d9 !important;
-    }
-
-    div[data-baseweb="notification"] div {
-        color: black !important;
-        font-weight: 700 !important;
-        font-size: 20px !important;
-    }
-
-    /* Style for error icon */
-    div[data-baseweb="notification"] svg {
-        fill: black !important;
-    }
-
-    /* Additional specific styling for Streamlit error messages */
-    .element-container div[data-testid="stImage"] {
-        background-color: #ffd9d9 !important;
-        color: black !important;
-        font-weight: bold !important;
-        font-size: 20px !important;
-    }
-
-    .stAlert > div {
-        color: black !important;
-        font-weight: bold !important;
-        font-size: 20px !important;
-        background-color: #ffd9d9 !important;
-    }
-
-    /* Ensure all error text is black and bold */
-    .stAlert p {
-        color: black !important;
-        font-weight: bold !important;
-    }
-    </style>
-""", unsafe_allow_html=True)
+def stylesheet():
+    global _stylesheet
+    if _stylesheet is None:
+        with open(STYLESHEET_PATH, encoding="utf-8") as f:
+            css = re.sub(r"/\*.*?\*/", "", f.read(), flags=re.S)
+        css = re.sub(r"\s*([{};:,>])\s*", r"\1", re.sub(r"\s+", " ", css)).strip()
+        _stylesheet = f"<style>{css}</style>"
+    return _stylesheet
 
 def home_page():
     st.markdown("""
@@ -398,6 +121,11 @@ def detection_page():
         </h1>
     """, unsafe_allow_html=True)
     
+    mode = st.radio("Mode", ["Single return", "Bulk upload"], horizontal=True, label_visibility="collapsed")
+    if mode == "Bulk upload":
+        bulk_upload_section()
+        return
+    
     # Create two columns
     col1, col2 = st.columns([2, 1])
     
@@ -467,33 +195,69 @@ def detection_page():
             elif reported_income <= 0:
                 st.error("Please enter a valid reported income")
             else:
-                # Prepare input data for prediction
-                input_data = np.array([
-                    age,
-                    label_encoder_occupation.transform([occupation])[0],
-                    label_encoder_marital.transform([marital_status])[0],
-                    label_encoder_children.transform([children])[0],
-                    interest_income,
-                    reported_income * 0.1,  # Business income estimate
-                    capital_gains,
-                    reported_income * 0.05,  # Other income estimate
-                    40000,  # Educational expenses
-                    30000,  # Healthcare costs
-                    50000,  # Lifestyle expenditure
-                    25000,  # Other expenses
-                    reported_income * 0.6,  # Bank debited
-                    reported_income * 0.3,  # Credit card debited
-                    reported_income        # Base income (this was missing)
-                ])
+                import pandas as pd
+                from drift import get_drift_monitor
+                from explain import get_explainer
+                from identity_index import get_identity_index
+                from result_cache import get_result_cache
+                from scoring import RISK_COLORS, RISK_LABELS
+                from shadow import get_shadow_scorer
+
+                detect_start = time.perf_counter()
+                # Prepare input data for prediction; the preprocessor fills in
+                # the estimated business/other income, expenses and debits
+                with timer("app.encode"):
+                    input_data = load_preprocessor().encode({
+                        "Age": age,
+                        "Occupation": occupation,
+                        "Marital_Status": marital_status,
+                        "Children (Yes/No)": children,
+                        "Interest_Income": interest_income,
+                        "Capital_Gains": capital_gains,
+                        "Reported_Income": reported_income,
+                    })[0]
                 
                 # Load model and make prediction
-                model = load_best_model()
-                predicted_income = predict_income(model, input_data)
-                
+                with timer("app.load_model"):
+                    model = load_best_model()
                 # Calculate total reported income
                 total_reported_income = reported_income + interest_income + capital_gains
                 
+                # A return submitted before (same features, model and rules)
+                # is answered from the result cache; otherwise predict and
+                # classify as usual. With the cache, app.predict also covers
+                # the rules, and result_cache.hits / misses tell which rows
+                # reached the model.
+                cache = get_result_cache()
+                if cache is not None:
+                    with timer("app.predict"):
+                        scores = cache.score(input_data.reshape(1, -1), model, load_preprocessor())
+                    predicted_income = float(scores["predicted_income"][0])
+                    level = scores["risk_level"][0]
+                    fraud_status, color = str(RISK_LABELS[level]), str(RISK_COLORS[level])
+                else:
+                    with timer("app.predict"):
+                        predicted_income = predict_income(model, input_data)
+                    with timer("app.classify_fraud"):
+                        fraud_status, color = classify_fraud(total_reported_income, predicted_income, age, occupation)
+
+                # Input drift against the training data (drift.py); a row copy
+                drift = get_drift_monitor()
+                if drift is not None:
+                    drift.observe(input_data)
+
+                # Candidate models (FRAUD_SHADOW_MODELS) score the same input
+                # in the background; this only queues it, or drops it if busy
+                shadow = get_shadow_scorer()
+                if shadow is not None:
+                    shadow.submit(input_data.reshape(1, -1), {
+                        "predicted_income": [predicted_income],
+                        "total_reported_income": [total_reported_income],
+                        "risk_level": [list(RISK_LABELS).index(fraud_status)],
+                    })
+                
                 # Show results
+                render_start = time.perf_counter()
                 st.markdown('<div class="results-container">', unsafe_allow_html=True)
                 st.markdown('<h2 style="color: #1565c0; font-size: 30px; margin: 20px 0;">Results</h2>', unsafe_allow_html=True)
                 
@@ -517,8 +281,6 @@ def detection_page():
                     ), unsafe_allow_html=True)
                 
                 with col10:
-                    # Get fraud status
-                    fraud_status, color = classify_fraud(total_reported_income, predicted_income, age, occupation)
                     st.markdown(
                         f"""
                         <div style="padding: 20px; 
@@ -533,6 +295,44 @@ def detection_page():
                         """,
                         unsafe_allow_html=True
                     )
+                
+                # Why the model predicted this income: path attributions
+                # per feature, shown for High Risk returns when the serving
+                # model is a forest that can be explained
+                explainer = get_explainer(model) if fraud_status == RISK_LABELS[-1] else None
+                if explainer is not None:
+                    with timer("app.explain"):
+                        contributions = explainer.contributions(input_data.reshape(1, -1))[0]
+                    names = load_preprocessor().feature_columns
+                    factors = sorted(((c, name) for c, name in zip(contributions, names) if c),
+                                     key=lambda factor: -abs(factor[0]))
+                    st.markdown(f"**Top factors behind the predicted income** (base value ₹{explainer.bias:,.0f})")
+                    st.table(pd.DataFrame({
+                        "Feature": [name for _, name in factors[:5]],
+                        "Contribution (₹)": [f"{c:+,.0f}" for c, _ in factors[:5]],
+                    }))
+
+                # Other returns sharing this Aadhaar / bank account, when an
+                # identity index has been built (identity_index.py build)
+                identity_index = get_identity_index()
+                if identity_index is not None:
+                    with timer("app.identity_linkage"):
+                        linkage = identity_index.features(pd.DataFrame({
+                            "PAN_Card": [pan_card],
+                            "Aadhar_Card": [aadhar_card],
+                            "Bank_Account_No": [bank_account_no],
+                        })).iloc[0]
+                    if linkage["Identity_Flag"]:
+                        st.warning(
+                            f"Shared identifiers: this Aadhaar is on {linkage['Aadhaar_Shared_PANs']} and this "
+                            f"bank account on {linkage['Bank_Shared_PANs']} other PAN(s); "
+                            f"linked cluster of {linkage['Linked_Cluster_Size']} PANs"
+                        )
+                
+                end = time.perf_counter()
+                metrics.observe("app.render", end - render_start)
+                metrics.observe("app.detect_fraud", end - detect_start)
+                metrics.increment("app.detections")
     
     with col2:
         try:
@@ -540,7 +340,68 @@ def detection_page():
         except:
             st.info("Add analysis.png to images folder")
 
+# st.fragment (st.experimental_fragment before 1.37) reruns just the job
+# status panel on a timer; older Streamlit falls back to full-page reruns
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+def bulk_upload_section():
+    # Imported here so single-return use does not pay for the process pool
+    from bulk_jobs import get_job_manager
+    from tax_engine import DEFAULT_REGIME, TAX_REGIMES
+    manager = get_job_manager()
+
+    st.markdown("""
+        <h2 style='color: #1565c0; font-size: 30px; margin: 20px 0;'>
+            Bulk Upload
+        </h2>
+    """, unsafe_allow_html=True)
+    uploaded = st.file_uploader("Returns CSV (same columns as income_regression_dataset3.csv)", type="csv")
+    regime = st.selectbox("Tax regime", sorted(TAX_REGIMES), index=sorted(TAX_REGIMES).index(DEFAULT_REGIME))
+    if uploaded is not None and st.button("Score File"):
+        try:
+            st.session_state["bulk_job"] = manager.submit(uploaded.getvalue(), uploaded.name, regime).id
+        except ValueError as exc:
+            st.error(str(exc))
+
+    job = manager.get(st.session_state.get("bulk_job", ""))
+    if job is None:
+        return
+    if _fragment is not None:
+        _fragment(run_every=None if job.done else 1)(bulk_job_status)(job)
+    else:
+        bulk_job_status(job)
+        if not job.done:
+            time.sleep(1)
+            st.rerun()
+
+def bulk_job_status(job):
+    from scoring import RISK_LABELS
+    if not job.done:
+        st.progress(job.progress, text=f"Scoring {job.filename}: {job.rows_done:,} returns "
+                                       f"({job.shards_done}/{job.shards_total} shards, {job.seconds:.0f}s)")
+        return
+    if job.status == "failed":
+        st.error(f"Scoring {job.filename} failed: {job.error}")
+        return
+    if _fragment is not None and not st.session_state.get(f"bulk_shown_{job.id}"):
+        # Rerun the whole page once so the status panel stops polling
+        st.session_state[f"bulk_shown_{job.id}"] = True
+        st.rerun()
+
+    results = job.results()
+    st.success(f"Scored {len(results):,} returns from {job.filename} in {job.seconds:.1f}s")
+    counts = results["Fraud_Risk"].value_counts().reindex(RISK_LABELS, fill_value=0)
+    for column, (label, n) in zip(st.columns(len(counts)), counts.items()):
+        column.metric(label, f"{n:,}")
+    st.dataframe(results.head(1000), use_container_width=True)
+    with open(job.output_path, "rb") as f:
+        st.download_button("Download Results", f.read(), file_name=f"scored_{job.filename}", mime="text/csv")
+
 def main():
+    # Metrics endpoint / log dump / profiler, when enabled by environment
+    configure_from_env()
+    st.markdown(stylesheet(), unsafe_allow_html=True)
+
     # Create tabs
     tabs = st.tabs(["🏠 Home", "🔍 Detection"])
     
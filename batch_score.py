@@ -0,0 +1,136 @@
+import argparse
+import sys
+import time
+
+import pandas as pd
+
+from dataset_store import DatasetStore, is_dataset_store
+from explain import get_explainer
+from fraud_rules import get_rule_engine
+from identity_index import load_identity_index
+from model_registry import get_serving_model
+from scoring import load_preprocessor, score_returns
+from tax_engine import DEFAULT_REGIME, TAX_REGIMES
+
+ID_COLUMNS = ["Name", "PAN_Card", "Aadhar_Card", "Bank_Account_No"]
+MERGE_MARKERS = ("<<<<<<<", "=======", ">>>>>>>")
+
+
+class _CleanLines:
+    # File wrapper that drops leftover git merge markers so pandas can parse the rest
+
+    def __init__(self, path):
+        self._file = open(path, "r", encoding="utf-8", newline="")
+        self._buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = self._file.readline()
+            if not line:
+                break
+            if not line.startswith(MERGE_MARKERS):
+                self._buffer += line
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def readline(self):
+        if self._buffer:
+            line, sep, rest = self._buffer.partition("\n")
+            if sep:
+                self._buffer = rest
+                return line + sep
+        data = self.read(1 << 16)
+        self._buffer = data + self._buffer
+        line, sep, rest = self._buffer.partition("\n")
+        self._buffer = rest
+        return line + sep
+
+    def close(self):
+        self._file.close()
+
+
+def clean_chunk(chunk):
+    # Merged files repeat the header row; drop those and fully blank rows
+    return chunk[chunk["Name"] != "Name"].dropna(subset=["Age"])
+
+
+def read_returns(path, chunksize=100000, columns=None, filters=None):
+    # Yield cleaned DataFrame chunks of a returns file: a CSV, or a typed
+    # store from dataset_store.py, which yields one chunk per row group and
+    # reads only `columns` of the row groups that can match `filters`
+    if is_dataset_store(path):
+        yield from DatasetStore(path).iter_batches(columns, filters)
+        return
+    if filters:
+        raise ValueError("Row filters need a dataset store; convert the CSV with dataset_store.py ingest")
+    usecols = None if columns is None else list(dict.fromkeys(["Name", "Age", *columns]))
+    source = _CleanLines(path)
+    try:
+        for chunk in pd.read_csv(source, chunksize=chunksize, usecols=usecols,
+                                 dtype={c: str for c in ID_COLUMNS}):
+            chunk = clean_chunk(chunk)
+            if len(chunk):
+                yield chunk if columns is None else chunk[list(columns)]
+    finally:
+        source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a whole returns file in batches")
+    parser.add_argument("input", help="returns CSV (same columns as income_regression_dataset3.csv) "
+                                      "or dataset store directory")
+    parser.add_argument("-o", "--output", default="scored_returns.csv")
+    parser.add_argument("--model", default="best_model.joblib")
+    parser.add_argument("--batch-size", type=int, default=100000,
+                        help="rows per model.predict call")
+    parser.add_argument("--tax-regime", default=DEFAULT_REGIME, choices=sorted(TAX_REGIMES))
+    parser.add_argument("--identity-index", help="identity_index.joblib to add linked-identity columns")
+    parser.add_argument("--explain", action="store_true",
+                        help="add Top_Factors (path attributions) for High Risk rows")
+    args = parser.parse_args()
+
+    model = get_serving_model(args.model)
+    preprocessor = load_preprocessor()
+    identity_index = load_identity_index(args.identity_index) if args.identity_index else None
+
+    start = time.perf_counter()
+    n_rows = 0
+    n_linked = 0
+    header = True
+    for chunk in read_returns(args.input, chunksize=args.batch_size):
+        scores = score_returns(chunk, model, preprocessor, batch_size=args.batch_size,
+                               tax_regime=args.tax_regime, identity_index=identity_index,
+                               explain=args.explain)
+        ids = chunk[[c for c in ID_COLUMNS if c in chunk.columns]]
+        pd.concat([ids, scores], axis=1).to_csv(args.output, mode="w" if header else "a",
+                                                header=header, index=False)
+        header = False
+        n_rows += len(chunk)
+        n_linked += int(scores["Identity_Flag"].sum()) if identity_index is not None else 0
+    elapsed = time.perf_counter() - start
+    if args.explain and get_explainer(model) is None:
+        print(f"No Top_Factors: {type(model).__name__} models cannot be explained", file=sys.stderr)
+
+    print(f"Scored {n_rows:,} returns in {elapsed:.2f}s "
+          f"({n_rows / max(elapsed, 1e-9):,.0f} rows/s) -> {args.output}")
+    if identity_index is not None:
+        print(f"  {'shared_identifiers':<28} {n_linked:>10,} returns ({n_linked / max(n_rows, 1):.1%})")
+    stats = get_rule_engine().stats()
+    for rule, hits in stats["hits"].items():
+        print(f"  {rule:<28} {hits:>10,} hits ({hits / max(stats['rows'], 1):.1%})")
+
+
+if __name__ == "__main__":
+    main()
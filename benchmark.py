@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import joblib
+import numpy as np
+
+from data_generator import generate
+from model_registry import MODEL_PATH, SHARED_MODEL_PATH, ModelRegistry, get_preprocessor, get_serving_model
+from model import build_model
+from scoring import calculate_tax_batch, classify_fraud_batch, predict_incomes
+from shared_model import load_shared_model
+
+BASELINE_PATH = "benchmark_baseline.json"
+# A result slower than baseline by more than this factor is a regression
+DEFAULT_TOLERANCE = 1.25
+# ...and by more than this many seconds, so timer noise on microsecond
+# benchmarks is not reported
+MIN_DELTA = 1e-4
+
+# Fresh-interpreter time to the first prediction, as app.py used to start
+# (eager pandas/PIL/sklearn imports, three encoder pickles, joblib.load of
+# the model) and as it starts now (registry, shared model, preprocessor)
+LEGACY_STARTUP = """
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+import joblib
+try:
+    from PIL import Image
+except ImportError:
+    pass
+encoders = [joblib.load(p) for p in ("label_encoder_occupation.joblib",
+            "label_encoder_marital_status.joblib", "label_encoder_children.joblib")]
+model = joblib.load("best_model.joblib")
+model.predict(np.zeros((1, 15)))
+"""
+FAST_STARTUP = """
+import numpy as np
+from model_registry import prewarm
+prewarm().join()
+"""
+
+OCCUPATIONS = np.array(["Salaried", "Self-employed", "Business"], dtype=object)
+
+
+def measure(fn, min_seconds=0.2, max_repeats=1000, warmup=True):
+    # Median wall time of repeated calls, in seconds
+    if warmup:
+        fn()
+    timings = []
+    total = 0.0
+    while not timings or (total < min_seconds and len(timings) < max_repeats):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        total += elapsed
+    return float(np.median(timings)), len(timings)
+
+
+def sample_returns(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "Age": rng.integers(20, 90, n_rows),
+        "Occupation": OCCUPATIONS[rng.integers(0, 3, n_rows)],
+        "Marital_Status": np.array(["Single", "Married"], dtype=object)[rng.integers(0, 2, n_rows)],
+        "Children (Yes/No)": np.array(["No", "Yes"], dtype=object)[rng.integers(0, 2, n_rows)],
+        "Interest_Income": rng.uniform(0, 100000, n_rows),
+        "Capital_Gains": rng.uniform(0, 100000, n_rows),
+        "Reported_Income": rng.uniform(200000, 3000000, n_rows),
+    }
+
+
+def bench_model_load():
+    results = {}
+    for name, path, loader in (("pickle", MODEL_PATH, joblib.load), ("shared", SHARED_MODEL_PATH, load_shared_model)):
+        if not os.path.exists(path):
+            continue
+        # Cold: a fresh registry has to read and unpickle the artifact
+        cold, _ = measure(lambda: ModelRegistry(loader).get(path), min_seconds=1.0, max_repeats=25, warmup=False)
+        registry = ModelRegistry(loader)
+        registry.get(path)
+        warm, _ = measure(lambda: registry.get(path))
+        results[f"load_best_model.{name}.cold"] = cold
+        results[f"load_best_model.{name}.warm"] = warm
+    return results
+
+
+def bench_predict(model, row_counts):
+    preprocessor = get_preprocessor()
+    results = {}
+    for n in row_counts:
+        X = preprocessor.encode(sample_returns(n))
+        seconds, _ = measure(lambda: predict_incomes(model, X), min_seconds=0.2 if n < 100000 else 0.0,
+                             max_repeats=1000 if n < 100000 else 3)
+        results[f"predict_income.rows_{n}"] = seconds
+    return results
+
+
+def bench_rules(n_rows):
+    data = sample_returns(n_rows)
+    predicted = np.random.default_rng(1).uniform(200000, 3000000, n_rows)
+    classify, _ = measure(lambda: classify_fraud_batch(data["Reported_Income"], predicted,
+                                                       data["Age"], data["Occupation"]))
+    tax, _ = measure(lambda: calculate_tax_batch(data["Reported_Income"]))
+    return {
+        f"classify_fraud.rows_{n_rows}": classify,
+        f"calculate_tax.rows_{n_rows}": tax,
+    }
+
+
+def bench_encoding(row_counts):
+    preprocessor = get_preprocessor()
+    results = {}
+    for n in row_counts:
+        data = sample_returns(n)
+        results[f"encode.rows_{n}"], _ = measure(lambda: preprocessor.encode(data))
+    return results
+
+
+def bench_training(sample_counts):
+    results = {}
+    for n in sample_counts:
+        X, y = generate(n, seed=42)
+        # Training is slow, so time a single fit
+        results[f"train.samples_{n}"], _ = measure(lambda: build_model().fit(X, y), min_seconds=0.0,
+                                                    max_repeats=1, warmup=False)
+    return results
+
+
+def bench_startup(repeats=5):
+    results = {}
+    for name, code in (("legacy", LEGACY_STARTUP), ("fast", FAST_STARTUP)):
+        def start():
+            subprocess.run([sys.executable, "-c", code], check=True)
+        results[f"startup.{name}"], _ = measure(start, min_seconds=0.0, max_repeats=repeats)
+    return results
+
+
+def run(suites, quick=False):
+    model = get_serving_model()
+    predict_rows = [1, 100, 10000] if quick else [1, 100, 10000, 1000000]
+    results = {}
+    if "load" in suites:
+        results.update(bench_model_load())
+    if "predict" in suites:
+        results.update(bench_predict(model, predict_rows))
+    if "rules" in suites:
+        results.update(bench_rules(100000 if quick else 1000000))
+    if "encode" in suites:
+        results.update(bench_encoding([1, 100000]))
+    if "startup" in suites:
+        results.update(bench_startup())
+    if "train" in suites:
+        results.update(bench_training([1000] if quick else [1000, 5000, 20000]))
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "model": type(model).__name__,
+        "seconds": results,
+    }
+
+
+def compare(report, baseline, tolerance, min_delta=MIN_DELTA):
+    # Rows of (name, baseline seconds, current seconds, ratio, regressed)
+    rows = []
+    for name, seconds in sorted(report["seconds"].items()):
+        base = baseline["seconds"].get(name)
+        if base is None:
+            rows.append((name, None, seconds, None, False))
+            continue
+        ratio = seconds / base if base > 0 else float("inf")
+        rows.append((name, base, seconds, ratio, ratio > tolerance and seconds - base > min_delta))
+    return rows
+
+
+SUITES = ["load", "predict", "rules", "encode", "startup", "train"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scoring and training hot paths")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES)
+    parser.add_argument("--quick", action="store_true", help="skip the largest sizes")
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    report = run(args.suites, args.quick)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = 0
+    rows = compare(report, baseline, args.tolerance) if baseline else [
+        (name, None, seconds, None, False) for name, seconds in sorted(report["seconds"].items())]
+    for name, base, seconds, ratio, regressed in rows:
+        line = f"{name:<38} {seconds * 1e3:>12.4f} ms"
+        if base is not None:
+            line += f"   baseline {base * 1e3:>12.4f} ms   x{ratio:.2f}"
+            if regressed:
+                line += "   REGRESSION"
+                regressions += 1
+        print(line)
+    print(f"Results written to {args.output}")
+    if regressions:
+        print(f"{regressions} benchmark(s) slower than baseline by more than x{args.tolerance}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import collections
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from batch_score import ID_COLUMNS
+from dataset_store import REQUIRED_COLUMNS
+from identity_index import INDEX_PATH
+from metrics import metrics
+from parallel_score import (SHARDS_PER_WORKER, csv_shards, make_pool, make_tasks, merge_shards, output_columns,
+                            score_shard, total_hits)
+from tax_engine import DEFAULT_REGIME
+
+WORKERS_ENV = "FRAUD_BULK_WORKERS"
+JOBS_DIR = os.path.join(tempfile.gettempdir(), "fraud_bulk_jobs")
+MAX_JOBS = 16
+# Small shards so progress moves often; bigger files get more of them
+SHARD_BYTES = 1 << 20
+
+
+class BulkJob:
+    # One uploaded file being scored. Progress fields are written by the
+    # job's thread and read by the page on every rerun.
+
+    def __init__(self, job_id, filename, input_path, output_path, tax_regime, identity_index_path):
+        self.id = job_id
+        self.filename = filename
+        self.input_path = input_path
+        self.output_path = output_path
+        self.tax_regime = tax_regime
+        self.identity_index_path = identity_index_path
+        self.status = "queued"
+        self.error = None
+        self.shards_total = 0
+        self.shards_done = 0
+        self.rows_done = 0
+        self.hits = {}
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    @property
+    def progress(self):
+        if self.status == "done":
+            return 1.0
+        return self.shards_done / self.shards_total if self.shards_total else 0.0
+
+    @property
+    def seconds(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def results(self):
+        return pd.read_csv(self.output_path)
+
+
+class BulkJobManager:
+    # Scores uploaded return files on a process pool that lives as long as
+    # the app process, so Streamlit reruns never wait on it and workers stay
+    # warm between jobs. Each shard task fetches the model and rules from
+    # the registries, so swapped artifacts are picked up without a restart.
+    # Each job is sharded like parallel_score.py and merged in the original
+    # row order.
+
+    def __init__(self, workers=None, jobs_dir=JOBS_DIR):
+        self.workers = workers or int(os.environ.get(WORKERS_ENV, 0)) or min(4, os.cpu_count() or 1)
+        self.jobs_dir = jobs_dir
+        self.jobs = collections.OrderedDict()
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = make_pool(self.workers)
+            return self._pool
+
+    def submit(self, data, filename="upload.csv", tax_regime=DEFAULT_REGIME):
+        # Queue the bytes of a returns CSV; returns the job right away
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir)
+        input_path = os.path.join(job_dir, "input.csv")
+        with open(input_path, "wb") as f:
+            f.write(data)
+        names, _ = csv_shards(input_path, 1)
+        identity_index_path = os.path.abspath(INDEX_PATH) if os.path.exists(INDEX_PATH) else None
+        # batch_score.clean_chunk also needs Name to drop repeated header
+        # rows, and the identity features need every identifier column
+        required = (ID_COLUMNS if identity_index_path else ["Name"]) + REQUIRED_COLUMNS
+        missing = [column for column in required if column not in names]
+        if missing:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise ValueError(f"{filename} is missing columns: {', '.join(missing)}")
+
+        job = BulkJob(job_id, filename, input_path, os.path.join(job_dir, "scored.csv"),
+                      tax_regime, identity_index_path)
+        with self._lock:
+            self.jobs[job_id] = job
+            self._evict()
+        threading.Thread(target=self._run, args=(job,), name=f"bulk-job-{job_id}", daemon=True).start()
+        metrics.increment("bulk.jobs")
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _evict(self):
+        # Drop the oldest finished jobs and their files beyond MAX_JOBS
+        finished = [job for job in self.jobs.values() if job.done]
+        while len(self.jobs) > MAX_JOBS and finished:
+            job = finished.pop(0)
+            del self.jobs[job.id]
+            shutil.rmtree(os.path.dirname(job.input_path), ignore_errors=True)
+
+    def _run(self, job):
+        job.started = time.time()
+        job.status = "running"
+        shard_dir = os.path.join(os.path.dirname(job.input_path), "shards")
+        os.makedirs(shard_dir, exist_ok=True)
+        try:
+            n_shards = max(self.workers * SHARDS_PER_WORKER, os.path.getsize(job.input_path) // SHARD_BYTES)
+            tasks = make_tasks(job.input_path, n_shards, shard_dir, job.tax_regime, job.identity_index_path)
+            job.shards_total = len(tasks)
+            pool = self._get_pool()
+            shards = []
+            for future in as_completed([pool.submit(score_shard, task) for task in tasks]):
+                shard = future.result()
+                shards.append(shard)
+                job.rows_done += shard["rows"]
+                job.shards_done += 1
+            merge_shards(tasks, job.output_path, output_columns(job.input_path, job.identity_index_path))
+            job.hits = total_hits(shards)
+            job.status = "done"
+            metrics.increment("bulk.rows", job.rows_done)
+        except Exception as exc:
+            if isinstance(exc, BrokenProcessPool):
+                # A worker died; start a fresh pool for the next job
+                with self._lock:
+                    self._pool = None
+            job.error = f"{type(exc).__name__}: {exc}"
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+            metrics.observe("bulk.job", job.finished - job.started)
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    # One manager per process; Streamlit reruns keep finding the same one
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = BulkJobManager()
+    return _manager
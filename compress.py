@@ -0,0 +1,308 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import r2_score
+from sklearn.model_selection import train_test_split
+
+from data_generator import generate
+from model_registry import MODEL_PATH, SHARED_MODEL_PATH, file_digest
+from scoring import load_preprocessor
+from shared_model import SharedForest, flatten_forest, load_shared_model, save_flat_forest
+from train_models import TARGET_COLUMN, load_training_frame
+
+COMPRESSED_DIR = "compressed_models"
+REPORT_PATH = "compression_report.json"
+
+# Students fitted on the forest's own predictions
+STUDENTS = {
+    "distilled_hgb": lambda: HistGradientBoostingRegressor(
+        max_iter=200, max_leaf_nodes=31, learning_rate=0.1, early_stopping=False, random_state=42),
+    "distilled_forest": lambda: RandomForestRegressor(
+        n_estimators=16, max_depth=8, min_samples_leaf=5, random_state=42),
+}
+
+
+def _is_leaf(arrays):
+    return arrays["children"][0::2] == np.arange(len(arrays["value"]))
+
+
+def leaf_nodes(arrays, X, chunk_size=4096):
+    # Global index of the leaf every row reaches in every tree: (n_rows, n_trees)
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    feature, threshold = arrays["feature"], arrays["threshold"]
+    children, roots = arrays["children"], arrays["roots"]
+    out = np.empty((len(X), len(roots)), dtype=np.int32)
+    for start in range(0, len(X), chunk_size):
+        chunk = X[start:start + chunk_size]
+        rows = np.arange(len(chunk))[:, None]
+        node = np.repeat(roots[None, :].astype(np.intp), len(chunk), axis=0)
+        for _ in range(int(arrays["depths"].max())):
+            go_right = ~(chunk[rows, feature[node]] <= threshold[node])
+            node = children[2 * node + go_right].astype(np.intp)
+        out[start:start + len(chunk)] = node
+    return out
+
+
+def _rebuild(arrays, roots, collapse=None):
+    # Copy the trees under `roots` into fresh arrays, turning nodes marked in
+    # `collapse` into leaves and dropping everything no longer reachable.
+    # Each tree is laid out breadth-first, so parents precede children.
+    leaf = _is_leaf(arrays)
+    if collapse is not None:
+        leaf = leaf | collapse
+    children = arrays["children"].reshape(-1, 2)
+    order, depths = [], []
+    for root in roots:
+        level = np.array([root])
+        depth = -1
+        while len(level):
+            order.append(level)
+            depth += 1
+            inner = level[~leaf[level]]
+            level = children[inner].ravel()
+        depths.append(depth)
+    order = np.concatenate(order)
+    new_index = np.full(len(leaf), -1, dtype=np.int64)
+    new_index[order] = np.arange(len(order))
+
+    is_leaf = leaf[order]
+    own = np.arange(len(order))
+    left = np.where(is_leaf, own, new_index[children[order, 0]])
+    right = np.where(is_leaf, own, new_index[children[order, 1]])
+    threshold = arrays["threshold"][order].copy()
+    threshold[is_leaf] = np.inf
+    return {
+        **arrays,
+        "feature": np.where(is_leaf, 0, arrays["feature"][order]).astype(arrays["feature"].dtype),
+        "threshold": threshold,
+        "children": np.column_stack([left, right]).ravel().astype(np.int32),
+        "value": arrays["value"][order],
+        "roots": new_index[np.asarray(roots)].astype(np.int32),
+        "depths": np.asarray(depths, dtype=np.int32),
+    }
+
+
+def select_trees(arrays, X, fidelity=0.9999):
+    # Greedy forward selection of the trees whose average best tracks the
+    # full forest on X; stops once R² against the forest reaches `fidelity`.
+    # With r = S - k*y, the squared error of adding tree t to the running sum
+    # S is |r + p_t|² / k², so every candidate is scored with one mat-vec.
+    P = arrays["value"][leaf_nodes(arrays, X)].astype(np.float64)
+    target = P.mean(axis=1)
+    variance = target.var() * len(target)
+    squares = (P ** 2).sum(axis=0)
+    total = np.zeros(len(target))
+    available = np.ones(P.shape[1], dtype=bool)
+    chosen = []
+    while available.any():
+        k = len(chosen) + 1
+        r = total - k * target
+        error = (r @ r + 2 * (r @ P) + squares) / k ** 2
+        error[~available] = np.inf
+        best = int(np.argmin(error))
+        chosen.append(best)
+        available[best] = False
+        total += P[:, best]
+        if 1 - error[best] / variance >= fidelity:
+            break
+    return _rebuild(arrays, arrays["roots"][sorted(chosen)])
+
+
+def collapse_leaves(arrays, tolerance):
+    # Turn an inner node into a leaf when every leaf below it is within
+    # `tolerance` of the node's own value (the mean of its training rows).
+    # Each tree's output moves by at most `tolerance` for any row, so the
+    # forest's average does too. Children always follow their parent, so a
+    # reverse sweep sees every subtree before its root.
+    value = arrays["value"]
+    leaf = _is_leaf(arrays)
+    children = arrays["children"].reshape(-1, 2)
+    low = np.where(leaf, value, np.inf)
+    high = np.where(leaf, value, -np.inf)
+    for node in np.flatnonzero(~leaf)[::-1]:
+        left, right = children[node]
+        low[node] = min(low[left], low[right])
+        high[node] = max(high[left], high[right])
+    collapse = ~leaf & (np.maximum(high - value, value - low) <= tolerance)
+    return _rebuild(arrays, arrays["roots"], collapse)
+
+
+def deduplicate(arrays):
+    # Share identical subtrees (within and across trees), leaves included:
+    # the forest becomes a DAG the engine walks exactly as before. Inner
+    # nodes must match on value too, so explain.py's path attributions of
+    # the shared subtree stay exact.
+    leaf = _is_leaf(arrays)
+    feature, threshold, value = arrays["feature"], arrays["threshold"], arrays["value"]
+    children = arrays["children"].reshape(-1, 2)
+    canonical = np.arange(len(value))
+    seen = {}
+    for node in range(len(value) - 1, -1, -1):
+        if leaf[node]:
+            key = (value[node],)
+        else:
+            left, right = children[node]
+            key = (feature[node], threshold[node], value[node], canonical[left], canonical[right])
+        canonical[node] = seen.setdefault(key, node)
+
+    kept = np.flatnonzero(canonical == np.arange(len(value)))
+    new_index = np.full(len(value), -1, dtype=np.int64)
+    new_index[kept] = np.arange(len(kept))
+    remap = new_index[canonical]
+    return {
+        **arrays,
+        "feature": feature[kept],
+        "threshold": threshold[kept],
+        "children": remap[children[kept]].ravel().astype(np.int32),
+        "value": value[kept],
+        "roots": remap[arrays["roots"]].astype(np.int32),
+    }
+
+
+def quantize(arrays, value_step=1.0):
+    # Node values rounded to `value_step` and stored as float32, feature ids
+    # as uint8. Thresholds are already float32 (floored, so routing is exact).
+    # Inner-node values are kept: prediction never reads them, but
+    # explain.py attributes each split by the change in node value.
+    value = np.round(arrays["value"] / value_step) * value_step
+    feature = arrays["feature"]
+    return {
+        **arrays,
+        "feature": feature.astype(np.uint8) if feature.max() < 256 else feature,
+        "value": value.astype(np.float32),
+    }
+
+
+def load_holdout(data_path, test_size=0.3, seed=42):
+    # Same split as train_models.py
+    dataset = load_training_frame(data_path)
+    X = load_preprocessor().encode(dataset)
+    y = dataset[TARGET_COLUMN].astype(np.float64).to_numpy()
+    return train_test_split(X, y, test_size=test_size, random_state=seed)
+
+
+def calibration_rows(X_train, n_synthetic, seed=7):
+    # Inputs on which students imitate the forest: the real training rows
+    # plus fresh draws from the generator the forest was trained on
+    X_synthetic, _ = generate(n_synthetic, seed=seed)
+    return np.vstack([X_train, X_synthetic])
+
+
+def build_variants(model, X_calibration, source_digest, fidelity, tolerance, value_step):
+    # name -> (kind, artifact); "flat" artifacts load with load_shared_model
+    exact = flatten_forest(model, source_digest)
+    variants = {"flat": ("flat", exact)}
+    pruned = deduplicate(collapse_leaves(select_trees(exact, X_calibration[:50000], fidelity), tolerance))
+    variants["pruned"] = ("flat", pruned)
+    variants["pruned_quantized"] = ("flat", deduplicate(quantize(pruned, value_step)))
+
+    teacher = SharedForest(exact)
+    y_teacher = teacher.predict(X_calibration)
+    for name, make in STUDENTS.items():
+        start = time.perf_counter()
+        student = make().fit(X_calibration, y_teacher)
+        print(f"{name}: fitted on {len(X_calibration):,} rows in {time.perf_counter() - start:.1f}s")
+        if isinstance(student, RandomForestRegressor):
+            variants[name] = ("flat", deduplicate(quantize(flatten_forest(student, source_digest), value_step)))
+        else:
+            variants[name] = ("pickle", student)
+    return variants
+
+
+def _median_seconds(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def evaluate(name, kind, path, X_test, y_test, reference):
+    load = load_shared_model if kind == "flat" else joblib.load
+    model = load(path)
+    load_seconds = _median_seconds(lambda: load(path), 5)
+    predictions = model.predict(X_test)
+    X_batch = np.resize(X_test, (10000, X_test.shape[1]))
+    entry = {
+        "variant": name,
+        "artifact": path,
+        "size_kb": round(os.path.getsize(path) / 1024, 1),
+        "load_ms": round(load_seconds * 1e3, 3),
+        "predict_1_ms": round(_median_seconds(lambda: model.predict(X_test[:1]), 200) * 1e3, 4),
+        "predict_10k_ms": round(_median_seconds(lambda: model.predict(X_batch), 10) * 1e3, 3),
+        "r2": round(float(r2_score(y_test, predictions)), 5),
+    }
+    if reference is not None:
+        entry["r2_delta"] = round(entry["r2"] - reference["r2"], 5)
+        entry["fidelity_r2"] = round(float(r2_score(reference["predictions"], predictions)), 5)
+        entry["max_abs_diff"] = round(float(np.abs(predictions - reference["predictions"]).max()), 2)
+    if kind == "flat":
+        entry["trees"] = int(len(model.roots))
+        entry["nodes"] = int(len(model.value))
+    return entry, predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and compare smaller versions of the serving forest")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--data", default="income_regression_dataset3.csv")
+    parser.add_argument("-o", "--output-dir", default=COMPRESSED_DIR)
+    parser.add_argument("--report", default=REPORT_PATH)
+    parser.add_argument("--fidelity", type=float, default=0.9999,
+                        help="R² against the full forest that the kept trees must reach")
+    parser.add_argument("--tolerance", type=float, default=1000.0,
+                        help="max change (₹) of any tree's output when collapsing subtrees")
+    parser.add_argument("--value-step", type=float, default=100.0, help="leaf value rounding (₹)")
+    parser.add_argument("--synthetic-rows", type=int, default=200000)
+    parser.add_argument("--serve", help="install this flat variant as the memory-mapped serving model")
+    args = parser.parse_args()
+
+    if args.serve:
+        path = os.path.join(args.output_dir, args.serve + ".joblib")
+        arrays = joblib.load(path)
+        if not isinstance(arrays, dict) or arrays.get("source_digest") != file_digest(args.model):
+            parser.error(f"{path} is not a flat variant built from the current {args.model}")
+        shutil.copyfile(path, SHARED_MODEL_PATH + ".tmp")
+        os.replace(SHARED_MODEL_PATH + ".tmp", SHARED_MODEL_PATH)
+        print(f"Serving {args.serve} from {SHARED_MODEL_PATH}")
+        return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    model = joblib.load(args.model)
+    if not isinstance(model, RandomForestRegressor):
+        parser.error("Only random forests can be compressed")
+    X_train, X_test, _, y_test = load_holdout(args.data)
+    variants = build_variants(model, calibration_rows(X_train, args.synthetic_rows), file_digest(args.model),
+                              args.fidelity, args.tolerance, args.value_step)
+
+    report = []
+    original, predictions = evaluate("original", "pickle", args.model, X_test, y_test, None)
+    reference = {"r2": original["r2"], "predictions": predictions}
+    report.append(original)
+    for name, (kind, artifact) in variants.items():
+        path = os.path.join(args.output_dir, name + ".joblib")
+        if kind == "flat":
+            save_flat_forest(artifact, path)
+        else:
+            joblib.dump(artifact, path)
+        entry, _ = evaluate(name, kind, path, X_test, y_test, reference)
+        report.append(entry)
+
+    with open(args.report, "w") as f:
+        json.dump({"holdout_rows": len(X_test), "variants": report}, f, indent=2)
+    print(f"{'variant':<18} {'size_kb':>9} {'load_ms':>9} {'1 row ms':>9} {'10k ms':>9} {'R2':>8} {'dR2':>8}")
+    for entry in report:
+        print(f"{entry['variant']:<18} {entry['size_kb']:>9} {entry['load_ms']:>9} {entry['predict_1_ms']:>9} "
+              f"{entry['predict_10k_ms']:>9} {entry['r2']:>8} {entry.get('r2_delta', 0):>8}")
+    print(f"Report -> {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Occupation codes as used by model.py: 0 = Salaried, 1 = Self-employed, 2 = Business
+# Age bands: 0 = under 30, 1 = 30-39, 2 = 40 and over
+INCOME_MEAN = np.array([
+    [400000, 600000, 800000],     # Salaried: 4L / 6L / 8L
+    [500000, 800000, 1000000],    # Self-employed: 5L / 8L / 10L
+    [600000, 1000000, 1500000],   # Business: 6L / 10L / 15L
+], dtype=np.float64)
+INCOME_STD = np.array([
+    [100000, 150000, 200000],
+    [150000, 200000, 300000],
+    [200000, 300000, 400000],
+], dtype=np.float64)
+AGE_BAND_EDGES = np.array([30, 40])
+
+# (mean share, std share) of base income for the 10 derived money columns
+DERIVED_SHARES = [
+    (0.05, 0.01),    # Interest income
+    (0.08, 0.02),    # Business income
+    (0.06, 0.015),   # Capital gains
+    (0.03, 0.01),    # Other income
+    (0.15, 0.03),    # Educational expenses
+    (0.10, 0.02),    # Healthcare costs
+    (0.20, 0.04),    # Lifestyle expenditure
+    (0.12, 0.03),    # Other expenses
+    (0.60, 0.10),    # Bank debited
+    (0.30, 0.05),    # Credit card debited
+]
+N_FEATURES = 5 + len(DERIVED_SHARES)
+
+
+def generate_chunk(n_samples, rng):
+    # Vectorized version of model.py's per-sample loop; returns (X, y)
+    age = rng.integers(25, 65, n_samples)
+    occupation = rng.integers(0, 3, n_samples)
+    marital_status = rng.integers(0, 2, n_samples)
+    children = rng.integers(0, 2, n_samples)
+
+    band = np.searchsorted(AGE_BAND_EDGES, age, side="right")
+    base_income = rng.normal(INCOME_MEAN[occupation, band], INCOME_STD[occupation, band])
+    base_income *= 1 + (age - 25) * 0.003  # 0.3% increase per year
+    base_income *= np.where(marital_status == 1, 1.05, 1.0)
+    base_income *= np.where(children == 1, 1.02, 1.0)
+
+    X = np.empty((n_samples, N_FEATURES), dtype=np.float64)
+    X[:, 0] = age
+    X[:, 1] = occupation
+    X[:, 2] = marital_status
+    X[:, 3] = children
+    for j, (mean_share, std_share) in enumerate(DERIVED_SHARES, start=4):
+        X[:, j] = rng.normal(base_income * mean_share, np.abs(base_income) * std_share)
+    X[:, -1] = base_income
+
+    # Ensure all values are positive
+    np.abs(X, out=X)
+    return X, np.abs(base_income)
+
+
+def chunk_bounds(n_samples, chunk_size):
+    return [(start, min(start + chunk_size, n_samples)) for start in range(0, n_samples, chunk_size)]
+
+
+def chunk_rngs(seed, n_chunks):
+    # One independent stream per chunk, so output depends only on the seed and
+    # chunk size, never on how many processes produced it
+    return [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(n_chunks)]
+
+
+def iter_chunks(n_samples, seed=42, chunk_size=1000000):
+    # Stream (X, y) chunks without ever holding the full dataset in memory
+    bounds = chunk_bounds(n_samples, chunk_size)
+    for (start, stop), rng in zip(bounds, chunk_rngs(seed, len(bounds))):
+        yield generate_chunk(stop - start, rng)
+
+
+def generate(n_samples, seed=42, chunk_size=1000000):
+    X_parts, y_parts = zip(*iter_chunks(n_samples, seed, chunk_size))
+    return np.concatenate(X_parts), np.concatenate(y_parts)
+
+
+def _write_chunk(out_dir, start, stop, seed_seq):
+    X, y = generate_chunk(stop - start, np.random.default_rng(seed_seq))
+    X_out = np.load(os.path.join(out_dir, "X.npy"), mmap_mode="r+")
+    y_out = np.load(os.path.join(out_dir, "y.npy"), mmap_mode="r+")
+    X_out[start:stop] = X
+    y_out[start:stop] = y
+    X_out.flush()
+    y_out.flush()
+    return stop - start
+
+
+def write_dataset(out_dir, n_samples, seed=42, chunk_size=1000000, workers=1):
+    # Preallocate X.npy / y.npy on disk and fill them chunk by chunk; with
+    # workers > 1 the chunks are generated in parallel processes, each writing
+    # straight into its own slice of the memory-mapped files
+    os.makedirs(out_dir, exist_ok=True)
+    np.lib.format.open_memmap(os.path.join(out_dir, "X.npy"), mode="w+",
+                              dtype=np.float64, shape=(n_samples, N_FEATURES)).flush()
+    np.lib.format.open_memmap(os.path.join(out_dir, "y.npy"), mode="w+",
+                              dtype=np.float64, shape=(n_samples,)).flush()
+
+    bounds = chunk_bounds(n_samples, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(bounds))
+    if workers <= 1:
+        for (start, stop), seed_seq in zip(bounds, seeds):
+            _write_chunk(out_dir, start, stop, seed_seq)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_write_chunk, out_dir, start, stop, seed_seq)
+                       for (start, stop), seed_seq in zip(bounds, seeds)]
+            for future in futures:
+                future.result()
+    return out_dir
+
+
+def load_dataset(out_dir, mmap_mode="r"):
+    return (np.load(os.path.join(out_dir, "X.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(out_dir, "y.npy"), mmap_mode=mmap_mode))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic training data in chunks")
+    parser.add_argument("-n", "--samples", type=int, default=10000000)
+    parser.add_argument("-o", "--output", default="synthetic_data")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    write_dataset(args.output, args.samples, args.seed, args.chunk_size, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {args.samples:,} samples to {args.output}/ in {elapsed:.2f}s "
+          f"({args.samples / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+import argparse
+import json
+import operator
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; fall back to memory-mapped .npy columns
+    pa = pq = None
+
+from model_registry import file_digest
+from preprocessing import load_preprocessor
+
+MANIFEST = "manifest.json"
+PARQUET_FILE = "data.parquet"
+STORE_VERSION = 1
+ROW_GROUP_SIZE = 16384
+
+STRING_COLUMNS = ["Name", "PAN_Card", "Aadhar_Card", "Bank_Account_No"]
+# Rows missing any of these (or holding an invalid value) are dropped
+REQUIRED_COLUMNS = ["Age", "Occupation", "Marital_Status", "Children (Yes/No)", "Reported_Income"]
+AGE_RANGE = (0, 130)
+# Narrowest first; a column gets the first type that holds all its values
+# exactly. Signed only, so differences between columns cannot wrap around.
+INTEGER_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+OPERATORS = {
+    "==": operator.eq, "!=": operator.ne, "<": operator.lt,
+    "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+
+
+def is_dataset_store(path):
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+class _NumericType:
+    # Running facts about a numeric column, settling on the narrowest dtype
+    # that holds every value exactly: an integer type when the column is
+    # whole numbers without gaps, else float32 or float64
+
+    def __init__(self):
+        self.low = np.inf
+        self.high = -np.inf
+        self.has_missing = False
+        self.whole = True
+        self.float32_exact = True
+
+    def update(self, values):
+        finite = values[~np.isnan(values)]
+        self.has_missing |= len(finite) < len(values)
+        if len(finite):
+            self.low = min(self.low, finite.min())
+            self.high = max(self.high, finite.max())
+            self.whole &= bool(np.array_equal(finite, np.round(finite)))
+            self.float32_exact &= bool(np.array_equal(finite.astype(np.float32), finite))
+
+    def dtype(self):
+        if self.whole and not self.has_missing:
+            low, high = (self.low, self.high) if self.low <= self.high else (0, 0)
+            for dtype in INTEGER_TYPES:
+                info = np.iinfo(dtype)
+                if info.min <= low and high <= info.max:
+                    return np.dtype(dtype).name
+        return "float32" if self.float32_exact else "float64"
+
+
+class _Validator:
+    # Cleans one chunk of raw CSV strings and counts what was rejected
+
+    def __init__(self, categories):
+        self.categories = categories
+        self.rows_read = 0
+        self.dropped = {}
+        self.invalid_cells = {}
+
+    def _count(self, table, name, n):
+        if n:
+            table[name] = table.get(name, 0) + int(n)
+
+    def clean(self, chunk):
+        self.rows_read += len(chunk)
+        frame = {}
+        bad_rows = np.zeros(len(chunk), dtype=bool)
+        for column in chunk.columns:
+            raw = chunk[column]
+            if column in STRING_COLUMNS:
+                frame[column] = raw.astype(object).str.strip().to_numpy()
+                continue
+            if column in self.categories:
+                values = raw.astype(object).str.strip()
+                invalid = ~values.isin(self.categories[column]) & values.notna()
+                frame[column] = values.where(~invalid).to_numpy(dtype=object)
+            else:
+                values = pd.to_numeric(raw, errors="coerce").to_numpy(dtype=np.float64, copy=True)
+                invalid = (np.isnan(values) & raw.notna().to_numpy()) | (values < 0)
+                if column == "Age":
+                    invalid |= (values < AGE_RANGE[0]) | (values > AGE_RANGE[1])
+                values[invalid] = np.nan
+                frame[column] = values
+            self._count(self.invalid_cells, column, np.count_nonzero(invalid))
+            if column in REQUIRED_COLUMNS:
+                missing = pd.isna(frame[column])
+                self._count(self.dropped, f"missing_or_invalid_{column}", np.count_nonzero(missing & ~bad_rows))
+                bad_rows |= missing
+        keep = ~bad_rows
+        return pd.DataFrame({column: values[keep] for column, values in frame.items()})
+
+
+def _typed(frame, schema):
+    # Cast a cleaned chunk to the store schema
+    columns = {}
+    for column, spec in schema.items():
+        values = frame[column]
+        if spec["type"] == "category":
+            columns[column] = pd.Categorical(values, categories=spec["categories"])
+        elif spec["type"] == "string":
+            columns[column] = values.astype(object)
+        else:
+            columns[column] = values.to_numpy().astype(spec["type"])
+    return pd.DataFrame(columns)
+
+
+def _column_stats(values, spec):
+    # Row-group statistics used to skip row groups that cannot match a filter
+    if spec["type"] == "category":
+        return {"values": sorted(values.dropna().unique().tolist())}
+    present = values.dropna()
+    if not len(present):
+        return {"min": None, "max": None}
+    low, high = present.min(), present.max()
+    if spec["type"] != "string":
+        low, high = low.item(), high.item()
+    return {"min": low, "max": high}
+
+
+def ingest(csv_path, store_path, row_group_size=ROW_GROUP_SIZE, sort_by=None, engine=None):
+    # Validate and clean a returns CSV once and write it as a typed columnar
+    # store. Two streaming passes: the first cleans and settles the schema,
+    # the second casts and writes row groups. sort_by orders rows so that
+    # filters on that column skip most row groups (needs the file in memory).
+    from batch_score import read_returns
+
+    engine = engine or ("parquet" if pq is not None else "npy")
+    if engine == "parquet" and pq is None:
+        raise ImportError("The parquet engine needs pyarrow; use engine='npy'")
+    categories = {column: list(values) for column, values in load_preprocessor().categories.items()}
+    validator = _Validator(categories)
+
+    start = time.perf_counter()
+    numeric = {}
+    columns = None
+    for chunk in read_returns(csv_path):
+        cleaned = validator.clean(chunk)
+        columns = columns or list(cleaned.columns)
+        for column in cleaned.columns:
+            if column not in STRING_COLUMNS and column not in categories:
+                numeric.setdefault(column, _NumericType()).update(cleaned[column].to_numpy())
+    if columns is None:
+        raise ValueError(f"No returns in {csv_path}")
+    schema = {}
+    for column in columns:
+        if column in STRING_COLUMNS:
+            schema[column] = {"type": "string"}
+        elif column in categories:
+            schema[column] = {"type": "category", "categories": categories[column]}
+        else:
+            schema[column] = {"type": numeric[column].dtype()}
+
+    chunks = (_typed(_Validator(categories).clean(chunk), schema) for chunk in read_returns(csv_path))
+    if sort_by is not None:
+        frame = pd.concat(chunks, ignore_index=True).sort_values(sort_by, kind="stable", ignore_index=True)
+        chunks = [frame]
+
+    if os.path.exists(store_path):
+        shutil.rmtree(store_path)
+    os.makedirs(store_path)
+    writer = _ParquetWriter(store_path) if engine == "parquet" else _NpyWriter(store_path)
+    row_groups = []
+    pending = None
+    for chunk in chunks:
+        pending = chunk if pending is None else pd.concat([pending, chunk], ignore_index=True)
+        while len(pending) >= row_group_size:
+            row_groups.append(_write_group(writer, pending.iloc[:row_group_size], schema))
+            pending = pending.iloc[row_group_size:].reset_index(drop=True)
+    if pending is not None and len(pending):
+        row_groups.append(_write_group(writer, pending, schema))
+    writer.close()
+
+    manifest = {
+        "version": STORE_VERSION,
+        "engine": engine,
+        "schema": schema,
+        "row_groups": row_groups,
+        "rows": sum(g["rows"] for g in row_groups),
+        "sorted_by": sort_by,
+        "ingest": {
+            "source": os.path.abspath(csv_path),
+            "source_digest": file_digest(csv_path),
+            "rows_read": validator.rows_read,
+            "dropped": validator.dropped,
+            "invalid_cells": validator.invalid_cells,
+            "seconds": round(time.perf_counter() - start, 3),
+        },
+    }
+    with open(os.path.join(store_path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _write_group(writer, frame, schema):
+    writer.write(frame)
+    return {"rows": len(frame), "stats": {c: _column_stats(frame[c], spec) for c, spec in schema.items()}}
+
+
+class _ParquetWriter:
+    def __init__(self, store_path):
+        self.path = os.path.join(store_path, PARQUET_FILE)
+        self.writer = None
+
+    def write(self, frame):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table, row_group_size=len(frame))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class _NpyWriter:
+    # One directory per row group and one .npy file per column, so a reader
+    # memory-maps just the columns it asks for. Categories are stored as
+    # int8 codes, strings as fixed-width bytes (unicode if not all ASCII).
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.n_groups = 0
+
+    def write(self, frame):
+        group_dir = os.path.join(self.store_path, f"rg-{self.n_groups:05d}")
+        os.makedirs(group_dir)
+        for i, column in enumerate(frame.columns):
+            values = frame[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                data = values.cat.codes.to_numpy()
+            elif values.dtype == object:
+                data = values.fillna("").to_numpy().astype(str)
+                if all(v.isascii() for v in data):
+                    data = data.astype(bytes)
+            else:
+                data = values.to_numpy()
+            np.save(os.path.join(group_dir, f"c{i:03d}.npy"), data)
+        self.n_groups += 1
+
+    def close(self):
+        pass
+
+
+def _may_match(stats, op, value):
+    # False when the row-group statistics rule out every row for (op, value)
+    if "values" in stats:
+        present = set(stats["values"])
+        wanted = set(value) if op in ("in", "not in") else {value}
+        if op in ("==", "in"):
+            return bool(present & wanted)
+        if op in ("!=", "not in"):
+            return bool(present - wanted)
+        return True
+    low, high = stats["min"], stats["max"]
+    if low is None:
+        return op in ("!=", "not in")
+    if op == "==":
+        return low <= value <= high
+    if op == "in":
+        return any(low <= v <= high for v in value)
+    if op == "!=":
+        return not (low == high == value)
+    if op == "not in":
+        return not (low == high and low in value)
+    if op == "<":
+        return low < value
+    if op == "<=":
+        return low <= value
+    if op == ">":
+        return high > value
+    return high >= value
+
+
+def filter_rows(frame, filters):
+    # Boolean mask of the rows matching every (column, op, value) filter
+    mask = np.ones(len(frame), dtype=bool)
+    for column, op, value in filters:
+        values = frame[column]
+        if op == "in":
+            mask &= values.isin(value).to_numpy()
+        elif op == "not in":
+            mask &= ~values.isin(value).to_numpy()
+        else:
+            mask &= OPERATORS[op](values, value).to_numpy()
+    return mask
+
+
+class DatasetStore:
+    # Reader for a store written by ingest(): loads only the requested
+    # columns of the row groups whose statistics can satisfy the filters
+
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != STORE_VERSION:
+            raise ValueError(f"Unsupported dataset store version: {self.manifest['version']}")
+        self.path = path
+        self.schema = self.manifest["schema"]
+        self.columns = list(self.schema)
+        self.engine = self.manifest["engine"]
+        if self.engine == "parquet":
+            if pq is None:
+                raise ImportError(f"{path} was written with pyarrow, which is not installed")
+            self._parquet = pq.ParquetFile(os.path.join(path, PARQUET_FILE))
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def _check(self, columns, filters):
+        for column in list(columns) + [f[0] for f in filters]:
+            if column not in self.schema:
+                raise KeyError(f"No column {column!r} in {self.path}")
+        for _, op, _ in filters:
+            if op not in OPERATORS and op not in ("in", "not in"):
+                raise ValueError(f"Unknown filter operator: {op}")
+
+    def row_groups(self, filters=()):
+        # Indexes of the row groups that may hold matching rows
+        return [i for i, group in enumerate(self.manifest["row_groups"])
+                if all(_may_match(group["stats"][c], op, v) for c, op, v in filters)]
+
+    def read_row_group(self, i, columns=None):
+        columns = list(columns) if columns is not None else self.columns
+        if self.engine == "parquet":
+            return self._parquet.read_row_group(i, columns=columns).to_pandas()
+        group_dir = os.path.join(self.path, f"rg-{i:05d}")
+        data = {}
+        for column in columns:
+            values = np.load(os.path.join(group_dir, f"c{self.columns.index(column):03d}.npy"), mmap_mode="r")
+            spec = self.schema[column]
+            if spec["type"] == "category":
+                data[column] = pd.Categorical.from_codes(values, spec["categories"])
+            elif spec["type"] == "string":
+                values = values.astype(str).astype(object)
+                data[column] = np.where(values == "", None, values)
+            else:
+                data[column] = np.array(values)
+        return pd.DataFrame(data)
+
+    def iter_batches(self, columns=None, filters=()):
+        # One DataFrame per surviving row group
+        columns = list(columns) if columns is not None else self.columns
+        filters = list(filters or ())
+        self._check(columns, filters)
+        needed = columns + [c for c, _, _ in filters if c not in columns]
+        for i in self.row_groups(filters):
+            frame = self.read_row_group(i, needed)
+            if filters:
+                frame = frame[filter_rows(frame, filters)]
+                if not len(frame):
+                    continue
+            yield frame[columns]
+
+    def read(self, columns=None, filters=()):
+        batches = list(self.iter_batches(columns, filters))
+        if not batches:
+            columns = list(columns) if columns is not None else self.columns
+            return _typed(pd.DataFrame({c: pd.Series([], dtype=object) for c in columns}),
+                          {c: self.schema[c] for c in columns})
+        return pd.concat(batches, ignore_index=True)
+
+    def nbytes(self, columns=None):
+        # On-disk bytes of the given columns
+        if self.engine == "parquet":
+            meta = self._parquet.metadata
+            wanted = set(columns or self.columns)
+            return sum(meta.row_group(i).column(j).total_compressed_size
+                       for i in range(meta.num_row_groups) for j in range(meta.num_columns)
+                       if meta.row_group(i).column(j).path_in_schema in wanted)
+        return sum(os.path.getsize(os.path.join(self.path, f"rg-{i:05d}", f"c{self.columns.index(c):03d}.npy"))
+                   for i in range(len(self.manifest["row_groups"])) for c in (columns or self.columns))
+
+
+def load_dataset(path, columns=None, filters=()):
+    # A store as one DataFrame, reading only `columns` of the row groups that
+    # can match `filters` ([(column, op, value), ...], all must hold)
+    return DatasetStore(path).read(columns, filters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a returns CSV to a typed columnar dataset store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("ingest", help="validate, clean and convert a CSV")
+    convert.add_argument("input")
+    convert.add_argument("-o", "--output", help="store directory (default: <input>.store)")
+    convert.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    convert.add_argument("--sort-by", help="order rows by this column so filters on it skip row groups")
+    convert.add_argument("--engine", choices=["parquet", "npy"], help="default: parquet when pyarrow is installed")
+    info = sub.add_parser("info", help="schema, row groups and ingestion report of a store")
+    info.add_argument("store")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        output = args.output or os.path.splitext(args.input)[0] + ".store"
+        manifest = ingest(args.input, output, args.row_group_size, args.sort_by, args.engine)
+        store = DatasetStore(output)
+        report = manifest["ingest"]
+        print(f"{report['rows_read']:,} rows read, {manifest['rows']:,} written in {report['seconds']:.2f}s "
+              f"({manifest['engine']}, {len(manifest['row_groups'])} row groups) -> {output}")
+        for reason, n in report["dropped"].items():
+            print(f"  dropped {n:,} rows: {reason}")
+        for column, n in report["invalid_cells"].items():
+            print(f"  {n:,} invalid cells in {column} set to missing")
+        from batch_score import read_returns
+        raw = pd.concat(read_returns(args.input)).memory_usage(deep=True).sum()
+        typed = store.read().memory_usage(deep=True).sum()
+        print(f"CSV {os.path.getsize(args.input) / 1e6:.2f} MB -> store {store.nbytes() / 1e6:.2f} MB; "
+              f"in memory {raw / 1e6:.2f} MB -> {typed / 1e6:.2f} MB")
+    else:
+        store = DatasetStore(args.store)
+        print(f"{len(store):,} rows, {len(store.manifest['row_groups'])} row groups ({store.engine})")
+        for column, spec in store.schema.items():
+            print(f"  {column:<24} {spec['type']}")
+        print(json.dumps(store.manifest["ingest"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+import argparse
+import copy
+import glob
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import joblib
+import numpy as np
+
+from model_registry import ModelRegistry, get_preprocessor
+from outliers import QuantileSketch
+
+SKETCH_FORMAT = 1
+REFERENCE_ENV = "FRAUD_DRIFT_REFERENCE"
+SNAPSHOT_DIR_ENV = "FRAUD_DRIFT_SNAPSHOTS"
+REFERENCE_PATH = "drift_reference.joblib"
+SNAPSHOT_DIR = "drift_snapshots"
+SNAPSHOT_INTERVAL = 60.0
+# A snapshot not rewritten for this long belongs to a process that is gone
+SNAPSHOT_MAX_AGE = 10 * SNAPSHOT_INTERVAL
+# Rows buffered per process before they are folded into the sketches
+BUFFER_ROWS = 256
+# PSI over the reference deciles; 0.1 / 0.25 are the usual warn / drift bounds
+PSI_QUANTILES = np.linspace(0.1, 0.9, 9)
+PSI_WARN = 0.1
+PSI_DRIFT = 0.25
+PSI_FLOOR = 1e-4
+
+
+class DriftSketch:
+    # Fixed-size summary of encoded model inputs: a quantile sketch over the
+    # numeric features and a count per category for the categorical ones.
+    # Memory does not grow with the rows seen, and sketches from different
+    # processes (or days) merge by adding their tables.
+
+    def __init__(self, feature_columns, categories, relative_accuracy=0.01):
+        self.feature_columns = list(feature_columns)
+        self.categories = {column: list(values) for column, values in categories.items()}
+        self.numeric_columns = [c for c in self.feature_columns if c not in self.categories]
+        self._numeric_index = [self.feature_columns.index(c) for c in self.numeric_columns]
+        self.numeric = QuantileSketch(len(self.numeric_columns), relative_accuracy)
+        self.category_counts = {column: np.zeros(len(values), dtype=np.int64)
+                                for column, values in self.categories.items()}
+        self.rows = 0
+        self.created = time.time()
+
+    @classmethod
+    def for_preprocessor(cls, preprocessor, relative_accuracy=0.01):
+        return cls(preprocessor.feature_columns, preprocessor.categories, relative_accuracy)
+
+    def update(self, X):
+        # X: encoded rows, (n_rows, n_features)
+        self.numeric.update(X[:, self._numeric_index])
+        for column, counts in self.category_counts.items():
+            codes = X[:, self.feature_columns.index(column)]
+            codes = codes[np.isfinite(codes)].astype(np.intp)
+            counts += np.bincount(codes, minlength=len(counts))[:len(counts)]
+        self.rows += len(X)
+
+    def merge(self, other):
+        if other.feature_columns != self.feature_columns or other.categories != self.categories:
+            raise ValueError("Can only merge drift sketches over the same features")
+        self.numeric.merge(other.numeric)
+        for column, counts in self.category_counts.items():
+            counts += other.category_counts[column]
+        self.rows += other.rows
+        self.created = min(self.created, other.created)
+        return self
+
+    def save(self, path):
+        # Plain arrays through a temp file, so readers never see a partial
+        # snapshot and loading does not depend on where the class lives
+        handle, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        os.close(handle)
+        joblib.dump({
+            "format": SKETCH_FORMAT,
+            "feature_columns": self.feature_columns,
+            "categories": self.categories,
+            "relative_accuracy": self.numeric.relative_accuracy,
+            "positive": self.numeric.positive,
+            "negative": self.numeric.negative,
+            "zero": self.numeric.zero,
+            "category_counts": self.category_counts,
+            "rows": self.rows,
+            "created": self.created,
+        }, tmp)
+        os.replace(tmp, path)
+
+
+def load_drift_sketch(path):
+    state = joblib.load(path)
+    if state.get("format") != SKETCH_FORMAT:
+        raise ValueError(f"{path} is not a drift sketch (format {state.get('format')})")
+    sketch = DriftSketch(state["feature_columns"], state["categories"], state["relative_accuracy"])
+    sketch.numeric.positive[:] = state["positive"]
+    sketch.numeric.negative[:] = state["negative"]
+    sketch.numeric.zero[:] = state["zero"]
+    for column, counts in sketch.category_counts.items():
+        counts[:] = state["category_counts"][column]
+    sketch.rows = state["rows"]
+    sketch.created = state["created"]
+    return sketch
+
+
+def _bin_shares(sketch, edges):
+    # Share of values in each bin between consecutive edges (rows), per column
+    cdf = sketch.cdf(edges)
+    return np.diff(np.vstack([np.zeros_like(cdf[:1]), cdf, np.ones_like(cdf[:1])]), axis=0)
+
+
+def _psi(expected, actual):
+    expected = np.maximum(expected, PSI_FLOOR)
+    actual = np.maximum(actual, PSI_FLOOR)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def _status(psi):
+    return "drift" if psi >= PSI_DRIFT else "warn" if psi >= PSI_WARN else "ok"
+
+
+def drift_scores(reference, current):
+    # Per feature: PSI of the current inputs over the reference deciles (or
+    # categories) and, for numeric features, the KS distance on the sketch
+    # grid. Both only read the two sketches' tables.
+    features = {}
+    if current.numeric.n_columns:
+        edges = reference.numeric.quantiles(PSI_QUANTILES)
+        expected = _bin_shares(reference.numeric, edges)
+        actual = _bin_shares(current.numeric, edges)
+        grid, _ = reference.numeric.buckets()
+        grid = np.broadcast_to(grid[:, None], (len(grid), reference.numeric.n_columns))
+        ks = np.nanmax(np.abs(reference.numeric.cdf(grid) - current.numeric.cdf(grid)), axis=0)
+        quantiles = current.numeric.quantiles([0.5])[0]
+        reference_quantiles = reference.numeric.quantiles([0.5])[0]
+        for j, column in enumerate(current.numeric_columns):
+            if np.isnan(expected[:, j]).any() or np.isnan(actual[:, j]).any():
+                continue
+            psi = _psi(expected[:, j], actual[:, j])
+            features[column] = {"psi": psi, "ks": float(ks[j]), "status": _status(psi),
+                                "median": float(quantiles[j]), "reference_median": float(reference_quantiles[j])}
+    for column, counts in current.category_counts.items():
+        reference_counts = reference.category_counts[column]
+        if not counts.sum() or not reference_counts.sum():
+            continue
+        shares = counts / counts.sum()
+        reference_shares = reference_counts / reference_counts.sum()
+        psi = _psi(reference_shares, shares)
+        features[column] = {"psi": psi, "status": _status(psi),
+                            "shares": dict(zip(current.categories[column], shares.round(4).tolist())),
+                            "reference_shares": dict(zip(current.categories[column],
+                                                         reference_shares.round(4).tolist()))}
+    worst = max((f["psi"] for f in features.values()), default=0.0)
+    return {
+        "rows": current.rows,
+        "reference_rows": reference.rows,
+        "since": current.created,
+        "max_psi": worst,
+        "status": _status(worst),
+        "features": dict(sorted(features.items(), key=lambda item: -item[1]["psi"])),
+    }
+
+
+class DriftMonitor:
+    # Per-process monitor for live inputs. observe() copies the encoded rows
+    # into a fixed buffer, and every BUFFER_ROWS rows the buffer is folded
+    # into the sketch in one vectorized update, so a request costs a copy
+    # plus an amortized fraction of a flush. A daemon thread saves the
+    # sketch to snapshot_dir for drift.py report to merge across processes.
+
+    def __init__(self, preprocessor, reference_path=REFERENCE_PATH, snapshot_dir=SNAPSHOT_DIR,
+                 buffer_rows=BUFFER_ROWS):
+        self.sketch = DriftSketch.for_preprocessor(preprocessor)
+        self.reference_path = reference_path
+        self.snapshot_dir = snapshot_dir
+        self._buffer = np.empty((buffer_rows, len(preprocessor.feature_columns)), dtype=np.float64)
+        self._filled = 0
+        self._lock = threading.Lock()
+        self._saver = None
+
+    def observe(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self._buffer.shape[1])
+        with self._lock:
+            if self._filled + len(X) > len(self._buffer):
+                self._flush()
+                if len(X) > len(self._buffer):
+                    self.sketch.update(X)
+                    return
+            self._buffer[self._filled:self._filled + len(X)] = X
+            self._filled += len(X)
+
+    def _flush(self):
+        if self._filled:
+            self.sketch.update(self._buffer[:self._filled])
+            self._filled = 0
+
+    def snapshot(self):
+        with self._lock:
+            self._flush()
+            return copy.deepcopy(self.sketch)
+
+    def report(self):
+        # Scored on a copy, so observe() only waits for the flush and copy;
+        # the reference is re-read only when its file changes
+        return drift_scores(_reference_registry.get(self.reference_path), self.snapshot())
+
+    def save(self):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self.snapshot().save(os.path.join(self.snapshot_dir, f"{socket.gethostname()}-{os.getpid()}.joblib"))
+        prune_snapshots(self.snapshot_dir)
+
+    def start_saving(self, interval=SNAPSHOT_INTERVAL):
+        # Save a snapshot every `interval` seconds from a daemon thread
+        if self._saver is None:
+            def run():
+                while True:
+                    time.sleep(interval)
+                    self.save()
+            self._saver = threading.Thread(target=run, name="drift-snapshots", daemon=True)
+            self._saver.start()
+        return self._saver
+
+
+_reference_registry = ModelRegistry(loader=load_drift_sketch)
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_drift_monitor():
+    # The process's monitor for the reference in FRAUD_DRIFT_REFERENCE,
+    # saving to FRAUD_DRIFT_SNAPSHOTS (default drift_snapshots/); None (and
+    # no overhead) when monitoring is off or the reference is missing
+    global _monitor
+    if _monitor is None:
+        reference_path = os.environ.get(REFERENCE_ENV)
+        if not reference_path or not os.path.exists(reference_path):
+            return None
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = DriftMonitor(get_preprocessor(), reference_path,
+                                        os.environ.get(SNAPSHOT_DIR_ENV, SNAPSHOT_DIR))
+                _monitor.start_saving()
+    return _monitor
+
+
+def sketch_training_data(chunk_size=100000):
+    # DriftSketch of the synthetic rows model.py trains on, regenerated from
+    # its sample count and seed; they are already encoded model inputs
+    from data_generator import iter_chunks
+    from model import TRAINING_SAMPLES, TRAINING_SEED
+    sketch = DriftSketch.for_preprocessor(get_preprocessor())
+    for X, _ in iter_chunks(TRAINING_SAMPLES, TRAINING_SEED, chunk_size):
+        sketch.update(X)
+    return sketch
+
+
+def sketch_file(path, chunksize=100000):
+    # DriftSketch of a whole returns file, streamed in chunks
+    from batch_score import read_returns
+    preprocessor = get_preprocessor()
+    sketch = DriftSketch.for_preprocessor(preprocessor)
+    for chunk in read_returns(path, chunksize=chunksize):
+        sketch.update(preprocessor.encode(chunk))
+    return sketch
+
+
+def _snapshot_paths(snapshot_dir, max_age):
+    # (fresh, stale) snapshot files by modification time
+    now = time.time()
+    fresh, stale = [], []
+    for path in sorted(glob.glob(os.path.join(snapshot_dir, "*.joblib"))):
+        try:
+            (fresh if now - os.path.getmtime(path) <= max_age else stale).append(path)
+        except FileNotFoundError:
+            pass
+    return fresh, stale
+
+
+def prune_snapshots(snapshot_dir=SNAPSHOT_DIR, max_age=SNAPSHOT_MAX_AGE):
+    # Delete the snapshots of processes that stopped saving; returns how many
+    _, stale = _snapshot_paths(snapshot_dir, max_age)
+    for path in stale:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return len(stale)
+
+
+def merge_snapshots(snapshot_dir=SNAPSHOT_DIR, max_age=SNAPSHOT_MAX_AGE):
+    # Live processes only: snapshots older than max_age are left out
+    paths, _ = _snapshot_paths(snapshot_dir, max_age)
+    if not paths:
+        raise FileNotFoundError(f"No drift snapshots newer than {max_age:.0f}s in {snapshot_dir}")
+    merged = load_drift_sketch(paths[0])
+    for path in paths[1:]:
+        merged.merge(load_drift_sketch(path))
+    return merged, len(paths)
+
+
+def print_scores(scores):
+    print(f"{scores['rows']:,} rows vs {scores['reference_rows']:,} reference rows: "
+          f"max PSI {scores['max_psi']:.3f} ({scores['status']})")
+    print(f"{'feature':<24} {'PSI':>7} {'KS':>6} {'status':>6}  median (reference)")
+    for column, f in scores["features"].items():
+        ks = f"{f['ks']:.3f}" if "ks" in f else ""
+        median = f"{f['median']:,.0f} ({f['reference_median']:,.0f})" if "median" in f else ""
+        print(f"{column:<24} {f['psi']:>7.3f} {ks:>6} {f['status']:>6}  {median}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Input drift against the training data, from streaming sketches")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("reference", help="sketch the training data as the drift reference")
+    build.add_argument("input", nargs="?",
+                       help="returns CSV or dataset store the model was retrained on (default: model.py's "
+                            "synthetic training set)")
+    build.add_argument("--reference", default=os.environ.get(REFERENCE_ENV, REFERENCE_PATH))
+    check = sub.add_parser("check", help="drift of a returns file against the reference")
+    check.add_argument("input", help="returns CSV or dataset store directory")
+    check.add_argument("--reference", default=os.environ.get(REFERENCE_ENV, REFERENCE_PATH))
+    report = sub.add_parser("report", help="merge the live snapshots of every process and score them")
+    report.add_argument("--snapshots", default=os.environ.get(SNAPSHOT_DIR_ENV, SNAPSHOT_DIR))
+    report.add_argument("--max-age", type=float, default=SNAPSHOT_MAX_AGE,
+                        help="seconds after which a process's snapshot is left out")
+    report.add_argument("--reference", default=os.environ.get(REFERENCE_ENV, REFERENCE_PATH))
+    args = parser.parse_args()
+
+    if args.command == "reference":
+        start = time.perf_counter()
+        sketch = sketch_file(args.input) if args.input else sketch_training_data()
+        sketch.save(args.reference)
+        print(f"Sketched {sketch.rows:,} rows in {time.perf_counter() - start:.2f}s -> {args.reference} "
+              f"({os.path.getsize(args.reference) / 1e3:,.0f} kB)")
+        return
+
+    reference = load_drift_sketch(args.reference)
+    if args.command == "check":
+        current = sketch_file(args.input)
+    else:
+        current, n_snapshots = merge_snapshots(args.snapshots, args.max_age)
+        print(f"Merged {n_snapshots} snapshot(s) from {args.snapshots}")
+    start = time.perf_counter()
+    scores = drift_scores(reference, current)
+    print_scores(scores)
+    print(f"Scored in {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import time
+import weakref
+
+import numpy as np
+
+from metrics import timed
+from shared_model import SharedForest, flatten_forest
+
+TOP_FACTORS = 3
+# Rows per vectorized pass; bounds the (rows x trees) working arrays
+CHUNK_ROWS = 4096
+
+
+class ForestExplainer:
+    # Saabas-style path attributions for a flattened forest. Each split a row
+    # passes through moves the prediction from the parent's mean to the
+    # child's mean, and that change is credited to the split's feature:
+    #   prediction = bias + sum of contributions over features
+    # where bias is the mean root value over trees. The change for every
+    # (node, direction) is computed once here, so explaining a batch is
+    # max_depth vectorized gathers plus one bincount per level.
+
+    def __init__(self, arrays):
+        self.n_features = int(arrays["n_features"])
+        self.feature = np.asarray(arrays["feature"])
+        self.threshold = np.asarray(arrays["threshold"])
+        self.children = np.asarray(arrays["children"])
+        value = np.asarray(arrays["value"], dtype=np.float64)
+        self.roots = np.asarray(arrays["roots"]).astype(np.intp)
+        self.max_depth = int(np.max(arrays["depths"]))
+        self.n_trees = len(self.roots)
+        inner = self.children[0::2] != np.arange(len(value))
+        if inner.any() and not value[inner].any() and value.any():
+            # Quantized exports from before compress.py kept inner-node values
+            raise ValueError("This forest export has no inner-node values; re-export it to explain predictions")
+        # Leaves point at themselves, so their step adds 0
+        self.step_delta = value[self.children] - np.repeat(value, 2)
+        self.bias = float(value[self.roots].mean())
+
+    @classmethod
+    def for_model(cls, model):
+        if isinstance(model, SharedForest):
+            return cls({
+                "n_features": model.n_features_in_, "feature": model.feature, "threshold": model.threshold,
+                "children": model.children, "value": model.value, "roots": model.roots, "depths": model.depths,
+            })
+        estimators = getattr(model, "estimators_", None)
+        if estimators is None or np.ndim(estimators) != 1:
+            raise ValueError(f"Explanations need a random forest, not {type(model).__name__}")
+        return cls(flatten_forest(model))
+
+    def contributions(self, X):
+        # (n_rows, n_features) contributions in the model's output units;
+        # each row sums to its unclipped prediction minus self.bias
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        out = np.zeros((len(X), self.n_features), dtype=np.float64)
+        for start in range(0, len(X), CHUNK_ROWS):
+            chunk = X[start:start + CHUNK_ROWS]
+            n_rows = len(chunk)
+            flat = chunk.ravel()
+            row_base = (np.arange(n_rows, dtype=np.intp) * self.n_features)[:, None]
+            node = np.broadcast_to(self.roots, (n_rows, self.n_trees))
+            total = np.zeros(n_rows * self.n_features, dtype=np.float64)
+            for _ in range(self.max_depth):
+                feature = self.feature[node]
+                # NaN fails "<=" and goes right, as in sklearn
+                step = 2 * node + ~(flat[row_base + feature] <= self.threshold[node])
+                total += np.bincount((row_base + feature).ravel(), weights=self.step_delta[step].ravel(),
+                                     minlength=len(total))
+                node = self.children[step]
+            out[start:start + n_rows] = total.reshape(n_rows, self.n_features) / self.n_trees
+        return out
+
+    def top_factors(self, X, feature_names, k=TOP_FACTORS):
+        # Per row, up to k features with the largest absolute (nonzero)
+        # contribution as "Feature +12,345; Other -6,789"
+        contributions = self.contributions(X)
+        order = np.argsort(-np.abs(contributions), axis=1)[:, :k]
+        return ["; ".join(f"{feature_names[j]} {contributions[i, j]:+,.0f}" for j in row if contributions[i, j])
+                for i, row in enumerate(order)]
+
+
+_explainers = weakref.WeakKeyDictionary()
+
+
+def get_explainer(model):
+    # One explainer per loaded model object: the per-node deltas are built
+    # on first use and dropped together with the model when it is reloaded.
+    # None for models that cannot be explained (not a random forest, or an
+    # export without inner-node values), so callers can skip explanations.
+    if model not in _explainers:
+        try:
+            _explainers[model] = ForestExplainer.for_model(model)
+        except ValueError:
+            _explainers[model] = None
+    return _explainers[model]
+
+
+@timed("explain")
+def explain_rows(model, X, feature_names, k=TOP_FACTORS):
+    # None when get_explainer() has no explainer for the model
+    explainer = get_explainer(model)
+    return explainer.top_factors(X, feature_names, k) if explainer is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time path attributions for the serving model")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 100, 10000])
+    args = parser.parse_args()
+
+    from model_registry import get_preprocessor, get_serving_model
+    model = get_serving_model()
+    start = time.perf_counter()
+    explainer = ForestExplainer.for_model(model)
+    print(f"Precomputed {len(explainer.step_delta):,} node steps for {explainer.n_trees} trees "
+          f"in {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    rng = np.random.default_rng(0)
+    names = get_preprocessor().feature_columns
+    for n in args.rows:
+        X = rng.uniform(0, 3000000, (n, explainer.n_features))
+        X[:, 0] = rng.integers(20, 90, n)
+        X[:, 1] = rng.integers(0, 3, n)
+        X[:, 2:4] = rng.integers(0, 2, (n, 2))
+        start = time.perf_counter()
+        contributions = explainer.contributions(X)
+        elapsed = time.perf_counter() - start
+        error = np.abs(explainer.bias + contributions.sum(axis=1) - model.predict(X)).max()
+        print(f"{n:>7,} rows: {elapsed * 1e3:8.2f} ms ({elapsed / n * 1e6:.1f} µs/row), "
+              f"max |bias + sum - predict| = {error:.3g}")
+        if n == 1:
+            print(f"  {explainer.top_factors(X, names)[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # numba is optional; fall back to the NumPy traversal
+    numba = None
+
+# Rows walked together through one tree by the compiled kernel. Interleaving
+# independent rows hides the load latency of each row's root-to-leaf chain.
+ROW_BLOCK = 64
+# Rows per kernel call; keeps int32 row offsets far from overflowing
+MAX_ROWS_PER_CALL = 1 << 20
+
+
+def _predict_numpy(X, feature, threshold, children, value, roots, max_depth, chunk_size=2048):
+    # Walk every tree at once, one level per step, for a chunk of rows at a
+    # time. Leaves loop back to themselves, so no per-row leaf check is needed.
+    n_features = X.shape[1]
+    out = np.empty(len(X), dtype=np.float64)
+    for start in range(0, len(X), chunk_size):
+        chunk = X[start:start + chunk_size]
+        flat = chunk.ravel()
+        base = (np.arange(len(chunk), dtype=np.intp) * n_features)[:, None]
+        node = np.repeat(roots[None, :].astype(np.intp), len(chunk), axis=0)
+        for _ in range(max_depth):
+            # NaN fails "<=" and goes right, as in sklearn
+            go_right = ~(flat[base + feature[node]] <= threshold[node])
+            node = children[2 * node + go_right]
+        # Sum tree by tree so the result matches sklearn's average
+        total = np.zeros(len(chunk), dtype=np.float64)
+        for t in range(node.shape[1]):
+            total += value[node[:, t]]
+        out[start:start + len(chunk)] = total / node.shape[1]
+    return out
+
+
+if numba is not None:
+    @numba.njit(cache=True, nogil=True)
+    def _predict_compiled(X, feature, threshold, children, value, roots, max_depth):
+        n_rows, n_features = X.shape
+        n_trees = roots.shape[0]
+        flat = X.ravel()
+        out = np.zeros(n_rows, dtype=np.float64)
+        block = min(ROW_BLOCK, n_rows)
+        base = np.empty(block, dtype=np.int32)
+        index = np.empty(block, dtype=np.int32)
+        node = np.empty(block, dtype=np.int32)
+        x = np.empty(block, dtype=np.float32)
+        t = np.empty(block, dtype=np.float32)
+        for start in range(0, n_rows, block):
+            size = min(block, n_rows - start)
+            for j in range(block):
+                # Pad a short last block by repeating its first row
+                base[j] = (start + j if j < size else start) * n_features
+            for tree in range(n_trees):
+                root = roots[tree]
+                for j in range(block):
+                    node[j] = root
+                # Each step is split into simple loops over the block so the
+                # compiler can turn the lookups into vector gathers
+                for _ in range(max_depth):
+                    for j in range(block):
+                        index[j] = base[j] + feature[node[j]]
+                    for j in range(block):
+                        x[j] = flat[index[j]]
+                    for j in range(block):
+                        t[j] = threshold[node[j]]
+                    for j in range(block):
+                        node[j] = children[2 * node[j] + (0 if x[j] <= t[j] else 1)]
+                for j in range(size):
+                    out[start + j] += value[node[j]]
+        return out / n_trees
+else:
+    _predict_compiled = None
+
+
+def predict_forest(X, feature, threshold, children, value, roots, max_depth):
+    # X must already be a C-contiguous float32 (n_rows, n_features) array,
+    # matching the float32 comparison sklearn does internally
+    if _predict_compiled is None:
+        return _predict_numpy(X, feature, threshold, children, value, roots, max_depth)
+    if len(X) <= MAX_ROWS_PER_CALL:
+        return _predict_compiled(X, feature, threshold, children, value, roots, max_depth)
+    return np.concatenate([
+        _predict_compiled(X[start:start + MAX_ROWS_PER_CALL], feature, threshold,
+                          children, value, roots, max_depth)
+        for start in range(0, len(X), MAX_ROWS_PER_CALL)
+    ])
+
+
+def backend():
+    return "numba" if _predict_compiled is not None else "numpy"
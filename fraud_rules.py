@@ -0,0 +1,216 @@
+import argparse
+import collections
+import json
+import operator
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from model_registry import ModelRegistry
+
+RULES_PATH = "fraud_rules.json"
+
+# The checks of classify_fraud() in app.py, as data. Each indicator that
+# fires adds one to a return's risk level (capped at max_level); an override
+# that fires sets the level outright. Conditions:
+#   {"field": f, "op": op, "value": v}                    f op v
+#   {"field": f, "op": op, "other": g, "scale": s}        f op g * s
+#   {"field": f, "op": op, "by": g, "value": {k: v}}      f op v[g], per category
+#   {"slab_of": [f, g], "limits": [...], "op": "!="}      slab(f) op slab(g)
+#   {"all": [...]} / {"any": [...]}
+# Fields: reported_income, predicted_income, age, occupation and
+# percentage_difference (|reported - predicted| / predicted * 100).
+# Slabs are searchsorted over the upper limits, so income == limit stays in
+# the lower slab.
+DEFAULT_RULES = {
+    "version": 1,
+    "max_level": 3,
+    "indicators": [
+        {"name": "tax_slab_mismatch",
+         "when": {"slab_of": ["reported_income", "predicted_income"], "op": "!=",
+                  "limits": [300000, 600000, 900000, 1200000, 1500000]}},
+        {"name": "income_variance",
+         "when": {"field": "percentage_difference", "op": ">", "by": "occupation",
+                  "value": {"Salaried": 3, "Self-employed": 7, "Business": 10}}},
+        {"name": "severe_underreporting",
+         "when": {"field": "reported_income", "op": "<", "other": "predicted_income", "scale": 0.95}},
+        {"name": "age_income_mismatch",
+         "when": {"all": [{"field": "age", "op": "<", "value": 30},
+                          {"field": "reported_income", "op": ">", "value": 1000000}]}},
+        {"name": "occupation_income_mismatch",
+         "when": {"all": [{"field": "occupation", "op": "==", "value": "Salaried"},
+                          {"field": "reported_income", "op": ">", "value": 2000000}]}},
+    ],
+    "overrides": [
+        {"name": "large_discrepancy", "level": 3,
+         "when": {"field": "reported_income", "op": ">", "other": "predicted_income", "scale": 2}},
+    ],
+}
+
+OPERATORS = {
+    "<": operator.lt, "<=": operator.le, ">": operator.gt,
+    ">=": operator.ge, "==": operator.eq, "!=": operator.ne,
+}
+FIELDS = {"reported_income", "predicted_income", "age", "occupation", "percentage_difference"}
+
+
+class _Context:
+    # Input columns for one evaluation, with derived columns computed once
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __getitem__(self, name):
+        if name not in self.columns:
+            if name != "percentage_difference":
+                raise KeyError(name)
+            reported, predicted = self["reported_income"], self["predicted_income"]
+            self.columns[name] = np.abs(reported - predicted) / predicted * 100
+        return self.columns[name]
+
+
+def _compile(condition):
+    # Turn a condition into a function of the context returning a bool mask
+    if "all" in condition or "any" in condition:
+        parts = [_compile(c) for c in condition.get("all", condition.get("any"))]
+        combine = np.logical_and if "all" in condition else np.logical_or
+        return lambda ctx: combine.reduce([part(ctx) for part in parts])
+
+    op = OPERATORS[condition["op"]]
+    if "slab_of" in condition:
+        limits = np.asarray(condition["limits"], dtype=np.float64)
+        left, right = condition["slab_of"]
+        return lambda ctx: op(np.searchsorted(limits, ctx[left], side="left"),
+                              np.searchsorted(limits, ctx[right], side="left"))
+
+    field = condition["field"]
+    if field not in FIELDS:
+        raise ValueError(f"Unknown field in fraud rule: {field}")
+    if "other" in condition:
+        other, scale = condition["other"], condition.get("scale", 1)
+        return lambda ctx: op(ctx[field], ctx[other] * scale)
+    if "by" in condition:
+        by = condition["by"]
+        index = pd.Index(list(condition["value"]))
+        table = np.asarray(list(condition["value"].values()), dtype=np.float64)
+
+        def per_category(ctx):
+            codes = index.get_indexer(ctx[by])
+            if (codes < 0).any():
+                unknown = sorted(set(ctx[by][codes < 0].astype(str).tolist()))
+                raise ValueError(f"Unknown {by} values: {unknown}")
+            return op(ctx[field], table[codes])
+        return per_category
+    value = condition["value"]
+    return lambda ctx: op(ctx[field], value)
+
+
+class RuleEngine:
+    # Compiled fraud rules: one NumPy mask per rule over the whole batch.
+    # hit_counts accumulates how often each rule fired across calls.
+
+    def __init__(self, spec):
+        if spec["version"] != 1:
+            raise ValueError(f"Unsupported fraud rules version: {spec['version']}")
+        self.spec = spec
+        self.max_level = spec["max_level"]
+        self.indicators = [(rule["name"], _compile(rule["when"])) for rule in spec["indicators"]]
+        self.overrides = [(rule["name"], rule["level"], _compile(rule["when"])) for rule in spec["overrides"]]
+        self.rules = [name for name, _ in self.indicators] + [name for name, _, _ in self.overrides]
+        self.hit_counts = collections.Counter()
+        self.level_counts = np.zeros(self.max_level + 1, dtype=np.int64)
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def evaluate(self, reported_income, predicted_income, age, occupation):
+        # (risk level 0..max_level per row, rule name -> bool mask)
+        ctx = _Context({
+            "reported_income": np.atleast_1d(np.asarray(reported_income, dtype=np.float64)),
+            "predicted_income": np.atleast_1d(np.asarray(predicted_income, dtype=np.float64)),
+            "age": np.atleast_1d(np.asarray(age, dtype=np.float64)),
+            "occupation": np.atleast_1d(np.asarray(occupation, dtype=object)),
+        })
+        n_rows = len(ctx["reported_income"])
+        masks = {}
+        level = np.zeros(n_rows, dtype=np.int8)
+        for name, rule in self.indicators:
+            masks[name] = np.broadcast_to(rule(ctx), (n_rows,))
+            level += masks[name]
+        np.minimum(level, self.max_level, out=level)
+        for name, override_level, rule in self.overrides:
+            masks[name] = np.broadcast_to(rule(ctx), (n_rows,))
+            level[masks[name]] = override_level
+
+        self.record(level, masks)
+        return level, masks
+
+    def record(self, level, masks):
+        # Add rows classified elsewhere (e.g. answered from a result cache)
+        # to the hit and level counts
+        with self._lock:
+            self.rows += len(level)
+            for name, mask in masks.items():
+                self.hit_counts[name] += int(np.count_nonzero(mask))
+            self.level_counts += np.bincount(level, minlength=len(self.level_counts))[:len(self.level_counts)]
+
+    def hit_bits(self, masks):
+        # Per row, bit i set when self.rules[i] fired
+        bits = 0
+        for i, name in enumerate(self.rules):
+            bits = bits | masks[name].astype(np.int64) << i
+        return bits
+
+    def masks_from_bits(self, bits):
+        bits = np.asarray(bits, dtype=np.int64)
+        return {name: (bits >> i) & 1 == 1 for i, name in enumerate(self.rules)}
+
+    def classify(self, reported_income, predicted_income, age, occupation):
+        return self.evaluate(reported_income, predicted_income, age, occupation)[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rows": self.rows,
+                "hits": {name: self.hit_counts[name] for name in self.rules},
+                "levels": {level: int(n) for level, n in enumerate(self.level_counts)},
+            }
+
+
+def load_rule_engine(path=RULES_PATH):
+    with open(path) as f:
+        return RuleEngine(json.load(f))
+
+
+_rules_registry = ModelRegistry(loader=load_rule_engine)
+_default_engine = None
+
+
+def get_rule_engine(path=RULES_PATH):
+    # Rules from fraud_rules.json, reloaded when the file changes; the
+    # built-in defaults when there is no such file
+    global _default_engine
+    if os.path.exists(path):
+        return _rules_registry.get(path)
+    if _default_engine is None:
+        _default_engine = RuleEngine(DEFAULT_RULES)
+    return _default_engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write or check the fraud rule configuration")
+    parser.add_argument("--write-defaults", action="store_true", help=f"write the built-in rules to {RULES_PATH}")
+    parser.add_argument("--rules", default=RULES_PATH)
+    args = parser.parse_args()
+
+    if args.write_defaults:
+        with open(args.rules, "w") as f:
+            json.dump(DEFAULT_RULES, f, indent=2)
+        print(f"Rules written to {args.rules}")
+    engine = get_rule_engine(args.rules)
+    print(f"{len(engine.indicators)} indicators, {len(engine.overrides)} overrides: {', '.join(engine.rules)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+import argparse
+import os
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from model_registry import ModelRegistry
+
+INDEX_PATH = "identity_index.joblib"
+INDEX_FORMAT = 1
+
+# Identifier kinds and their columns. Each kind hashes with its own key, so
+# the same string as a PAN and as a bank account never collide.
+ID_KINDS = {
+    "pan": "PAN_Card",
+    "aadhaar": "Aadhar_Card",
+    "bank": "Bank_Account_No",
+}
+HASH_KEYS = {
+    "pan": "fraud-id-pan-000",
+    "aadhaar": "fraud-id-aadhar0",
+    "bank": "fraud-id-bank-00",
+}
+# Columns kept per indexed return, for answering lookups
+RECORD_COLUMNS = ["Name", "PAN_Card", "Aadhar_Card", "Bank_Account_No"]
+PAIR_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def normalize_ids(values):
+    # Upper case without spaces or dashes; missing values become ""
+    return np.array([v.upper().replace(" ", "").replace("-", "") if isinstance(v, str) else ""
+                     for v in np.asarray(values, dtype=object)], dtype=object)
+
+
+def hash_ids(values, kind):
+    # 64-bit hashes of normalized identifiers; 0 marks a missing value
+    ids = normalize_ids(values)
+    hashes = pd.util.hash_array(ids, hash_key=HASH_KEYS[kind])
+    hashes[hashes == 0] = 1
+    hashes[ids == ""] = 0
+    return hashes
+
+
+def _pair_hashes(left, right):
+    with np.errstate(over="ignore"):
+        hashes = (left * PAIR_MIX) ^ right
+    hashes[hashes == 0] = 1
+    return hashes
+
+
+class HashTable:
+    # Open-addressing (linear probing) table from uint64 keys to their
+    # insertion positions, at most half full. Insert and lookup both run a
+    # whole batch per probe step, so a lookup costs O(1) expected probes.
+
+    def __init__(self, keys):
+        keys = np.asarray(keys, dtype=np.uint64)
+        self.size = 0
+        self._allocate(len(keys))
+        self.insert(keys)
+
+    def _allocate(self, n_keys):
+        capacity = 16
+        while capacity < 2 * n_keys:
+            capacity *= 2
+        self.mask = np.uint64(capacity - 1)
+        self.slots = np.zeros(capacity, dtype=np.uint64)
+        self.values = np.full(capacity, -1, dtype=np.int64)
+
+    def insert(self, keys):
+        # Add distinct keys not in the table yet, at positions size, size+1, ...
+        keys = np.asarray(keys, dtype=np.uint64)
+        if 2 * (self.size + len(keys)) > len(self.slots):
+            # Grow to keep the table half empty: re-place the stored keys first
+            used = self.values >= 0
+            stored = np.empty(self.size, dtype=np.uint64)
+            stored[self.values[used]] = self.slots[used]
+            self._allocate(self.size + len(keys))
+            self._place(stored, 0)
+        self._place(keys, self.size)
+        self.size += len(keys)
+
+    def _place(self, keys, start):
+        pending = np.arange(len(keys))
+        pos = keys & self.mask
+        while len(pending):
+            free = np.flatnonzero(self.slots[pos] == 0)
+            # One key wins each free slot; everything else probes onward
+            _, first = np.unique(pos[free], return_index=True)
+            winners = free[first]
+            self.slots[pos[winners]] = keys[pending[winners]]
+            self.values[pos[winners]] = start + pending[winners]
+            placed = np.zeros(len(pending), dtype=bool)
+            placed[winners] = True
+            pending = pending[~placed]
+            pos = (pos[~placed] + np.uint64(1)) & self.mask
+
+    def find(self, queries):
+        # Position of each query in `keys`, or -1
+        queries = np.asarray(queries, dtype=np.uint64)
+        found = np.full(len(queries), -1, dtype=np.int64)
+        pending = np.flatnonzero(queries != 0)
+        pos = queries[pending] & self.mask
+        while len(pending):
+            slot = self.slots[pos]
+            hit = slot == queries[pending]
+            found[pending[hit]] = self.values[pos[hit]]
+            more = ~hit & (slot != 0)
+            pending = pending[more]
+            pos = (pos[more] + np.uint64(1)) & self.mask
+        return found
+
+
+class IdentityIndex:
+    # Every identifier seen in the indexed returns, the returns holding it
+    # and the linked cluster it belongs to. Clusters are the connected
+    # components of the graph joining each return's PAN to its Aadhaar and
+    # bank account, so two PANs sharing an account land in one cluster.
+
+    def __init__(self, hashes=None, records=None):
+        self.hashes = hashes if hashes is not None else {kind: np.zeros(0, dtype=np.uint64) for kind in ID_KINDS}
+        self.records = records if records is not None else pd.DataFrame(columns=RECORD_COLUMNS)
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.key_kinds = np.zeros(0, dtype=np.int64)
+        self.table = HashTable(self.keys)
+        self.posting_rows = np.zeros(0, dtype=np.int64)
+        self.posting_offsets = np.zeros(1, dtype=np.int64)
+        self.pair_table = HashTable(self.keys)
+        # Per-key tables end in a 0 entry, so key id -1 (unknown) reads 0
+        self.pans_per_key = np.zeros(1, dtype=np.int64)
+        self.cluster = np.zeros(0, dtype=np.int64)
+        self.cluster_pans = np.zeros(0, dtype=np.int64)
+        self.row_cluster = np.zeros(0, dtype=np.int64)
+        self._index(self.hashes, 0)
+
+    @classmethod
+    def from_frames(cls, frames):
+        index = cls()
+        index.update(frames)
+        return index
+
+    def __len__(self):
+        return len(self.records)
+
+    def update(self, frames):
+        # Add returns (a DataFrame or an iterable of chunks). Only the new
+        # rows are hashed and indexed: their new identifiers go into the
+        # existing tables and only the clusters they touch are merged.
+        if isinstance(frames, pd.DataFrame):
+            frames = [frames]
+        hashes = {kind: [] for kind in ID_KINDS}
+        records = []
+        for frame in frames:
+            for kind, column in ID_KINDS.items():
+                hashes[kind].append(hash_ids(frame[column], kind))
+            records.append(frame.reindex(columns=RECORD_COLUMNS).astype(object))
+        if not records:
+            return self
+        hashes = {kind: np.concatenate(parts) for kind, parts in hashes.items()}
+        start = len(self.records)
+        self.hashes = {kind: np.concatenate([self.hashes[kind], hashes[kind]]) for kind in ID_KINDS}
+        self.records = pd.concat([self.records, *records], ignore_index=True)
+        self._index(hashes, start)
+        return self
+
+    def _index(self, hashes, start):
+        # Index the rows from `start` on, whose identifier hashes are given.
+        # Loading a saved index runs this once over every row. scipy is
+        # imported here so that importing this module (app.py does) stays
+        # cheap when no index exists.
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        n_rows = len(hashes["pan"])
+        all_hashes = np.concatenate([hashes[kind] for kind in ID_KINDS])
+        kinds = np.repeat(np.arange(len(ID_KINDS)), n_rows)
+        rows = np.tile(np.arange(start, start + n_rows), len(ID_KINDS))
+        present = all_hashes != 0
+
+        # Key ids: known identifiers keep theirs, new ones are appended
+        n_old_keys = len(self.keys)
+        key_ids = self.table.find(all_hashes[present])
+        new = key_ids < 0
+        fresh, first, inverse = np.unique(all_hashes[present][new], return_index=True, return_inverse=True)
+        key_ids[new] = n_old_keys + inverse
+        self.keys = np.concatenate([self.keys, fresh])
+        self.key_kinds = np.concatenate([self.key_kinds, kinds[present][new][first]])
+        self.table.insert(fresh)
+        n_keys = len(self.keys)
+
+        # Rows holding each key, grouped by key (CSR layout); new rows go at
+        # the end of their key's run, so every run stays in row order
+        order = np.argsort(key_ids, kind="stable")
+        ends = np.append(self.posting_offsets[1:], len(self.posting_rows))
+        self.posting_rows = np.insert(self.posting_rows, ends[np.minimum(key_ids[order], n_old_keys)],
+                                      rows[present][order])
+        counts = np.bincount(key_ids, minlength=n_keys)
+        counts[:n_old_keys] += np.diff(self.posting_offsets)
+        self.posting_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        # Per new row, the key id of each kind (-1 when missing)
+        row_keys = np.full(len(all_hashes), -1, dtype=np.int64)
+        row_keys[present] = key_ids
+        row_keys = row_keys.reshape(len(ID_KINDS), n_rows)
+        pan, others = row_keys[0], row_keys[1:]
+
+        # Distinct (PAN, Aadhaar / bank key) pairs not seen before, and the
+        # PANs they add to each such key
+        both = (pan >= 0) & (others >= 0)
+        pair_keys = np.broadcast_to(pan, others.shape)[both]
+        pair_hashes, first = np.unique(_pair_hashes(self.keys[pair_keys], self.keys[others[both]]),
+                                       return_index=True)
+        unseen = self.pair_table.find(pair_hashes) < 0
+        self.pair_table.insert(pair_hashes[unseen])
+        pans_per_key = np.concatenate([self.pans_per_key[:-1], np.zeros(len(fresh), dtype=np.int64)])
+        pans_per_key += np.bincount(others[both][first[unseen]], minlength=n_keys)
+        self.pans_per_key = np.append(pans_per_key, 0)
+
+        # Linked clusters: connect every key of a return to its first key.
+        # New keys start as clusters of their own; only the clusters on the
+        # new edges are joined, then labels are renumbered without gaps in
+        # order of each cluster's first key.
+        anchor = np.where(pan >= 0, pan, np.where(others[0] >= 0, others[0], others[1]))
+        n_old_clusters = len(self.cluster_pans)
+        cluster = np.concatenate([self.cluster, n_old_clusters + np.arange(len(fresh))])
+        edges = [(anchor, ids) for ids in others]
+        src = cluster[np.concatenate([a[(a >= 0) & (b >= 0)] for a, b in edges])]
+        dst = cluster[np.concatenate([b[(a >= 0) & (b >= 0)] for a, b in edges])]
+        touched, nodes = np.unique(np.concatenate([src, dst]), return_inverse=True)
+        graph = coo_matrix((np.ones(len(src), dtype=np.int8), (nodes[:len(src)], nodes[len(src):])),
+                           shape=(len(touched), len(touched)))
+        n_joined, joined = connected_components(graph, directed=False)
+        relabel = np.arange(n_old_clusters + len(fresh))
+        if n_joined < len(touched):
+            lowest = np.full(n_joined, len(relabel))
+            np.minimum.at(lowest, joined, touched)
+            relabel[touched] = lowest[joined]
+            relabel = (np.cumsum(np.bincount(relabel, minlength=len(relabel)) > 0) - 1)[relabel]
+        pans = np.concatenate([self.cluster_pans, self.key_kinds[n_old_keys:] == 0])
+        n_clusters = int(relabel.max()) + 1 if len(relabel) else 0
+        self.cluster_pans = np.bincount(relabel, weights=pans, minlength=n_clusters).astype(np.int64)
+        self.cluster = relabel[cluster]
+        self.key_cluster = np.append(self.cluster, -1)
+        self.key_cluster_pans = np.append(self.cluster_pans[self.cluster], 0)
+        row_cluster = np.where(anchor >= 0, self.cluster[np.maximum(anchor, 0)], -1)
+        old = self.row_cluster
+        self.row_cluster = np.concatenate([np.where(old >= 0, relabel[np.maximum(old, 0)], -1), row_cluster])
+
+    def lookup(self, kind, value):
+        # Indexed returns holding this identifier
+        key = self.table.find(hash_ids([value], kind))[0]
+        if key < 0:
+            return self.records.iloc[0:0]
+        rows = self.posting_rows[self.posting_offsets[key]:self.posting_offsets[key + 1]]
+        return self.records.iloc[rows]
+
+    def features(self, frame):
+        # Per return: other PANs sharing its Aadhaar / bank account, the PANs
+        # in its linked cluster, and a flag when any identifier is shared.
+        # Works for indexed and new returns alike; a return never counts
+        # itself.
+        hashes = {kind: hash_ids(frame[column], kind) for kind, column in ID_KINDS.items()}
+        keys = {kind: self.table.find(h) for kind, h in hashes.items()}
+        known = hashes["pan"] != 0
+        columns = {}
+        for kind, name in (("aadhaar", "Aadhaar_Shared_PANs"), ("bank", "Bank_Shared_PANs")):
+            ids = keys[kind]
+            pans = self.pans_per_key[ids]
+            own = known & (ids >= 0) & (self.pair_table.find(_pair_hashes(hashes["pan"], hashes[kind])) >= 0)
+            columns[name] = pans - own
+        # PANs in the clusters the return's identifiers belong to, each
+        # cluster counted once, plus the return itself if its PAN is new
+        touched = np.stack([self.key_cluster[ids] for ids in keys.values()])
+        sizes = np.stack([self.key_cluster_pans[ids] for ids in keys.values()])
+        sizes[1, touched[1] == touched[0]] = 0
+        sizes[2, (touched[2] == touched[0]) | (touched[2] == touched[1])] = 0
+        columns["Linked_Cluster_Size"] = np.maximum(sizes.sum(axis=0) + (known & (keys["pan"] < 0)), 1)
+        columns["Identity_Flag"] = (columns["Aadhaar_Shared_PANs"] > 0) | (columns["Bank_Shared_PANs"] > 0)
+        return pd.DataFrame(columns, index=frame.index)
+
+    def clusters(self, min_pans=2):
+        # Linked clusters with at least min_pans PANs, largest first:
+        # (number of PANs, indexed returns in the cluster)
+        big = np.flatnonzero(self.cluster_pans >= min_pans)
+        big = big[np.argsort(-self.cluster_pans[big], kind="stable")]
+        return [(int(self.cluster_pans[c]), self.records[self.row_cluster == c]) for c in big]
+
+    def save(self, path=INDEX_PATH):
+        # Atomic: write a temp file next to the target and rename it into place
+        handle, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        os.close(handle)
+        try:
+            joblib.dump({"format": INDEX_FORMAT, "hashes": self.hashes, "records": self.records}, tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def load_identity_index(path=INDEX_PATH):
+    state = joblib.load(path)
+    if state.get("format") != INDEX_FORMAT:
+        raise ValueError(f"Unsupported identity index format: {state.get('format')}")
+    return IdentityIndex(state["hashes"], state["records"])
+
+
+_index_registry = ModelRegistry(loader=load_identity_index)
+
+
+def get_identity_index(path=INDEX_PATH):
+    # The index at `path`, shared process-wide and reloaded when the file
+    # changes; None when no index has been built
+    if not os.path.exists(path):
+        return None
+    return _index_registry.get(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, extend and query the identity-linkage index")
+    parser.add_argument("--index", default=INDEX_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="index a returns file from scratch")
+    build.add_argument("input")
+    update = sub.add_parser("update", help="add the returns of another file to the index")
+    update.add_argument("input")
+    lookup = sub.add_parser("lookup", help="list the returns holding an identifier")
+    lookup.add_argument("kind", choices=sorted(ID_KINDS))
+    lookup.add_argument("value")
+    clusters = sub.add_parser("clusters", help="list linked clusters")
+    clusters.add_argument("--min-pans", type=int, default=2)
+    clusters.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command in ("build", "update"):
+        from batch_score import read_returns
+        index = IdentityIndex() if args.command == "build" else load_identity_index(args.index)
+        before = len(index)
+        index.update(read_returns(args.input))
+        index.save(args.index)
+        linked = int((index.cluster_pans >= 2).sum())
+        print(f"Indexed {len(index) - before:,} returns ({len(index):,} total, {len(index.keys):,} identifiers, "
+              f"{linked:,} linked clusters) -> {args.index}")
+    elif args.command == "lookup":
+        print(load_identity_index(args.index).lookup(args.kind, args.value).to_string(index=False))
+    else:
+        found = load_identity_index(args.index).clusters(args.min_pans)
+        print(f"{len(found):,} clusters with {args.min_pans}+ PANs")
+        for pans, members in found[:args.limit]:
+            print(f"\n{pans} PANs, {len(members)} returns")
+            print(members.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+OCCUPATIONS = ["Salaried", "Self-employed", "Business"]
+
+
+def random_return(rng):
+    return {
+        "Age": rng.randint(20, 80),
+        "Occupation": rng.choice(OCCUPATIONS),
+        "Marital_Status": rng.choice(["Single", "Married"]),
+        "Children (Yes/No)": rng.choice(["No", "Yes"]),
+        "Reported_Income": float(rng.randint(200000, 3000000)),
+        "Interest_Income": float(rng.randint(0, 100000)),
+        "Capital_Gains": float(rng.randint(0, 100000)),
+    }
+
+
+async def _client(host, port, n_requests, latencies, seed):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(n_requests):
+            body = json.dumps(random_return(rng)).encode()
+            start = time.perf_counter()
+            writer.write(
+                f"POST /score HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            if b" 200 " not in status_line:
+                raise RuntimeError(f"Unexpected response: {status_line!r}")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, concurrency, n_requests):
+    latencies = []
+    per_client = max(1, n_requests // concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, per_client, latencies, seed)
+                           for seed in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    ms = np.asarray(latencies) * 1e3
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(float(np.percentile(ms, 50)), 3),
+            "p95": round(float(np.percentile(ms, 95)), 3),
+            "p99": round(float(np.percentile(ms, 99)), 3),
+            "max": round(float(ms.max()), 3),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the scoring service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    report = [asyncio.run(run_load(args.host, args.port, c, args.requests)) for c in args.concurrency]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import argparse
+import collections
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds: 1 µs to ~134 s, four buckets per
+# doubling (quantiles are reported to within ~19%)
+BUCKET_BOUNDS = [1e-6 * 2 ** (k / 4) for k in range(109)]
+MAX_EVENTS = 256
+METRICS_PORT_ENV = "FRAUD_METRICS_PORT"
+LOG_INTERVAL_ENV = "FRAUD_METRICS_LOG_INTERVAL"
+PROFILE_ENV = "FRAUD_PROFILE"
+
+logger = logging.getLogger("fraud.metrics")
+
+
+class Histogram:
+    # Fixed log-spaced latency buckets plus count/sum/min/max. Recording is a
+    # bisect and a few additions, so it can stay on in production.
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th value, capped by max
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKET_BOUNDS + [self.max], self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "sum_ms": self.total * 1e3,
+            "mean_ms": self.total / self.count * 1e3,
+            "min_ms": self.min * 1e3,
+            "p50_ms": self.quantile(0.5) * 1e3,
+            "p95_ms": self.quantile(0.95) * 1e3,
+            "p99_ms": self.quantile(0.99) * 1e3,
+            "max_ms": self.max * 1e3,
+            "buckets": {f"{bound * 1e3:g}": n for bound, n in zip(BUCKET_BOUNDS, self.counts) if n},
+        }
+
+
+class SamplingProfiler:
+    # Samples the Python stacks of all other threads every `interval` seconds
+    # and counts them in collapsed-stack form ("a;b;c" -> samples), which
+    # flamegraph.pl and speedscope read directly. Costs nothing while stopped.
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stop.set()
+            if self._thread is not None:
+                self._thread.join()
+                self._thread = None
+
+    def reset(self):
+        self.stacks.clear()
+        self.samples = 0
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_depth:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {n}" for stack, n in self.stacks.most_common())
+
+
+class Metrics:
+    # Process-wide latency histograms per stage, counters and a bounded log
+    # of events such as model loads
+
+    def __init__(self):
+        self.enabled = True
+        self.histograms = collections.defaultdict(Histogram)
+        self.counters = collections.Counter()
+        self.events = collections.deque(maxlen=MAX_EVENTS)
+        self.profiler = SamplingProfiler()
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        if self.enabled:
+            with self._lock:
+                self.histograms[stage].record(seconds)
+
+    def increment(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += n
+
+    def event(self, kind, **fields):
+        if self.enabled:
+            self.events.append({"time": time.time(), "event": kind, **fields})
+
+    def timer(self, stage):
+        return _Timer(self, stage)
+
+    def timed(self, stage):
+        # Decorator form of timer()
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(stage, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        with self._lock:
+            stages = {stage: h.snapshot() for stage, h in sorted(self.histograms.items())}
+            counters = dict(self.counters)
+        return {
+            "time": time.time(),
+            "uptime_s": time.time() - self.started,
+            "pid": os.getpid(),
+            "stages": stages,
+            "counters": counters,
+            "events": list(self.events),
+            "profiler": {"running": self.profiler.running, "samples": self.profiler.samples},
+        }
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.events.clear()
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+metrics = Metrics()
+timer = metrics.timer
+timed = metrics.timed
+
+
+def handle_request(method, path):
+    # Shared routes for the metrics endpoint: (status, content type, body)
+    if method == "GET" and path == "/metrics":
+        return 200, "application/json", json.dumps(metrics.snapshot())
+    if method == "GET" and path == "/profile":
+        return 200, "text/plain", metrics.profiler.collapsed()
+    if method == "POST" and path == "/profile/start":
+        metrics.profiler.start()
+        return 200, "application/json", json.dumps({"running": True})
+    if method == "POST" and path == "/profile/stop":
+        metrics.profiler.stop()
+        return 200, "application/json", json.dumps({"running": False, "samples": metrics.profiler.samples})
+    if method == "POST" and path == "/profile/reset":
+        metrics.profiler.reset()
+        return 200, "application/json", json.dumps({"samples": 0})
+    if method == "POST" and path == "/metrics/reset":
+        metrics.reset()
+        return 200, "application/json", json.dumps({"reset": True})
+    return 404, "application/json", json.dumps({"error": f"No route for {method} {path}"})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _respond(self, method):
+        status, content_type, body = handle_request(method, self.path.split("?", 1)[0])
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond("GET")
+
+    def do_POST(self):
+        self._respond("POST")
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_dumper = None
+# Streamlit runs sessions on concurrent threads, and each may call
+# configure_from_env(); only one of them may bind the port or start the dump
+_start_lock = threading.Lock()
+
+
+def start_server(port, host="127.0.0.1"):
+    # Serve /metrics and the profiler routes from a daemon thread; calling it
+    # again (e.g. on a Streamlit rerun) keeps the running server
+    global _server
+    with _start_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
+
+
+def start_log_dump(interval=60.0):
+    # Log a JSON snapshot every `interval` seconds. Nothing else configures
+    # logging, so the logger gets its own stderr handler and INFO level.
+    global _dumper
+    with _start_lock:
+        if _dumper is None:
+            if not logger.handlers:
+                handler = logging.StreamHandler()
+                handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+                logger.addHandler(handler)
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+
+            def run():
+                while True:
+                    time.sleep(interval)
+                    logger.info(json.dumps(metrics.snapshot()))
+            _dumper = threading.Thread(target=run, name="metrics-dump", daemon=True)
+            _dumper.start()
+    return _dumper
+
+
+def configure_from_env():
+    # FRAUD_METRICS_PORT starts the endpoint, FRAUD_METRICS_LOG_INTERVAL the
+    # periodic log dump and FRAUD_PROFILE=1 the profiler
+    port = os.environ.get(METRICS_PORT_ENV)
+    if port:
+        start_server(int(port))
+    interval = os.environ.get(LOG_INTERVAL_ENV)
+    if interval:
+        start_log_dump(float(interval))
+    if os.environ.get(PROFILE_ENV) == "1":
+        metrics.profiler.start()
+
+
+def main():
+    # Client for a running metrics endpoint
+    parser = argparse.ArgumentParser(description="Read metrics or toggle the profiler of a running process")
+    parser.add_argument("action", choices=["show", "profile-start", "profile-stop", "profile-dump", "reset"])
+    parser.add_argument("--url", default="http://127.0.0.1:9100")
+    args = parser.parse_args()
+
+    from urllib.request import Request, urlopen
+    method, path = {
+        "show": ("GET", "/metrics"),
+        "profile-start": ("POST", "/profile/start"),
+        "profile-stop": ("POST", "/profile/stop"),
+        "profile-dump": ("GET", "/profile"),
+        "reset": ("POST", "/metrics/reset"),
+    }[args.action]
+    with urlopen(Request(args.url + path, method=method, data=b"" if method == "POST" else None)) as response:
+        body = response.read().decode()
+    if args.action == "show":
+        snapshot = json.loads(body)
+        for stage, h in snapshot["stages"].items():
+            if h["count"]:
+                print(f"{stage:<24} n={h['count']:<8} p50={h['p50_ms']:.3f} ms  "
+                      f"p99={h['p99_ms']:.3f} ms  max={h['max_ms']:.3f} ms")
+        for event in snapshot["events"]:
+            print(json.dumps(event))
+    else:
+        print(body)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import threading
+import time
+
+import joblib
+
+from metrics import metrics
+
+MODEL_PATH = "best_model.joblib"
+SHARED_MODEL_PATH = "best_model.shared.joblib"
+PREPROCESSOR_PATH = "preprocessor.joblib"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+_digests = {}
+
+
+def current_digest(path):
+    # sha256 of a file, recomputed only when its mtime/size changes
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _digests.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, file_digest(path))
+        _digests[path] = cached
+    return cached[1]
+
+
+class _Entry:
+    __slots__ = ("obj", "stamp", "digest")
+
+    def __init__(self, obj, stamp, digest):
+        self.obj = obj
+        self.stamp = stamp
+        self.digest = digest
+
+
+class ModelRegistry:
+    # Process-wide cache of unpickled artifacts. Imported modules survive
+    # Streamlit reruns, so every session in the process shares one copy.
+    # An artifact is only re-read when its mtime/size changes, and only
+    # unpickled again when its content hash actually differs.
+
+    def __init__(self, loader=joblib.load):
+        self._loader = loader
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        entry = self._entries.get(path)
+        if entry is not None and entry.stamp == stamp:
+            return entry.obj
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.stamp == stamp:
+                return entry.obj
+            digest = file_digest(path)
+            if entry is not None and entry.digest == digest:
+                # Touched but unchanged: keep the loaded object
+                entry.stamp = stamp
+                return entry.obj
+            start = time.perf_counter()
+            obj = self._loader(path)
+            seconds = time.perf_counter() - start
+            self._entries[path] = _Entry(obj, stamp, digest)
+            self.loads += 1
+            metrics.observe("artifact_load", seconds)
+            metrics.event("artifact_load", path=os.path.basename(path), digest=digest[:12],
+                          seconds=round(seconds, 6), reload=entry is not None)
+            return obj
+
+    def digest(self, path):
+        self.get(path)
+        return self._entries[os.path.abspath(path)].digest
+
+    def digest_of(self, obj):
+        # Digest of the file a loaded object came from, or None
+        for entry in list(self._entries.values()):
+            if entry.obj is obj:
+                return entry.digest
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _load_preprocessor(path):
+    # preprocessing brings in pandas, so it is imported on the first load;
+    # in the app that is the prewarm thread, not the import of app.py
+    from preprocessing import load_preprocessor
+    return load_preprocessor(path)
+
+
+registry = ModelRegistry()
+_preprocessor_registry = ModelRegistry(loader=_load_preprocessor)
+_shared_registry = None
+_shared_lock = threading.Lock()
+_prewarm_thread = None
+
+
+def get_model(path=MODEL_PATH):
+    return registry.get(path)
+
+
+def get_preprocessor(path=PREPROCESSOR_PATH):
+    return _preprocessor_registry.get(path)
+
+
+def get_serving_model(path=MODEL_PATH, shared_path=SHARED_MODEL_PATH):
+    # Prefer the memory-mapped export of the forest (shared between worker
+    # processes through the page cache) as long as it was built from the
+    # current best_model.joblib; otherwise fall back to the pickled model.
+    global _shared_registry
+    if os.path.exists(shared_path):
+        if _shared_registry is None:
+            with _shared_lock:
+                if _shared_registry is None:
+                    from shared_model import load_shared_model
+                    _shared_registry = ModelRegistry(loader=load_shared_model)
+        shared = _shared_registry.get(shared_path)
+        if shared.source_digest == current_digest(path):
+            return shared
+    return registry.get(path)
+
+
+def model_digest(model):
+    # Content digest of the artifact a served model was loaded from: the
+    # shared export for a SharedForest, the pickle otherwise. None for models
+    # that did not come through the registries.
+    for source in (_shared_registry, registry):
+        digest = source.digest_of(model) if source is not None else None
+        if digest is not None:
+            return digest
+    return None
+
+
+def _warm_up():
+    start = time.perf_counter()
+    model = get_serving_model()
+    model.predict(get_preprocessor().encode({
+        "Age": 30, "Occupation": "Salaried", "Marital_Status": "Single",
+        "Children (Yes/No)": "No", "Reported_Income": 500000.0,
+    }))
+    metrics.event("prewarm", seconds=round(time.perf_counter() - start, 6))
+
+
+def prewarm():
+    # Load the preprocessor and serving model and run one prediction in a
+    # background thread, once per process. Callers that need the model
+    # meanwhile wait on the registry lock instead of loading it twice.
+    global _prewarm_thread
+    with _shared_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=_warm_up, name="prewarm", daemon=True)
+            _prewarm_thread.start()
+    return _prewarm_thread
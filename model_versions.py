@@ -0,0 +1,216 @@
+import argparse
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from model_registry import MODEL_PATH, SHARED_MODEL_PATH, file_digest
+from scoring import load_preprocessor
+from shared_model import export_shared_model
+from train_models import TARGET_COLUMN, load_training_frame
+
+VERSIONS_DIR = "model_versions"
+
+
+def _paths(digest, versions_dir=VERSIONS_DIR):
+    base = os.path.join(versions_dir, digest)
+    return {"model": base + ".joblib", "shared": base + ".shared.joblib", "manifest": base + ".json"}
+
+
+def _write_once(path, write):
+    # Write through a temp file in the same directory and rename into place;
+    # the result is made read-only, since versions never change after this
+    handle, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    os.close(handle)
+    try:
+        write(tmp)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def store_version(model, manifest, versions_dir=VERSIONS_DIR, model_file=None):
+    # Save a fitted forest as an immutable version named by the sha256 of its
+    # pickle, with its memory-mapped export and a JSON manifest alongside.
+    # Storing the same model twice yields the same version. model_file: an
+    # existing pickle of `model` to store byte for byte instead of re-dumping.
+    os.makedirs(versions_dir, exist_ok=True)
+    handle, tmp = tempfile.mkstemp(dir=versions_dir, suffix=".tmp")
+    os.close(handle)
+    try:
+        if model_file is None:
+            joblib.dump(model, tmp)
+        else:
+            shutil.copyfile(model_file, tmp)
+        digest = file_digest(tmp)
+        paths = _paths(digest, versions_dir)
+        if not os.path.exists(paths["model"]):
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, paths["model"])
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    if not os.path.exists(paths["shared"]):
+        _write_once(paths["shared"], lambda p: export_shared_model(model, p, source_digest=digest))
+    if not os.path.exists(paths["manifest"]):
+        manifest = {"digest": digest, "created": time.time(), "n_estimators": len(model.estimators_), **manifest}
+        _write_once(paths["manifest"], lambda p: _dump_json(manifest, p))
+    return digest
+
+
+def _dump_json(obj, path):
+    with open(path, "w") as f:
+        json.dump(obj, f, indent=2)
+
+
+def load_manifest(digest, versions_dir=VERSIONS_DIR):
+    with open(_paths(digest, versions_dir)["manifest"]) as f:
+        return json.load(f)
+
+
+def list_versions(versions_dir=VERSIONS_DIR):
+    if not os.path.isdir(versions_dir):
+        return []
+    manifests = [load_manifest(name[:-5], versions_dir)
+                 for name in os.listdir(versions_dir) if name.endswith(".json")]
+    return sorted(manifests, key=lambda m: m["created"])
+
+
+def resolve(prefix, versions_dir=VERSIONS_DIR):
+    matches = [m["digest"] for m in list_versions(versions_dir) if m["digest"].startswith(prefix)]
+    if len(matches) != 1:
+        raise ValueError(f"{'No' if not matches else 'Ambiguous'} version matching {prefix!r}")
+    return matches[0]
+
+
+def _copy_into_place(source, target):
+    # Copy next to the target, then rename over it: readers see either the
+    # old file or the new one, never a mix. A copy rather than a hard link,
+    # so later in-place writes to the target cannot alter the stored version.
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+
+
+def activate(digest, versions_dir=VERSIONS_DIR, model_path=MODEL_PATH, shared_path=SHARED_MODEL_PATH):
+    # Publish a version as the serving model. The shared export goes first:
+    # until the pickle follows, its source digest does not match, so
+    # get_serving_model() keeps serving the old pickle rather than a mix.
+    # The registry picks up the new files on the next request.
+    paths = _paths(digest, versions_dir)
+    _copy_into_place(paths["shared"], shared_path)
+    _copy_into_place(paths["model"], model_path)
+    return digest
+
+
+def active_digest(model_path=MODEL_PATH):
+    return file_digest(model_path)
+
+
+def rows_seen(model, digest, versions_dir=VERSIONS_DIR):
+    # Training rows behind a model: from its manifest, or else from the root
+    # of its first tree (bootstrap weights sum to the training set size)
+    try:
+        return load_manifest(digest, versions_dir)["rows_seen"]
+    except (OSError, KeyError):
+        return int(model.estimators_[0].tree_.weighted_n_node_samples[0])
+
+
+def grow_forest(model, X_new, y_new, n_trees, max_trees=None, seed=0):
+    # Add n_trees trees fitted on the new rows only (warm start), leaving the
+    # existing trees untouched, so the cost scales with the new data. With
+    # max_trees set, the oldest trees are dropped to keep the model's size
+    # bounded.
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + n_trees, random_state=seed)
+    model.fit(X_new, y_new)
+    if max_trees is not None and len(model.estimators_) > max_trees:
+        model.estimators_ = model.estimators_[-max_trees:]
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+    return model
+
+
+def incremental_update(data_path, n_trees=None, max_trees=None, model_path=MODEL_PATH,
+                       versions_dir=VERSIONS_DIR):
+    parent = active_digest(model_path)
+    model = joblib.load(model_path)
+    if not isinstance(model, RandomForestRegressor):
+        raise ValueError("Incremental updates need a random forest; retrain with model.py first")
+    seen = rows_seen(model, parent, versions_dir)
+    if not os.path.exists(_paths(parent, versions_dir)["manifest"]):
+        # First update: record the current model as the root version
+        store_version(model, {"parent": None, "rows_seen": seen, "source": model_path}, versions_dir,
+                      model_file=model_path)
+
+    dataset = load_training_frame(data_path)
+    X_new = load_preprocessor().encode(dataset)
+    y_new = dataset[TARGET_COLUMN].astype(np.float64).to_numpy()
+    if n_trees is None:
+        # Give the new rows the same weight per row as the old ones:
+        # n_trees / (trees + n_trees) == new rows / all rows
+        n_trees = max(1, math.ceil(len(model.estimators_) * len(y_new) / seen))
+
+    start = time.perf_counter()
+    grow_forest(model, X_new, y_new, n_trees, max_trees, seed=int(parent[:8], 16))
+    train_seconds = time.perf_counter() - start
+    digest = store_version(model, {
+        "parent": parent,
+        "rows_seen": seen + len(y_new),
+        "rows_added": len(y_new),
+        "trees_added": n_trees,
+        "train_seconds": round(train_seconds, 3),
+        "source": os.path.abspath(data_path),
+        "source_digest": file_digest(data_path),
+    }, versions_dir)
+    return digest, train_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental retraining and versioned model artifacts")
+    parser.add_argument("--versions-dir", default=VERSIONS_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    update = sub.add_parser("update", help="grow the serving forest with newly labeled returns")
+    update.add_argument("data", help="returns file with an Actual_Income column")
+    update.add_argument("--trees", type=int, help="trees to add (default: proportional to the new rows)")
+    update.add_argument("--max-trees", type=int, help="drop the oldest trees beyond this many")
+    update.add_argument("--activate", action="store_true", help="serve the new version right away")
+    sub.add_parser("list", help="list stored versions")
+    switch = sub.add_parser("activate", help="serve a stored version (also used to roll back)")
+    switch.add_argument("version", help="digest or unique prefix")
+    args = parser.parse_args()
+
+    if args.command == "update":
+        digest, seconds = incremental_update(args.data, args.trees, args.max_trees, versions_dir=args.versions_dir)
+        manifest = load_manifest(digest, args.versions_dir)
+        print(f"Version {digest[:16]}: +{manifest['trees_added']} trees on {manifest['rows_added']:,} rows "
+              f"in {seconds:.2f}s ({manifest['n_estimators']} trees, {manifest['rows_seen']:,} rows seen)")
+        if args.activate:
+            activate(digest, args.versions_dir)
+            print(f"Activated {digest[:16]}")
+    elif args.command == "list":
+        current = active_digest() if os.path.exists(MODEL_PATH) else None
+        for m in list_versions(args.versions_dir):
+            flag = "*" if m["digest"] == current else " "
+            parent = m["parent"][:16] if m["parent"] else "-"
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(m["created"]))
+            print(f"{flag} {m['digest'][:16]}  parent {parent:<16}  {created}  "
+                  f"{m['n_estimators']:>4} trees  {m['rows_seen']:>9,} rows")
+    else:
+        try:
+            digest = resolve(args.version, args.versions_dir)
+        except ValueError as exc:
+            parser.error(str(exc))
+        activate(digest, args.versions_dir)
+        print(f"Activated {digest[:16]}")
+
+
+if __name__ == "__main__":
+    main()
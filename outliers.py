@@ -0,0 +1,177 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from batch_score import read_returns
+
+# Numerical features checked by detect_outliers() in code.ipynb
+NUMERICAL_FEATURES = [
+    "Age", "Reported_Income", "Interest_Income", "Business_Income", "Capital_Gains",
+    "Other_Income", "Educational_Expenses", "Healthcare_Costs", "Lifestyle_Expenditure",
+    "Other_Expenses", "Bank_Debited", "Credit_Card_Debited", "Actual_Income",
+]
+
+
+class QuantileSketch:
+    # Log-bucketed quantile sketch (DDSketch-style) for several columns at once.
+    # Any returned quantile is within relative_accuracy of a true sample value
+    # at that rank; memory is a fixed count table per column, and two sketches
+    # with the same settings merge by adding their tables.
+
+    MIN_VALUE = 1e-9
+    MAX_VALUE = 1e15
+
+    def __init__(self, n_columns, relative_accuracy=0.01):
+        self.n_columns = n_columns
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self._offset = int(np.floor(np.log(self.MIN_VALUE) / self._log_gamma))
+        self.n_buckets = int(np.ceil(np.log(self.MAX_VALUE) / self._log_gamma)) - self._offset + 1
+        self.positive = np.zeros((n_columns, self.n_buckets), dtype=np.int64)
+        self.negative = np.zeros((n_columns, self.n_buckets), dtype=np.int64)
+        self.zero = np.zeros(n_columns, dtype=np.int64)
+
+    def _bucket(self, magnitude):
+        index = np.ceil(np.log(magnitude) / self._log_gamma).astype(np.int64) - self._offset
+        return np.clip(index, 0, self.n_buckets - 1)
+
+    def _bincount(self, X, mask):
+        rows, cols = np.nonzero(mask)
+        flat = cols * self.n_buckets + self._bucket(np.abs(X[rows, cols]))
+        return np.bincount(flat, minlength=self.n_columns * self.n_buckets).reshape(self.n_columns, -1)
+
+    def update(self, X):
+        # X: (n_rows, n_columns) float array; NaNs are ignored
+        X = np.asarray(X, dtype=np.float64)
+        self.positive += self._bincount(X, X > self.MIN_VALUE)
+        self.negative += self._bincount(X, X < -self.MIN_VALUE)
+        self.zero += (np.abs(X) <= self.MIN_VALUE).sum(axis=0)
+
+    def merge(self, other):
+        if other.n_columns != self.n_columns or other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Can only merge sketches with the same columns and accuracy")
+        self.positive += other.positive
+        self.negative += other.negative
+        self.zero += other.zero
+        return self
+
+    def count(self):
+        return self.positive.sum(axis=1) + self.negative.sum(axis=1) + self.zero
+
+    def buckets(self):
+        # Bucket values in ascending order (most negative bucket first, then
+        # zero, then positives) and the matching (n_columns, n_values) counts
+        centers = 2 * self.gamma ** (np.arange(self.n_buckets) + self._offset) / (self.gamma + 1)
+        values = np.concatenate([-centers[::-1], [0.0], centers])
+        counts = np.concatenate([self.negative[:, ::-1], self.zero[:, None], self.positive], axis=1)
+        return values, counts
+
+    def quantiles(self, q):
+        # Array of shape (len(q), n_columns); NaN for columns with no values
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        values, counts = self.buckets()
+        out = np.full((len(q), self.n_columns), np.nan)
+        for c in range(self.n_columns):
+            total = counts[c].sum()
+            if total == 0:
+                continue
+            cumulative = np.cumsum(counts[c])
+            ranks = np.floor(q * (total - 1))
+            out[:, c] = values[np.searchsorted(cumulative, ranks, side="right")]
+        return out
+
+    def cdf(self, x):
+        # Fraction of values <= x for x of shape (k, n_columns), on the bucket
+        # grid; NaN for columns with no values
+        x = np.asarray(x, dtype=np.float64)
+        values, counts = self.buckets()
+        cumulative = np.cumsum(counts, axis=1)
+        total = cumulative[:, -1].astype(np.float64)
+        index = np.searchsorted(values, x, side="right") - 1
+        below = cumulative[np.arange(self.n_columns), np.maximum(index, 0)]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(index >= 0, below, 0) / np.where(total > 0, total, np.nan)
+
+
+class OutlierFilter:
+    # IQR outlier filter that needs one streaming pass to learn the bounds and
+    # then filters any number of chunks with vectorized masks. A row is dropped
+    # when any feature falls outside [Q1 - k * IQR, Q3 + k * IQR], as in
+    # code.ipynb; missing values never mark a row as an outlier.
+
+    def __init__(self, features=NUMERICAL_FEATURES, k=1.5, relative_accuracy=0.01):
+        self.features = list(features)
+        self.k = k
+        self.sketch = QuantileSketch(len(self.features), relative_accuracy)
+        self._bounds = None
+
+    def _values(self, chunk):
+        return chunk[self.features].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+
+    def update(self, chunk):
+        self.sketch.update(self._values(chunk))
+        self._bounds = None
+        return self
+
+    def fit(self, chunks):
+        for chunk in chunks:
+            self.update(chunk)
+        return self
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        self._bounds = None
+        return self
+
+    def bounds(self):
+        if self._bounds is None:
+            q1, q3 = self.sketch.quantiles([0.25, 0.75])
+            step = self.k * (q3 - q1)
+            self._bounds = (q1 - step, q3 + step)
+        return self._bounds
+
+    def mask(self, chunk):
+        # True for rows to keep
+        lower, upper = self.bounds()
+        values = self._values(chunk)
+        return ~((values < lower) | (values > upper)).any(axis=1)
+
+    def transform(self, chunks):
+        for chunk in chunks:
+            yield chunk[self.mask(chunk)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop IQR outliers from a returns file in bounded memory")
+    parser.add_argument("input")
+    parser.add_argument("-o", "--output", default="cleaned_returns.csv")
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--k", type=float, default=1.5, help="IQR multiplier")
+    parser.add_argument("--accuracy", type=float, default=0.01, help="relative accuracy of the quantiles")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    outlier_filter = OutlierFilter(k=args.k, relative_accuracy=args.accuracy)
+    outlier_filter.fit(read_returns(args.input, args.chunk_size))
+
+    kept = total = 0
+    header = True
+    for chunk in read_returns(args.input, args.chunk_size):
+        cleaned = chunk[outlier_filter.mask(chunk)]
+        cleaned.to_csv(args.output, mode="w" if header else "a", header=header, index=False)
+        header = False
+        kept += len(cleaned)
+        total += len(chunk)
+    elapsed = time.perf_counter() - start
+
+    lower, upper = outlier_filter.bounds()
+    for feature, lo, hi in zip(outlier_filter.features, lower, upper):
+        print(f"{feature:<22} [{lo:,.0f}, {hi:,.0f}]")
+    print(f"Kept {kept:,} of {total:,} rows in {elapsed:.2f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import argparse
+import io
+import json
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from batch_score import ID_COLUMNS, MERGE_MARKERS, clean_chunk
+from dataset_store import DatasetStore, is_dataset_store
+from model_registry import MODEL_PATH, file_digest
+from tax_engine import DEFAULT_REGIME, TAX_REGIMES
+
+SHARDS_PER_WORKER = 4
+SCORE_COLUMNS = ["Predicted_Income", "Total_Reported_Income", "Fraud_Risk", "Tax"]
+IDENTITY_COLUMNS = ["Aadhaar_Shared_PANs", "Bank_Shared_PANs", "Linked_Cluster_Size", "Identity_Flag"]
+
+
+def csv_shards(path, n_shards):
+    # Split a CSV into n_shards byte ranges that start at line boundaries.
+    # Returns (column names, [(start, end), ...]); the parent only reads the
+    # header and a few bytes at each cut, never the rows themselves. Assumes
+    # no quoted field spans lines, which holds for returns files.
+    with open(path, "rb") as f:
+        header = f.readline()
+        while header.decode("utf-8").startswith(MERGE_MARKERS):
+            header = f.readline()
+        names = list(pd.read_csv(io.StringIO(header.decode("utf-8")), nrows=0).columns)
+        data_start = f.tell()
+        size = os.path.getsize(path)
+        cuts = [data_start]
+        for i in range(1, n_shards):
+            f.seek(max(data_start + (size - data_start) * i // n_shards - 1, cuts[-1]))
+            f.readline()
+            cuts.append(max(f.tell(), cuts[-1]))
+        cuts.append(size)
+    return names, [(start, end) for start, end in zip(cuts, cuts[1:]) if end > start]
+
+
+def read_csv_range(path, start, end, names):
+    # Rows of one byte range, cleaned like read_returns()
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+    if any(marker in text for marker in MERGE_MARKERS):
+        text = "".join(line for line in text.splitlines(keepends=True) if not line.startswith(MERGE_MARKERS))
+    chunk = pd.read_csv(io.StringIO(text), header=None, names=names, dtype={c: str for c in ID_COLUMNS})
+    return clean_chunk(chunk)
+
+
+_worker = {}
+
+
+def _init_worker(model_path):
+    # Per process, once: load the artifacts ahead of the first shard. The
+    # forest comes from the memory-mapped export, so every worker maps the
+    # same page-cache copy instead of unpickling its own. Tasks fetch them
+    # from the registries again, which reload them when the files change,
+    # so a long-lived pool follows model and rule swaps.
+    from fraud_rules import get_rule_engine
+    from model_registry import get_preprocessor, get_serving_model
+
+    _worker["model_path"] = model_path
+    get_serving_model(model_path)
+    get_preprocessor()
+    get_rule_engine()
+
+
+def make_pool(workers, model_path=MODEL_PATH):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                               initializer=_init_worker, initargs=(model_path,))
+
+
+def score_shard(task):
+    # Score one shard into its own file; returns the per-shard counts
+    from fraud_rules import get_rule_engine
+    from identity_index import get_identity_index
+    from model_registry import get_preprocessor, get_serving_model
+    from scoring import score_returns
+
+    index, source, out_path, tax_regime, identity_index_path = task
+    start = time.perf_counter()
+    if source[0] == "csv":
+        _, path, begin, end, names = source
+        chunk = read_csv_range(path, begin, end, names)
+    else:
+        _, path, row_group = source
+        chunk = DatasetStore(path).read_row_group(row_group)
+    if not len(chunk):
+        open(out_path, "w").close()
+        return {"shard": index, "rows": 0, "seconds": time.perf_counter() - start, "pid": os.getpid(), "hits": {}}
+    identity_index = None
+    if identity_index_path:
+        identity_index = get_identity_index(identity_index_path)
+        if identity_index is None:
+            raise FileNotFoundError(identity_index_path)
+    rules = get_rule_engine()
+    hits_before = dict(rules.stats()["hits"])
+    scores = score_returns(chunk, get_serving_model(_worker["model_path"]), get_preprocessor(),
+                           batch_size=len(chunk), tax_regime=tax_regime, identity_index=identity_index)
+    ids = chunk[[c for c in ID_COLUMNS if c in chunk.columns]]
+    pd.concat([ids, scores], axis=1).to_csv(out_path, header=False, index=False)
+    hits = {rule: n - hits_before.get(rule, 0) for rule, n in rules.stats()["hits"].items()}
+    return {"shard": index, "rows": len(chunk), "seconds": time.perf_counter() - start,
+            "pid": os.getpid(), "hits": hits}
+
+
+def make_tasks(input_path, n_shards, shard_dir, tax_regime=DEFAULT_REGIME, identity_index_path=None):
+    # One task per CSV byte range, or per row group of a dataset store
+    if is_dataset_store(input_path):
+        groups = range(len(DatasetStore(input_path).manifest["row_groups"]))
+        sources = [("store", input_path, i) for i in groups]
+    else:
+        names, ranges = csv_shards(input_path, n_shards)
+        sources = [("csv", input_path, start, end, names) for start, end in ranges]
+    return [(i, source, os.path.join(shard_dir, f"shard-{i:05d}.csv"), tax_regime, identity_index_path)
+            for i, source in enumerate(sources)]
+
+
+def output_columns(input_path, identity_index_path=None):
+    # Header of the scored file: the ID columns the input has, as
+    # score_shard() writes them, then the scores
+    names = DatasetStore(input_path).columns if is_dataset_store(input_path) else csv_shards(input_path, 1)[0]
+    ids = [c for c in ID_COLUMNS if c in names]
+    return ids + SCORE_COLUMNS + (IDENTITY_COLUMNS if identity_index_path else [])
+
+
+def merge_shards(tasks, output_path, columns):
+    # Header, then every shard file in shard order
+    with open(output_path, "w", newline="") as out:
+        out.write(pd.DataFrame(columns=columns).to_csv(index=False))
+        for task in tasks:
+            with open(task[2]) as shard:
+                shutil.copyfileobj(shard, out)
+
+
+def total_hits(shards):
+    hits = {}
+    for shard in shards:
+        for rule, n in shard["hits"].items():
+            hits[rule] = hits.get(rule, 0) + n
+    return hits
+
+
+def score_parallel(input_path, output_path, workers, n_shards=None, model_path=MODEL_PATH,
+                   tax_regime=DEFAULT_REGIME, identity_index_path=None):
+    # Shard the input (CSV byte ranges, or a store's row groups) across a
+    # process pool and merge the shard outputs in shard order. The result is
+    # byte-identical to batch_score.py whatever the worker count or the
+    # order shards finish in.
+    n_shards = n_shards or workers * SHARDS_PER_WORKER
+    shard_dir = tempfile.mkdtemp(prefix="shards-", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        tasks = make_tasks(input_path, n_shards, shard_dir, tax_regime, identity_index_path)
+        start = time.perf_counter()
+        with make_pool(workers, model_path) as pool:
+            shards = list(pool.map(score_shard, tasks))
+        scored = time.perf_counter()
+        merge_shards(tasks, output_path, output_columns(input_path, identity_index_path))
+        end = time.perf_counter()
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    return {
+        "workers": workers,
+        "shards": len(tasks),
+        "rows": sum(s["rows"] for s in shards),
+        "seconds": end - start,
+        # Time inside score_shard summed over shards; the rest of
+        # seconds * workers is process start-up, idle time and the merge
+        "worker_seconds": sum(s["seconds"] for s in shards),
+        "merge_seconds": end - scored,
+        "worker_pids": len({s["pid"] for s in shards}),
+        "hits": total_hits(shards),
+    }
+
+
+def scaling_report(input_path, worker_counts, output_path, **kwargs):
+    # Score the same input with each worker count; speedup and efficiency are
+    # relative to one worker, and every run must produce the same bytes
+    runs = []
+    for workers in worker_counts:
+        run = score_parallel(input_path, output_path, workers, **kwargs)
+        run["rows_per_second"] = run["rows"] / run["seconds"]
+        run["output_sha256"] = file_digest(output_path)
+        runs.append(run)
+    base = runs[0]
+    for run in runs:
+        run["speedup"] = base["seconds"] / run["seconds"]
+        run["efficiency"] = run["speedup"] / (run["workers"] / base["workers"])
+        run.pop("hits")
+    return {
+        "input": os.path.abspath(input_path),
+        "cpu_count": os.cpu_count(),
+        "deterministic": len({run["output_sha256"] for run in runs}) == 1,
+        "runs": runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a returns file on several cores")
+    parser.add_argument("input", help="returns CSV or dataset store directory")
+    parser.add_argument("-o", "--output", default="scored_returns.csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shards", type=int, help=f"CSV shards (default: {SHARDS_PER_WORKER} per worker)")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--tax-regime", default=DEFAULT_REGIME, choices=sorted(TAX_REGIMES))
+    parser.add_argument("--identity-index", help="identity_index.joblib to add linked-identity columns")
+    parser.add_argument("--scaling", type=int, nargs="+", metavar="WORKERS",
+                        help="run once per worker count and write a scaling report")
+    parser.add_argument("--report", default="scaling_report.json")
+    args = parser.parse_args()
+    options = {"n_shards": args.shards, "model_path": args.model, "tax_regime": args.tax_regime,
+               "identity_index_path": args.identity_index}
+
+    if args.scaling:
+        report = scaling_report(args.input, args.scaling, args.output, **options)
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"{'workers':>7} {'rows/s':>12} {'seconds':>8} {'speedup':>8} {'efficiency':>10}")
+        for run in report["runs"]:
+            print(f"{run['workers']:>7} {run['rows_per_second']:>12,.0f} {run['seconds']:>8.2f} "
+                  f"{run['speedup']:>8.2f} {run['efficiency']:>10.0%}")
+        print(f"{report['cpu_count']} CPUs; outputs identical: {report['deterministic']} -> {args.report}")
+        if max(args.scaling) > report["cpu_count"]:
+            print("Worker counts above the CPU count share cores, so they cannot scale")
+        return
+
+    run = score_parallel(args.input, args.output, args.workers, **options)
+    print(f"Scored {run['rows']:,} returns in {run['seconds']:.2f}s with {run['workers']} workers, "
+          f"{run['shards']} shards ({run['rows'] / run['seconds']:,.0f} rows/s) -> {args.output}")
+    for rule, hits in run["hits"].items():
+        print(f"  {rule:<28} {hits:>10,} hits ({hits / max(run['rows'], 1):.1%})")
+
+
+if __name__ == "__main__":
+    main()
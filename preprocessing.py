@@ -0,0 +1,162 @@
+import argparse
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+from model_registry import PREPROCESSOR_PATH
+
+ENCODER_PATHS = {
+    "Occupation": "label_encoder_occupation.joblib",
+    "Marital_Status": "label_encoder_marital_status.joblib",
+    "Children (Yes/No)": "label_encoder_children.joblib",
+}
+SPEC_VERSION = 1
+SMALL_BATCH = 32
+
+# Feature order expected by best_model.joblib
+FEATURE_COLUMNS = [
+    "Age",
+    "Occupation",
+    "Marital_Status",
+    "Children (Yes/No)",
+    "Interest_Income",
+    "Business_Income",
+    "Capital_Gains",
+    "Other_Income",
+    "Educational_Expenses",
+    "Healthcare_Costs",
+    "Lifestyle_Expenditure",
+    "Other_Expenses",
+    "Bank_Debited",
+    "Credit_Card_Debited",
+    "Reported_Income",
+]
+
+CATEGORICAL_COLUMNS = ["Occupation", "Marital_Status", "Children (Yes/No)"]
+
+# How a feature is filled in when the input does not carry it (the detection
+# form only asks for age, categories, reported income, interest and capital
+# gains): ("scale", source, factor) or ("constant", value)
+DERIVED_FEATURES = {
+    "Business_Income": ("scale", "Reported_Income", 0.1),        # Business income estimate
+    "Other_Income": ("scale", "Reported_Income", 0.05),          # Other income estimate
+    "Educational_Expenses": ("constant", 40000),
+    "Healthcare_Costs": ("constant", 30000),
+    "Lifestyle_Expenditure": ("constant", 50000),
+    "Other_Expenses": ("constant", 25000),
+    "Bank_Debited": ("scale", "Reported_Income", 0.6),
+    "Credit_Card_Debited": ("scale", "Reported_Income", 0.3),
+    "Interest_Income": ("constant", 0.0),
+    "Capital_Gains": ("constant", 0.0),
+}
+
+
+def _column(frame, name):
+    # Column as a NumPy array from a DataFrame, an Arrow Table/RecordBatch or
+    # a mapping of column -> scalar/sequence
+    if isinstance(frame, pd.DataFrame):
+        return frame[name].to_numpy() if name in frame.columns else None
+    if hasattr(frame, "schema"):
+        if name not in frame.schema.names:
+            return None
+        column = frame.column(name)
+        return column.to_numpy(zero_copy_only=False) if hasattr(column, "to_numpy") else np.asarray(column)
+    if name not in frame:
+        return None
+    return np.atleast_1d(np.asarray(frame[name]))
+
+
+def _num_rows(frame):
+    if isinstance(frame, pd.DataFrame) or hasattr(frame, "schema"):
+        return len(frame)
+    return max(len(np.atleast_1d(np.asarray(v))) for v in frame.values())
+
+
+class Preprocessor:
+    # Column schema, category maps and derived-feature formulas in one object,
+    # turning a whole batch of returns into the model's feature matrix
+
+    def __init__(self, spec):
+        if spec["version"] != SPEC_VERSION:
+            raise ValueError(f"Unsupported preprocessor version: {spec['version']}")
+        self.spec = spec
+        self.feature_columns = list(spec["feature_columns"])
+        self.categories = {column: list(values) for column, values in spec["categories"].items()}
+        self.derived = dict(spec["derived"])
+        self._indexes = {column: pd.Index(values) for column, values in self.categories.items()}
+        self._codes = {column: {v: i for i, v in enumerate(values)} for column, values in self.categories.items()}
+
+    def column_index(self, column):
+        return self.feature_columns.index(column)
+
+    def decode(self, column, codes):
+        # Category labels for encoded values of a categorical column
+        return np.asarray(self.categories[column], dtype=object)[np.asarray(codes, dtype=np.intp)]
+
+    @timed("encode")
+    def encode(self, frame):
+        n_rows = _num_rows(frame)
+        X = np.empty((n_rows, len(self.feature_columns)), dtype=np.float64)
+        for j, column in enumerate(self.feature_columns):
+            values = _column(frame, column)
+            if column in self._indexes:
+                if values is None:
+                    raise ValueError(f"Missing categorical column: {column}")
+                if n_rows <= SMALL_BATCH:
+                    # Plain dict lookups beat building a hash index for a few rows
+                    codes = np.array([self._codes[column].get(v, -1) for v in values.tolist()])
+                else:
+                    codes = self._indexes[column].get_indexer(values.astype(object))
+                if (codes < 0).any():
+                    unknown = sorted(set(values[codes < 0].astype(str).tolist()))
+                    raise ValueError(f"Unknown {column} values: {unknown}")
+                X[:, j] = codes
+            elif values is not None:
+                X[:, j] = pd.to_numeric(values, errors="coerce")
+                np.nan_to_num(X[:, j], copy=False, nan=0.0)
+            elif column in self.derived:
+                rule = self.derived[column]
+                if rule[0] == "constant":
+                    X[:, j] = rule[1]
+                else:
+                    source = _column(frame, rule[1])
+                    if source is None:
+                        raise ValueError(f"Missing column {rule[1]} needed to derive {column}")
+                    X[:, j] = np.nan_to_num(pd.to_numeric(source, errors="coerce")) * rule[2]
+            else:
+                raise ValueError(f"Missing column: {column}")
+        return X
+
+    def save(self, path=PREPROCESSOR_PATH):
+        joblib.dump(self.spec, path)
+        return path
+
+
+def build_spec(encoders):
+    # encoders: column -> fitted LabelEncoder; codes follow classes_ order
+    return {
+        "version": SPEC_VERSION,
+        "feature_columns": list(FEATURE_COLUMNS),
+        "categories": {column: [str(c) for c in encoders[column].classes_] for column in CATEGORICAL_COLUMNS},
+        "derived": dict(DERIVED_FEATURES),
+    }
+
+
+def load_preprocessor(path=PREPROCESSOR_PATH):
+    return Preprocessor(joblib.load(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build preprocessor.joblib from the label encoders")
+    parser.add_argument("-o", "--output", default=PREPROCESSOR_PATH)
+    args = parser.parse_args()
+
+    encoders = {column: joblib.load(path) for column, path in ENCODER_PATHS.items()}
+    Preprocessor(build_spec(encoders)).save(args.output)
+    print(f"Preprocessor saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
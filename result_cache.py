@@ -0,0 +1,295 @@
+import argparse
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+
+import numpy as np
+
+from fraud_rules import RULES_PATH, get_rule_engine
+from metrics import metrics
+from model_registry import current_digest, model_digest
+from preprocessing import PREPROCESSOR_PATH
+from scoring import score_matrix
+from tax_engine import DEFAULT_REGIME
+
+CACHE_ENV = "FRAUD_RESULT_CACHE"
+CACHE_PATH_ENV = "FRAUD_RESULT_CACHE_PATH"
+MAX_ENTRIES = 100000
+TTL = 24 * 3600.0
+# Keys per SQL statement, below SQLite's bound-parameter limit
+SQL_CHUNK = 500
+
+
+def row_keys(X, version):
+    # Content address of each encoded row: blake2b over the version and the
+    # row's float64 bytes, with -0.0 folded into 0.0 and every NaN made the
+    # same NaN so equal feature vectors always hash alike
+    X = np.ascontiguousarray(X, dtype=np.float64) + 0.0
+    X[np.isnan(X)] = np.nan
+    prefix = version.encode()
+    return [hashlib.blake2b(prefix + row.tobytes(), digest_size=16).digest() for row in X]
+
+
+class _DiskTier:
+    # SQLite file shared by every worker on the host; WAL mode lets readers
+    # and one writer work at the same time
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(results)")]
+        if columns and "rules" not in columns:
+            # Written before rule hits were cached; the rows are only a cache
+            self._db.execute("DROP TABLE results")
+        self._db.execute("CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, version TEXT, "
+                         "expires REAL, predicted REAL, level INTEGER, tax REAL, rules INTEGER)")
+        self._lock = threading.Lock()
+
+    def get(self, keys, now):
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), SQL_CHUNK):
+                chunk = keys[start:start + SQL_CHUNK]
+                rows = self._db.execute(
+                    f"SELECT key, expires, predicted, level, tax, rules FROM results "
+                    f"WHERE key IN ({','.join('?' * len(chunk))}) AND expires > ?", [*chunk, now])
+                for key, *entry in rows:
+                    found[key] = tuple(entry)
+        return found
+
+    def put(self, version, entries):
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 [(key, version, *entry) for key, entry in entries])
+
+    def prune(self, version, now):
+        # Drop results of other model/rule versions and expired ones
+        with self._lock:
+            return self._db.execute("DELETE FROM results WHERE version != ? OR expires <= ?",
+                                    (version, now)).rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+class ResultCache:
+    # Scores of encoded returns, keyed by the content of the feature vector
+    # plus the digests of the model being scored (its pickle or shared
+    # export), the fraud rules and preprocessor, and the tax regime.
+    # Resubmitted returns skip the forest, the rules and the tax
+    # calculation; the rules that fired are stored with each result and
+    # added to the rule engine's counts on a hit, so its stats still cover
+    # every row scored. The in-process tier is an LRU bounded by
+    # max_entries; an entry also expires ttl seconds after it was scored.
+    # With disk_path, results are shared with the other workers through a
+    # SQLite file.
+    # When any artifact changes, the version changes: the memory tier is
+    # cleared and older rows are pruned from the disk tier.
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, disk_path=None, rules_path=RULES_PATH,
+                 preprocessor_path=PREPROCESSOR_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.paths = [rules_path, preprocessor_path]
+        self._tokens = weakref.WeakKeyDictionary()
+        self.disk = _DiskTier(disk_path) if disk_path else None
+        self.version = None
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _model_key(self, model):
+        # The digest of the file the model was loaded from; a model built in
+        # memory gets a random token, so its rows are only shared with itself
+        digest = model_digest(model)
+        if digest is None:
+            digest = self._tokens.get(model)
+            if digest is None:
+                digest = self._tokens[model] = uuid.uuid4().hex
+        return digest
+
+    def _version(self, model, tax_regime):
+        # Re-hashes an artifact only when its mtime/size changes
+        parts = [current_digest(path) if os.path.exists(path) else "-" for path in self.paths]
+        return hashlib.sha256("|".join([self._model_key(model)] + parts + [tax_regime]).encode()).hexdigest()[:32]
+
+    def _check_version(self, version):
+        if version == self.version:
+            return
+        with self._lock:
+            if self.version is not None:
+                self._memory.clear()
+                self.invalidations += 1
+                metrics.event("result_cache_invalidated", version=version[:12])
+            self.version = version
+        if self.disk is not None:
+            self.disk.prune(version, time.time())
+
+    def _get(self, keys, now):
+        # (key index -> (predicted, level, tax, rules)) for the keys cached
+        # and fresh
+        found = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._memory.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    del self._memory[key]
+                    self.expirations += 1
+                    continue
+                self._memory.move_to_end(key)
+                found[i] = entry[1:]
+            self.hits += len(found)
+        if self.disk is not None and len(found) < len(keys):
+            missing = [i for i in range(len(keys)) if i not in found]
+            stored = self.disk.get([keys[i] for i in missing], now)
+            if stored:
+                self._put_memory([(keys[i], stored[keys[i]]) for i in missing if keys[i] in stored])
+                for i in missing:
+                    if keys[i] in stored:
+                        found[i] = stored[keys[i]][1:]
+                with self._lock:
+                    self.disk_hits += len(stored)
+        with self._lock:
+            self.misses += len(keys) - len(found)
+        return found
+
+    def _put_memory(self, entries):
+        with self._lock:
+            for key, entry in entries:
+                self._memory[key] = entry
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    def score(self, X, model, preprocessor, batch_size=100000, tax_regime=DEFAULT_REGIME):
+        # Drop-in for score_matrix(): cached rows are filled in and only the
+        # rest are scored, so the output is the same as scoring every row
+        version = self._version(model, tax_regime)
+        self._check_version(version)
+        now = time.time()
+        keys = row_keys(X, version)
+        found = self._get(keys, now)
+        rows = np.array([i for i in range(len(keys)) if i not in found], dtype=np.intp)
+        if not found:
+            scores = score_matrix(X, model, preprocessor, batch_size, tax_regime, rule_hits=True)
+        else:
+            reported = X[:, preprocessor.column_index("Reported_Income")]
+            interest = X[:, preprocessor.column_index("Interest_Income")]
+            capital_gains = X[:, preprocessor.column_index("Capital_Gains")]
+            scores = {
+                "predicted_income": np.empty(len(X), dtype=np.float64),
+                "total_reported_income": reported + interest + capital_gains,
+                "risk_level": np.empty(len(X), dtype=np.int8),
+                "tax": np.empty(len(X), dtype=np.float64),
+                "rule_hits": np.empty(len(X), dtype=np.int64),
+            }
+            if len(rows):
+                fresh = score_matrix(X[rows], model, preprocessor, batch_size, tax_regime, rule_hits=True)
+                for name in ("predicted_income", "risk_level", "tax", "rule_hits"):
+                    scores[name][rows] = fresh[name]
+            index = np.fromiter(found, dtype=np.intp, count=len(found))
+            cached = np.array(list(found.values()), dtype=np.float64)
+            scores["predicted_income"][index] = cached[:, 0]
+            scores["risk_level"][index] = cached[:, 1]
+            scores["tax"][index] = cached[:, 2]
+            scores["rule_hits"][index] = cached[:, 3]
+            engine = get_rule_engine()
+            engine.record(scores["risk_level"][index], engine.masks_from_bits(scores["rule_hits"][index]))
+        rule_hits = scores.pop("rule_hits")
+
+        if len(rows):
+            expires = now + self.ttl
+            entries = [(keys[i], (expires, float(scores["predicted_income"][i]), int(scores["risk_level"][i]),
+                                  float(scores["tax"][i]), int(rule_hits[i]))) for i in rows]
+            self._put_memory(entries)
+            if self.disk is not None:
+                self.disk.put(version, entries)
+        metrics.increment("result_cache.hits", len(found))
+        metrics.increment("result_cache.misses", len(rows))
+        return scores
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "version": self.version,
+                "disk": self.disk.path if self.disk is not None else None,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    # The process's cache; FRAUD_RESULT_CACHE=0 turns it off and
+    # FRAUD_RESULT_CACHE_PATH adds the shared SQLite tier
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                enabled = os.environ.get(CACHE_ENV, "1") != "0"
+                _cache = ResultCache(disk_path=os.environ.get(CACHE_PATH_ENV)) if enabled else False
+    return _cache or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the result cache on a returns file submitted twice")
+    parser.add_argument("input", help="returns CSV or dataset store directory")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--disk", help="SQLite file for the shared tier")
+    args = parser.parse_args()
+
+    from batch_score import read_returns
+    from model_registry import get_preprocessor, get_serving_model
+    model = get_serving_model()
+    preprocessor = get_preprocessor()
+    X = np.vstack([preprocessor.encode(chunk) for chunk in read_returns(args.input)])
+    batches = [X[start:start + args.batch_size] for start in range(0, len(X), args.batch_size)]
+
+    start = time.perf_counter()
+    expected = [score_matrix(batch, model, preprocessor) for batch in batches]
+    uncached = time.perf_counter() - start
+    print(f"{'uncached':<12} {len(X):,} rows in {uncached:.3f}s")
+    cache = ResultCache(disk_path=args.disk)
+    for label in ("first pass", "second pass"):
+        start = time.perf_counter()
+        scores = [cache.score(batch, model, preprocessor) for batch in batches]
+        seconds = time.perf_counter() - start
+        same = all(np.array_equal(a[k], b[k]) for a, b in zip(expected, scores) for k in a)
+        print(f"{label:<12} {len(X):,} rows in {seconds:.3f}s ({uncached / seconds:.1f}x), identical: {same}")
+    print(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+from explain import explain_rows, get_explainer
+from fraud_rules import get_rule_engine
+from metrics import timed
+from model_registry import get_preprocessor
+from preprocessing import FEATURE_COLUMNS
+from tax_engine import DEFAULT_REGIME, compute_tax
+
+# Same bounds as predict_income() in app.py
+MIN_INCOME = 200000  # 2L minimum
+MAX_INCOME = 5000000  # 50L maximum
+
+RISK_LABELS = np.array([
+    "No Fraud Detected",
+    "Low Risk of Fraud",
+    "Medium Risk of Fraud",
+    "High Risk of Fraud",
+])
+RISK_COLORS = np.array(["green", "yellow", "#ff9800", "red"])
+# Risk level whose predictions are explained ("High Risk of Fraud")
+EXPLAIN_LEVEL = 3
+
+
+def load_preprocessor():
+    return get_preprocessor()
+
+
+@timed("predict")
+def predict_incomes(model, X):
+    # Batched equivalent of predict_income(): one predict call for all rows
+    return np.clip(model.predict(X), MIN_INCOME, MAX_INCOME)
+
+
+@timed("classify_fraud")
+def classify_fraud_batch(reported_income, predicted_income, age, occupation, engine=None, hit_bits=False):
+    # Vectorized classify_fraud(); returns risk level 0-3 per row. The checks
+    # and thresholds come from fraud_rules.json (see fraud_rules.py). With
+    # hit_bits, also returns which rules fired (RuleEngine.hit_bits).
+    engine = engine or get_rule_engine()
+    level, masks = engine.evaluate(reported_income, predicted_income, age, occupation)
+    return (level, engine.hit_bits(masks)) if hit_bits else level
+
+
+@timed("tax")
+def calculate_tax_batch(income, regime=DEFAULT_REGIME):
+    # Vectorized calculate_tax(); the default regime reproduces it exactly
+    return compute_tax(income, regime)
+
+
+def score_matrix(X, model, preprocessor, batch_size=100000, tax_regime=DEFAULT_REGIME, rule_hits=False):
+    # Score already-encoded returns; one model.predict call per batch. With
+    # rule_hits, the result also has "rule_hits", the rules fired per row.
+    predicted = np.empty(len(X), dtype=np.float64)
+    for start in range(0, len(X), batch_size):
+        predicted[start:start + batch_size] = predict_incomes(model, X[start:start + batch_size])
+
+    reported = X[:, preprocessor.column_index("Reported_Income")]
+    interest = X[:, preprocessor.column_index("Interest_Income")]
+    capital_gains = X[:, preprocessor.column_index("Capital_Gains")]
+    total_reported = reported + interest + capital_gains
+
+    level = classify_fraud_batch(
+        total_reported,
+        predicted,
+        X[:, preprocessor.column_index("Age")],
+        preprocessor.decode("Occupation", X[:, preprocessor.column_index("Occupation")]),
+        hit_bits=rule_hits,
+    )
+    scores = {}
+    if rule_hits:
+        level, scores["rule_hits"] = level
+    return {
+        "predicted_income": predicted,
+        "total_reported_income": total_reported,
+        "risk_level": level,
+        "tax": calculate_tax_batch(total_reported, tax_regime),
+        **scores,
+    }
+
+
+def score_returns(df, model, preprocessor, batch_size=100000, tax_regime=DEFAULT_REGIME, identity_index=None,
+                  explain=False):
+    # Score a DataFrame of returns; with an IdentityIndex, also report the
+    # other PANs sharing each return's Aadhaar / bank account. With explain,
+    # High Risk rows get the features that drove their predicted income.
+    X = preprocessor.encode(df)
+    scores = score_matrix(X, model, preprocessor, batch_size, tax_regime)
+    result = pd.DataFrame({
+        "Predicted_Income": scores["predicted_income"],
+        "Total_Reported_Income": scores["total_reported_income"],
+        "Fraud_Risk": RISK_LABELS[scores["risk_level"]],
+        "Tax": scores["tax"],
+    }, index=df.index)
+    if identity_index is not None:
+        result = result.join(identity_linkage(df, identity_index))
+    if explain and get_explainer(model) is not None:
+        factors = np.full(len(df), "", dtype=object)
+        flagged = np.flatnonzero(scores["risk_level"] == EXPLAIN_LEVEL)
+        if len(flagged):
+            factors[flagged] = explain_rows(model, X[flagged], preprocessor.feature_columns)
+        result["Top_Factors"] = factors
+    return result
+
+
+@timed("identity_linkage")
+def identity_linkage(df, identity_index):
+    return identity_index.features(df)
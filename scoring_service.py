@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from drift import get_drift_monitor
+from fraud_rules import get_rule_engine
+from metrics import handle_request as handle_metrics_request
+from metrics import metrics, timer
+from model_registry import get_preprocessor, get_serving_model
+from result_cache import get_result_cache
+from scoring import RISK_COLORS, RISK_LABELS, score_matrix
+from shadow import SHADOW_MODELS_ENV, get_shadow_scorer
+
+MAX_BODY_BYTES = 1 << 20
+
+
+class MicroBatcher:
+    # Collects returns from concurrent requests, then encodes and scores them
+    # together. A batch is flushed as soon as it holds max_batch_size rows or
+    # max_wait seconds after its first row arrived, whichever comes first.
+    # Scoring runs in a worker thread so the event loop keeps accepting
+    # requests meanwhile.
+
+    def __init__(self, max_batch_size=256, max_wait=0.001):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = asyncio.Queue()
+        self._task = None
+        self.batches = 0
+        self.rows = 0
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, records):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((records, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            n_rows = len(items[0][0])
+            deadline = loop.time() + self.max_wait
+            while n_rows < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                n_rows += len(item[0])
+
+            try:
+                results = await loop.run_in_executor(None, self._score_batch, [r for r, _ in items])
+            except Exception as exc:
+                results = [exc] * len(items)
+            self.batches += 1
+            self.rows += n_rows
+            for (_, future), result in zip(items, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    @staticmethod
+    def _score(X):
+        # Resubmitted returns are answered from the result cache
+        cache = get_result_cache()
+        if cache is not None:
+            scores = cache.score(X, get_serving_model(), get_preprocessor())
+        else:
+            scores = score_matrix(X, get_serving_model(), get_preprocessor())
+        drift = get_drift_monitor()
+        if drift is not None:
+            drift.observe(X)
+        # Candidate models (FRAUD_SHADOW_MODELS) see the same batch off the
+        # request path
+        shadow = get_shadow_scorer()
+        if shadow is not None:
+            shadow.submit(X, scores)
+        return scores
+
+    @classmethod
+    def _score_batch(cls, batch):
+        with timer("service.batch"):
+            return cls._score_requests(batch)
+
+    @classmethod
+    def _score_requests(cls, batch):
+        # One encode and one model call for every request in the batch
+        preprocessor = get_preprocessor()
+        try:
+            X = _encode(preprocessor, [record for records in batch for record in records])
+            blocks = [len(records) for records in batch]
+        except Exception:
+            # Some request is invalid: encode them one by one so only it fails
+            encoded = []
+            for records in batch:
+                try:
+                    encoded.append(_encode(preprocessor, records))
+                except Exception as exc:
+                    encoded.append(exc)
+            valid = [e for e in encoded if not isinstance(e, Exception)]
+            X = np.vstack(valid) if valid else None
+            blocks = [e if isinstance(e, Exception) else len(e) for e in encoded]
+
+        scores = cls._score(X) if X is not None else None
+        results = []
+        start = 0
+        for block in blocks:
+            if isinstance(block, Exception):
+                results.append(block)
+                continue
+            results.append({k: v[start:start + block] for k, v in scores.items()})
+            start += block
+        return results
+
+
+def _check_records(preprocessor, records):
+    # Reject a request before it joins a batch: every field must be a JSON
+    # scalar, categorical fields strings and every other model field a number
+    for i, record in enumerate(records):
+        for field, value in record.items():
+            where = f"Record {i}: {field}"
+            if field in preprocessor.categories:
+                if not isinstance(value, str):
+                    raise ValueError(f"{where} must be a string")
+            elif field in preprocessor.feature_columns:
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value):
+                    raise ValueError(f"{where} must be a number")
+            elif value is not None and not isinstance(value, (str, int, float)):
+                raise ValueError(f"{where} must be a string, number or null")
+
+
+def _encode(preprocessor, records):
+    # Records carrying the same fields are encoded together, so a field that
+    # one request omits is derived for it instead of read as missing
+    groups = {}
+    for i, record in enumerate(records):
+        groups.setdefault(frozenset(record), []).append(i)
+    X = np.empty((len(records), len(preprocessor.feature_columns)), dtype=np.float64)
+    for fields, rows in groups.items():
+        X[rows] = preprocessor.encode({f: [records[i][f] for i in rows] for f in fields})
+    return X
+
+
+def _format_results(scores):
+    levels = scores["risk_level"]
+    return [
+        {
+            "predicted_income": round(float(p), 2),
+            "total_reported_income": round(float(t), 2),
+            "fraud_risk": str(RISK_LABELS[level]),
+            "risk_color": str(RISK_COLORS[level]),
+            "tax": float(tax),
+        }
+        for p, t, level, tax in zip(scores["predicted_income"], scores["total_reported_income"],
+                                    levels, scores["tax"])
+    ]
+
+
+class ScoringService:
+    # POST /score takes one return (JSON object) or a list of returns, using
+    # the dataset column names (Age, Occupation, Marital_Status,
+    # "Children (Yes/No)", Reported_Income, Interest_Income, Capital_Gains and
+    # optionally the other money columns). GET /health reports batch stats;
+    # GET /metrics, GET /profile and POST /profile/start|stop|reset expose
+    # the stage latencies and the sampling profiler. GET /drift scores this
+    # process's inputs against the training data, and GET /shadow compares
+    # the candidate models against the serving one.
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+        self.requests = 0
+
+    async def handle(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return 200, {
+                "status": "ok",
+                "requests": self.requests,
+                "batches": self.batcher.batches,
+                "rows": self.batcher.rows,
+                "mean_batch_rows": self.batcher.rows / max(self.batcher.batches, 1),
+                "fraud_rules": get_rule_engine().stats(),
+                "result_cache": get_result_cache().stats() if get_result_cache() is not None else None,
+            }
+        if method == "GET" and path == "/drift":
+            drift = get_drift_monitor()
+            if drift is None:
+                return 404, {"error": "Drift monitoring is off; set FRAUD_DRIFT_REFERENCE to a drift.py reference"}
+            return 200, drift.report()
+        if method == "GET" and path == "/shadow":
+            shadow = get_shadow_scorer()
+            if shadow is None:
+                return 404, {"error": f"Shadow scoring is off; set {SHADOW_MODELS_ENV}"}
+            return 200, shadow.report()
+        if path.startswith(("/metrics", "/profile")):
+            status, _, body = handle_metrics_request(method, path)
+            return status, json.loads(body) if path != "/profile" else {"collapsed": body}
+        if method == "POST" and path == "/score":
+            start = time.perf_counter()
+            try:
+                payload = json.loads(body)
+                records = payload if isinstance(payload, list) else [payload]
+                if not records or not all(isinstance(r, dict) for r in records):
+                    raise ValueError("Expected a JSON object or a non-empty list of objects")
+                _check_records(get_preprocessor(), records)
+            except ValueError as exc:
+                return 400, {"error": str(exc)}
+            self.requests += 1
+            try:
+                results = _format_results(await self.batcher.submit(records))
+            except ValueError as exc:
+                return 400, {"error": str(exc)}
+            except Exception as exc:
+                return 500, {"error": f"{type(exc).__name__}: {exc}"}
+            metrics.observe("service.request", time.perf_counter() - start)
+            return 200, results if isinstance(payload, list) else results[0]
+        return 404, {"error": f"No route for {method} {path}"}
+
+    async def serve_connection(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive; enough for service-to-service calls
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                # A body that is not read leaves the stream mid-request, so
+                # those answers close the connection instead of keeping it
+                unread = length < 0 or length > MAX_BODY_BYTES
+                if length < 0:
+                    status, response = 400, {"error": "Invalid Content-Length"}
+                elif unread:
+                    status, response = 413, {"error": "Request body too large"}
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        status, response = await self.handle(method, path.split("?", 1)[0], body)
+                    except Exception as exc:
+                        # Answer instead of dropping the connection
+                        status, response = 500, {"error": f"{type(exc).__name__}: {exc}"}
+
+                data = json.dumps(response).encode()
+                keep_alive = not unread and headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, max_batch_size, max_wait_ms):
+    # Load and warm the model before accepting traffic
+    start = time.perf_counter()
+    MicroBatcher._score(get_preprocessor().encode({
+        "Age": 30, "Occupation": "Salaried", "Marital_Status": "Single",
+        "Children (Yes/No)": "No", "Reported_Income": 500000.0,
+    }))
+    print(f"Model ready in {time.perf_counter() - start:.2f}s")
+
+    batcher = MicroBatcher(max_batch_size, max_wait_ms / 1000)
+    batcher.start()
+    service = ScoringService(batcher)
+    server = await asyncio.start_server(service.serve_connection, host, port)
+    print(f"Scoring service listening on http://{host}:{port} "
+          f"(max batch {max_batch_size}, max wait {max_wait_ms} ms)")
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            await batcher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Async HTTP scoring service with micro-batching")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=1.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_batch_size, args.max_wait_ms))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from fraud_rules import RuleEngine, get_rule_engine
+from metrics import metrics
+from model_registry import MODEL_PATH, get_model, get_preprocessor, get_serving_model
+from outliers import QuantileSketch
+from scoring import MAX_INCOME, MIN_INCOME, RISK_LABELS, score_matrix
+
+SHADOW_MODELS_ENV = "FRAUD_SHADOW_MODELS"
+SHADOW_PROCESS_ENV = "FRAUD_SHADOW_PROCESS"
+REPORT_PATH = "shadow_report.json"
+# Requests in flight on the shadow executor; beyond this new work is dropped
+MAX_PENDING = 8
+REPORT_INTERVAL = 10.0
+QUANTILES = [0.5, 0.9, 0.99]
+
+_rules = {}
+
+
+def _shadow_rules():
+    # A private copy of the live rules, so shadow scoring does not add to
+    # the hit counts reported for real traffic
+    live = get_rule_engine()
+    engine = _rules.get(id(live))
+    if engine is None:
+        _rules.clear()
+        engine = _rules[id(live)] = RuleEngine(live.spec)
+    return engine
+
+
+def score_candidate(path, X, total_reported):
+    # Runs on the shadow executor: (predicted income, risk level, seconds)
+    model = get_model(path)
+    preprocessor = get_preprocessor()
+    start = time.perf_counter()
+    predicted = np.clip(model.predict(X), MIN_INCOME, MAX_INCOME)
+    level = _shadow_rules().classify(
+        total_reported,
+        predicted,
+        X[:, preprocessor.column_index("Age")],
+        preprocessor.decode("Occupation", X[:, preprocessor.column_index("Occupation")]),
+    )
+    return predicted, level, time.perf_counter() - start
+
+
+class ShadowComparison:
+    # Running comparison of one candidate against the primary model in
+    # constant memory: a risk-level confusion matrix and quantile sketches of
+    # the absolute and relative predicted-income differences
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.errors = 0
+        self.last_error = None
+        self.seconds = 0.0
+        self.confusion = np.zeros((len(RISK_LABELS), len(RISK_LABELS)), dtype=np.int64)
+        self.diff_sketch = QuantileSketch(2)
+        self.diff_sum = 0.0
+        self.diff_max = 0.0
+
+    def update(self, primary_income, primary_level, predicted, level, seconds):
+        primary_income = np.asarray(primary_income, dtype=np.float64)
+        diff = np.abs(predicted - primary_income)
+        self.rows += len(diff)
+        self.seconds += seconds
+        np.add.at(self.confusion, (primary_level, level), 1)
+        self.diff_sketch.update(np.column_stack([diff, diff / primary_income]))
+        self.diff_sum += float(diff.sum())
+        self.diff_max = max(self.diff_max, float(diff.max()))
+
+    def report(self):
+        agree = int(np.trace(self.confusion))
+        high = len(RISK_LABELS) - 1
+        quantiles = self.diff_sketch.quantiles(QUANTILES)
+        return {
+            "candidate": self.path,
+            "rows": self.rows,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "risk_agreement": agree / self.rows if self.rows else None,
+            "escalated": int(np.triu(self.confusion, 1).sum()),
+            "deescalated": int(np.tril(self.confusion, -1).sum()),
+            "high_risk_gained": int(self.confusion[:high, high].sum()),
+            "high_risk_lost": int(self.confusion[high, :high].sum()),
+            "confusion": self.confusion.tolist(),
+            "income_abs_diff": {
+                "mean": self.diff_sum / self.rows if self.rows else None,
+                "max": self.diff_max,
+                **{f"p{round(q * 100)}": float(v) for q, v in zip(QUANTILES, quantiles[:, 0])},
+            },
+            "income_rel_diff": {f"p{round(q * 100)}": float(v) for q, v in zip(QUANTILES, quantiles[:, 1])},
+            "ms_per_row": self.seconds / self.rows * 1e3 if self.rows else None,
+        }
+
+
+class ShadowScorer:
+    # Scores the inputs the primary model has already answered with candidate
+    # models, off the request path. submit() only hands the encoded batch to
+    # a bounded background executor: when max_pending batches are already in
+    # flight the batch is dropped and counted, so a slow candidate can never
+    # queue up memory or make the primary path wait.
+
+    def __init__(self, candidates, max_pending=MAX_PENDING, processes=False, report_path=REPORT_PATH):
+        self.comparisons = {path: ShadowComparison(path) for path in candidates}
+        self.max_pending = max_pending
+        self.report_path = report_path
+        self.submitted = 0
+        self.dropped = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        if processes:
+            # A separate process keeps candidate scoring off this process's GIL
+            self._executor = ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn"))
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+
+    def submit(self, X, primary):
+        # X: encoded rows; primary: score_matrix() output for the same rows.
+        # Returns False if the batch was dropped.
+        if not self._slots.acquire(blocking=False):
+            self.dropped += 1
+            metrics.increment("shadow.dropped")
+            return False
+        try:
+            future = self._executor.submit(self._score_all, list(self.comparisons), X,
+                                           primary["total_reported_income"])
+        except Exception:
+            # e.g. the executor was shut down; the slot would never come back
+            self._slots.release()
+            self.dropped += 1
+            metrics.increment("shadow.dropped")
+            return False
+        self.submitted += 1
+        future.add_done_callback(lambda f: self._record(f, primary["predicted_income"], primary["risk_level"]))
+        return True
+
+    @staticmethod
+    def _score_all(paths, X, total_reported):
+        results = {}
+        for path in paths:
+            try:
+                results[path] = score_candidate(path, X, total_reported)
+            except Exception as exc:
+                results[path] = f"{type(exc).__name__}: {exc}"
+        return results
+
+    def _record(self, future, primary_income, primary_level):
+        self._slots.release()
+        try:
+            results = future.result()
+        except Exception as exc:
+            results = {path: f"{type(exc).__name__}: {exc}" for path in self.comparisons}
+        with self._lock:
+            for path, result in results.items():
+                comparison = self.comparisons[path]
+                if isinstance(result, str):
+                    comparison.errors += 1
+                    comparison.last_error = result
+                    metrics.increment("shadow.errors")
+                else:
+                    comparison.update(primary_income, primary_level, *result)
+                    metrics.observe("shadow.candidate", result[2])
+            save = self.report_path and time.time() - self._last_save >= REPORT_INTERVAL
+            if save:
+                self._last_save = time.time()
+        metrics.increment("shadow.rows", len(primary_income))
+        if save:
+            self.save_report()
+
+    def report(self):
+        with self._lock:
+            return {
+                "time": time.time(),
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "max_pending": self.max_pending,
+                "candidates": [c.report() for c in self.comparisons.values()],
+            }
+
+    def save_report(self, path=None):
+        path = path or self.report_path
+        handle, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        with os.fdopen(handle, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        os.replace(tmp, path)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self.report_path:
+            self.save_report()
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def get_shadow_scorer():
+    # The process's scorer for the candidates in FRAUD_SHADOW_MODELS
+    # (comma-separated model paths), or None when shadow scoring is off
+    global _scorer
+    if _scorer is None:
+        with _scorer_lock:
+            if _scorer is None:
+                candidates = [p for p in os.environ.get(SHADOW_MODELS_ENV, "").split(",") if p.strip()]
+                _scorer = ShadowScorer([p.strip() for p in candidates],
+                                       processes=os.environ.get(SHADOW_PROCESS_ENV) == "1") if candidates else False
+    return _scorer or None
+
+
+def print_report(report):
+    print(f"{report['submitted']:,} batches shadowed, {report['dropped']:,} dropped "
+          f"(max {report['max_pending']} pending)")
+    for c in report["candidates"]:
+        print(f"\n{c['candidate']}: {c['rows']:,} rows, {c['errors']} errors")
+        if not c["rows"]:
+            continue
+        diff = c["income_abs_diff"]
+        print(f"  risk agreement {c['risk_agreement']:.2%}: {c['escalated']:,} escalated, "
+              f"{c['deescalated']:,} de-escalated; High Risk +{c['high_risk_gained']:,} / -{c['high_risk_lost']:,}")
+        print(f"  |income diff| mean {diff['mean']:,.0f}, p50 {diff['p50']:,.0f}, p90 {diff['p90']:,.0f}, "
+              f"p99 {diff['p99']:,.0f}, max {diff['max']:,.0f}; relative p50 {c['income_rel_diff']['p50']:.2%}")
+        print(f"  {c['ms_per_row']:.4f} ms/row on the shadow executor")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare candidate models against the serving model")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="print a running process's saved report")
+    show.add_argument("--report", default=REPORT_PATH)
+    replay = sub.add_parser("replay", help="shadow-score a returns file in batches, as live traffic would be")
+    replay.add_argument("input", help="returns CSV or dataset store directory")
+    replay.add_argument("--candidate", nargs="+", required=True)
+    replay.add_argument("--model", default=MODEL_PATH)
+    replay.add_argument("--batch-size", type=int, default=256)
+    replay.add_argument("--max-pending", type=int, default=MAX_PENDING)
+    replay.add_argument("--processes", action="store_true")
+    replay.add_argument("--report", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "show":
+        with open(args.report) as f:
+            print_report(json.load(f))
+        return
+
+    from batch_score import read_returns
+    model = get_serving_model(args.model)
+    preprocessor = get_preprocessor()
+    scorer = ShadowScorer(args.candidate, args.max_pending, args.processes, args.report)
+    primary_seconds = 0.0
+    rows = 0
+    for chunk in read_returns(args.input):
+        X = preprocessor.encode(chunk)
+        for start in range(0, len(X), args.batch_size):
+            batch = X[start:start + args.batch_size]
+            begin = time.perf_counter()
+            scorer.submit(batch, score_matrix(batch, model, preprocessor))
+            primary_seconds += time.perf_counter() - begin
+            rows += len(batch)
+    scorer.close()
+    print(f"Primary path: {rows:,} rows in {primary_seconds:.2f}s including shadow submits")
+    print_report(scorer.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+
+import joblib
+import numpy as np
+
+from forest_engine import backend, predict_forest
+from model_registry import MODEL_PATH, SHARED_MODEL_PATH, file_digest
+
+FORMAT_VERSION = 2
+
+
+def _float32_floor(threshold):
+    # Largest float32 <= each float64 threshold. For float32 inputs,
+    # x <= t and x <= floor32(t) always agree, so the engine can compare in
+    # float32 and still route every row exactly like sklearn.
+    t32 = threshold.astype(np.float32)
+    over = t32.astype(np.float64) > threshold
+    t32[over] = np.nextafter(t32[over], np.float32(-np.inf))
+    return t32
+
+
+def flatten_forest(model, source_digest=None):
+    # Flatten every tree of a fitted forest into a few contiguous arrays.
+    # children[2 * node] / children[2 * node + 1] are the global indices of a
+    # node's left/right child. Leaves point back at themselves with an
+    # infinite threshold, so every row can take exactly max_depth steps
+    # without checking whether it already reached a leaf.
+    features, thresholds, children, values = [], [], [], []
+    roots, depths = [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(offset, offset + tree.node_count, dtype=np.int32)
+        is_leaf = tree.children_left < 0
+        left = np.where(is_leaf, nodes, tree.children_left + offset).astype(np.int32)
+        right = np.where(is_leaf, nodes, tree.children_right + offset).astype(np.int32)
+        feature = np.where(is_leaf, 0, tree.feature).astype(np.int32)
+        threshold = _float32_floor(tree.threshold)
+        threshold[is_leaf] = np.inf
+        features.append(feature)
+        thresholds.append(threshold)
+        children.append(np.column_stack([left, right]).ravel())
+        values.append(tree.value[:, 0, 0])
+        roots.append(offset)
+        depths.append(tree.max_depth)
+        offset += tree.node_count
+
+    arrays = {
+        "version": FORMAT_VERSION,
+        "source_digest": source_digest,
+        "n_features": int(model.n_features_in_),
+        "feature": np.ascontiguousarray(np.concatenate(features)),
+        "threshold": np.ascontiguousarray(np.concatenate(thresholds)),
+        "children": np.ascontiguousarray(np.concatenate(children)),
+        "value": np.ascontiguousarray(np.concatenate(values)),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "depths": np.asarray(depths, dtype=np.int32),
+    }
+    return arrays
+
+
+def save_flat_forest(arrays, path):
+    # Uncompressed on purpose: joblib can only memory-map raw array buffers
+    joblib.dump(arrays, path, compress=0)
+    return path
+
+
+def export_shared_model(model, path=SHARED_MODEL_PATH, source_digest=None):
+    return save_flat_forest(flatten_forest(model, source_digest), path)
+
+
+class SharedForest:
+    # Read-only forest backed by memory-mapped node arrays. Every process that
+    # opens the same file shares one page-cache copy of the trees.
+
+    def __init__(self, arrays):
+        if arrays["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported shared model version: {arrays['version']}; "
+                             "re-run `python shared_model.py export`")
+        self.source_digest = arrays["source_digest"]
+        self.n_features_in_ = arrays["n_features"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.children = arrays["children"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.depths = arrays["depths"]
+        self.max_depth = int(self.depths.max())
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def predict(self, X):
+        # Drop-in for RandomForestRegressor.predict without sklearn's per-call
+        # validation and per-tree dispatch. sklearn compares float32 features
+        # against float64 thresholds, so the input is cast the same way.
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected input of shape (n, {self.n_features_in_}), got {X.shape}")
+        return predict_forest(X, self.feature, self.threshold, self.children,
+                              self.value, self.roots, self.max_depth)
+
+
+def load_shared_model(path=SHARED_MODEL_PATH, mmap_mode="r"):
+    model = SharedForest(joblib.load(path, mmap_mode=mmap_mode))
+    # Pay the one-off JIT/page-in cost here instead of on the first request
+    model.predict(np.zeros((1, model.n_features_in_)))
+    return model
+
+
+def _time_call(fn, X, min_seconds=0.5):
+    fn(X)
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn(X)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def benchmark(model, shared, row_counts=(1, 10000), seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for n in row_counts:
+        X = rng.uniform(0, 3000000, (n, model.n_features_in_))
+        X[:, 0] = rng.integers(20, 90, n)
+        X[:, 1] = rng.integers(0, 3, n)
+        X[:, 2:4] = rng.integers(0, 2, (n, 2))
+        max_diff = float(np.abs(shared.predict(X) - model.predict(X)).max())
+        sklearn_s = _time_call(model.predict, X)
+        engine_s = _time_call(shared.predict, X)
+        results.append({
+            "rows": n,
+            "sklearn_ms": round(sklearn_s * 1e3, 4),
+            "engine_ms": round(engine_s * 1e3, 4),
+            "speedup": round(sklearn_s / engine_s, 1),
+            "max_abs_diff": max_diff,
+        })
+    return results
+
+
+def _memory_kb():
+    # RSS counts shared pages in every process; PSS splits them between sharers
+    usage = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                usage[key.lower()] = int(rest.split()[0])
+    return usage
+
+
+def _worker(mode, barrier, results):
+    # Import sklearn up front so only the model itself is measured
+    import sklearn.ensemble  # noqa: F401
+    before = _memory_kb()
+    if mode == "pickle":
+        model = joblib.load(MODEL_PATH)
+    else:
+        model = load_shared_model()
+    # Touch every node so all tree pages are resident
+    model.predict(np.zeros((1, model.n_features_in_)))
+    if mode == "mmap":
+        for name in ("feature", "threshold", "children", "value"):
+            getattr(model, name).sum()
+    barrier.wait()
+    after = _memory_kb()
+    results.put({k: after[k] - before[k] for k in after})
+    barrier.wait()
+
+
+def rss_report(worker_counts):
+    ctx = mp.get_context("spawn")
+    report = []
+    for mode in ("pickle", "mmap"):
+        for n in worker_counts:
+            barrier = ctx.Barrier(n)
+            results = ctx.Queue()
+            procs = [ctx.Process(target=_worker, args=(mode, barrier, results)) for _ in range(n)]
+            for p in procs:
+                p.start()
+            deltas = [results.get() for _ in procs]
+            for p in procs:
+                p.join()
+            report.append({
+                "mode": mode,
+                "workers": n,
+                "model_rss_kb_total": sum(d["rss"] for d in deltas),
+                "model_pss_kb_total": sum(d["pss"] for d in deltas),
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and inspect the memory-mapped forest")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="write the shared artifact from best_model.joblib")
+    export.add_argument("--model", default=MODEL_PATH)
+    export.add_argument("-o", "--output", default=SHARED_MODEL_PATH)
+    bench = sub.add_parser("bench", help="compare engine and sklearn predict latency")
+    bench.add_argument("--model", default=MODEL_PATH)
+    bench.add_argument("--rows", type=int, nargs="+", default=[1, 10000])
+    rss = sub.add_parser("rss", help="compare model memory for 1 vs. N worker processes")
+    rss.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    if args.command == "export":
+        model = joblib.load(args.model)
+        export_shared_model(model, args.output, source_digest=file_digest(args.model))
+        shared = load_shared_model(args.output)
+        X = np.random.default_rng(0).uniform(0, 3000000, (1000, model.n_features_in_))
+        max_diff = np.abs(shared.predict(X) - model.predict(X)).max()
+        print(f"Exported {shared.n_estimators} trees ({len(shared.value):,} nodes) "
+              f"to {args.output}; max abs diff vs sklearn: {max_diff:.3g}")
+    else:
+        if not os.path.exists(SHARED_MODEL_PATH):
+            parser.error(f"{SHARED_MODEL_PATH} not found; run the export command first")
+        if args.command == "bench":
+            report = {"backend": backend(),
+                      "results": benchmark(joblib.load(args.model), load_shared_model(), args.rows)}
+            print(json.dumps(report, indent=2))
+        else:
+            print(json.dumps(rss_report(args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+# Slab tables per regime/year. Each slab is [upper limit, rate] and taxes the
+# income between the previous limit (or `exemption`) and its own; income
+# above the last limit is taxed at `top_rate`. Optional parts:
+#   standard_deduction  subtracted from income first
+#   rebate              {"limit", "max", "marginal_relief"}: section 87A
+#   surcharge           [[income threshold, rate], ...] on income above each
+#                       threshold, with marginal relief at every threshold
+#   cess                rate on tax + surcharge
+#   round_to / decimals final rounding (nearest multiple, or decimal places)
+TAX_REGIMES = {
+    # calculate_tax() in app.py, kept bit for bit: its first slab has zero
+    # width and income above ₹10L adds no tax, because the loop stops at the
+    # last listed limit
+    "app": {
+        "exemption": 250000,
+        "slabs": [[250000, 0.05], [500000, 0.2], [1000000, 0.3]],
+        "top_rate": 0.0,
+        "cess": 0.04,
+        "decimals": 2,
+    },
+    "old_fy2023": {
+        "exemption": 250000,
+        "slabs": [[500000, 0.05], [1000000, 0.2]],
+        "top_rate": 0.3,
+        "standard_deduction": 50000,
+        "rebate": {"limit": 500000, "max": 12500, "marginal_relief": False},
+        "surcharge": [[5000000, 0.10], [10000000, 0.15], [20000000, 0.25], [50000000, 0.37]],
+        "cess": 0.04,
+        "round_to": 10,
+    },
+    "new_fy2023": {
+        "exemption": 300000,
+        "slabs": [[600000, 0.05], [900000, 0.10], [1200000, 0.15], [1500000, 0.20]],
+        "top_rate": 0.3,
+        "standard_deduction": 50000,
+        "rebate": {"limit": 700000, "max": 25000, "marginal_relief": True},
+        "surcharge": [[5000000, 0.10], [10000000, 0.15], [20000000, 0.25]],
+        "cess": 0.04,
+        "round_to": 10,
+    },
+    "new_fy2024": {
+        "exemption": 300000,
+        "slabs": [[700000, 0.05], [1000000, 0.10], [1200000, 0.15], [1500000, 0.20]],
+        "top_rate": 0.3,
+        "standard_deduction": 75000,
+        "rebate": {"limit": 700000, "max": 25000, "marginal_relief": True},
+        "surcharge": [[5000000, 0.10], [10000000, 0.15], [20000000, 0.25]],
+        "cess": 0.04,
+        "round_to": 10,
+    },
+}
+DEFAULT_REGIME = "app"
+
+
+class TaxRegime:
+    # One slab table compiled to arrays; every step is a whole-array NumPy
+    # operation, so a batch of any size is taxed in a single pass
+
+    def __init__(self, spec):
+        self.spec = spec
+        limits = [spec["exemption"]] + [limit for limit, _ in spec["slabs"]]
+        self.lower = np.asarray(limits[:-1], dtype=np.float64)
+        self.upper = np.asarray(limits[1:], dtype=np.float64)
+        self.rates = np.asarray([rate for _, rate in spec["slabs"]], dtype=np.float64)
+        self.top = float(limits[-1])
+        self.top_rate = spec.get("top_rate", 0.0)
+        self.standard_deduction = spec.get("standard_deduction", 0)
+        self.rebate = spec.get("rebate")
+        self.cess = spec.get("cess", 0.0)
+        surcharge = spec.get("surcharge", [])
+        self.surcharge_thresholds = np.asarray([t for t, _ in surcharge], dtype=np.float64)
+        self.surcharge_rates = np.asarray([0.0] + [r for _, r in surcharge], dtype=np.float64)
+
+    def _slab_tax(self, income):
+        tax = np.zeros_like(income)
+        for lower, upper, rate in zip(self.lower, self.upper, self.rates):
+            tax += np.clip(income - lower, 0, upper - lower) * rate
+        if self.top_rate:
+            tax += np.maximum(income - self.top, 0) * self.top_rate
+        return tax
+
+    def _after_rebate(self, income, tax):
+        if self.rebate is None:
+            return tax
+        limit, rebate = self.rebate["limit"], self.rebate["max"]
+        tax = np.where(income <= limit, np.maximum(tax - rebate, 0), tax)
+        if self.rebate.get("marginal_relief"):
+            # Just above the limit, tax may not exceed the income above it
+            tax = np.where(income > limit, np.minimum(tax, income - limit), tax)
+        return tax
+
+    def breakdown(self, income):
+        # Per-row components as a dict of arrays
+        income = np.asarray(income, dtype=np.float64)
+        taxable = np.maximum(income - self.standard_deduction, 0) if self.standard_deduction else income
+        base = self._after_rebate(taxable, self._slab_tax(taxable))
+
+        surcharge = np.zeros_like(base)
+        if len(self.surcharge_thresholds):
+            band = np.searchsorted(self.surcharge_thresholds, taxable, side="left")
+            surcharge = base * self.surcharge_rates[band]
+            # Marginal relief: crossing a threshold may not cost more in tax +
+            # surcharge than the income above that threshold
+            crossed = band > 0
+            threshold = np.where(crossed, self.surcharge_thresholds[np.maximum(band - 1, 0)], 0)
+            at_threshold = self._slab_tax(threshold) * (1 + self.surcharge_rates[np.maximum(band - 1, 0)])
+            cap = at_threshold + (taxable - threshold)
+            surcharge = np.where(crossed, np.minimum(base + surcharge, cap) - base, surcharge)
+            surcharge = np.maximum(surcharge, 0)
+
+        tax = base + surcharge
+        cess = tax * self.cess
+        tax = tax + cess
+        if "round_to" in self.spec:
+            tax = np.round(tax / self.spec["round_to"]) * self.spec["round_to"]
+        else:
+            tax = np.round(tax, self.spec.get("decimals", 2))
+        return {"taxable_income": taxable, "base_tax": base, "surcharge": surcharge, "cess": cess, "tax": tax}
+
+    def compute(self, income):
+        return self.breakdown(income)["tax"]
+
+
+_regimes = {}
+
+
+def get_regime(regime=DEFAULT_REGIME):
+    # A TaxRegime by name (compiled once) or from a spec dict
+    if isinstance(regime, dict):
+        return TaxRegime(regime)
+    if regime not in _regimes:
+        if regime not in TAX_REGIMES:
+            raise ValueError(f"Unknown tax regime: {regime}; choose from {sorted(TAX_REGIMES)}")
+        _regimes[regime] = TaxRegime(TAX_REGIMES[regime])
+    return _regimes[regime]
+
+
+def compute_tax(income, regime=DEFAULT_REGIME):
+    # Batch API: liabilities for an array of incomes
+    return get_regime(regime).compute(income)
+
+
+def tax_liability(income, regime=DEFAULT_REGIME):
+    # Scalar API: liability for one income
+    return float(get_regime(regime).compute(np.array([income], dtype=np.float64))[0])
+
+
+def compare_regimes(income, regimes=("old_fy2023", "new_fy2023", "new_fy2024")):
+    # One column of liabilities per regime, plus the cheapest regime per row
+    table = pd.DataFrame({name: compute_tax(income, name) for name in regimes})
+    table["best_regime"] = table.idxmin(axis=1)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tax liabilities for a returns file under several regimes")
+    parser.add_argument("input", nargs="?", help="returns CSV; prints the regime tables when omitted")
+    parser.add_argument("-o", "--output", default="tax_comparison.csv")
+    parser.add_argument("--regimes", nargs="+", choices=sorted(TAX_REGIMES),
+                        default=["old_fy2023", "new_fy2023", "new_fy2024"])
+    parser.add_argument("--income-columns", nargs="+",
+                        default=["Reported_Income", "Interest_Income", "Capital_Gains"],
+                        help="columns summed into the taxable income")
+    args = parser.parse_args()
+
+    if args.input is None:
+        print(json.dumps({name: TAX_REGIMES[name] for name in args.regimes}, indent=2))
+        return
+
+    from batch_score import ID_COLUMNS, read_returns
+    header = True
+    totals = pd.Series(0.0, index=args.regimes)
+    n_rows = 0
+    for chunk in read_returns(args.input):
+        income = chunk[args.income_columns].apply(pd.to_numeric, errors="coerce").fillna(0).sum(axis=1)
+        table = compare_regimes(income.to_numpy(), args.regimes)
+        table.index = chunk.index
+        ids = chunk[[c for c in ID_COLUMNS if c in chunk.columns]]
+        pd.concat([ids, income.rename("Taxable_Income"), table], axis=1).to_csv(
+            args.output, mode="w" if header else "a", header=header, index=False)
+        header = False
+        totals += table[args.regimes].sum()
+        n_rows += len(chunk)
+    for name, total in totals.items():
+        print(f"{name:<12} total ₹{total:,.0f}  mean ₹{total / max(n_rows, 1):,.0f}")
+    print(f"{n_rows:,} returns -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
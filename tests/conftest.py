@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def repo_root():
+    # Artifacts are loaded by relative path, as when the CLIs run from the
+    # repository root
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    yield ROOT
+    os.chdir(cwd)
+
+
+@pytest.fixture(scope="session")
+def returns(repo_root):
+    # The first 500 cleaned rows of the training returns file
+    from batch_score import read_returns
+    return next(read_returns("income_regression_dataset3.csv", chunksize=500)).reset_index(drop=True)
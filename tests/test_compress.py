@@ -0,0 +1,44 @@
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from compress import collapse_leaves, deduplicate, quantize, select_trees
+from data_generator import generate
+from explain import ForestExplainer
+from shared_model import SharedForest, flatten_forest
+
+
+@pytest.fixture(scope="module")
+def forest():
+    return flatten_forest(joblib.load("best_model.joblib"))
+
+
+@pytest.fixture(scope="module")
+def X():
+    return generate(3000, seed=11)[0]
+
+
+def test_deduplicate_keeps_explanations():
+    # Integer targets give many identical subtrees whose inner nodes saw
+    # different rows, so only their values tell them apart
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 4, (400, 3)).astype(np.float64)
+    y = (X[:, 0] >= 2) * 10.0 + (X[:, 1] >= 2) * 1.0 + X[:, 2] % 2
+    forest = flatten_forest(RandomForestRegressor(n_estimators=20, max_depth=4, random_state=0).fit(X, y))
+    shared = deduplicate(forest)
+    assert len(shared["value"]) < len(forest["value"])
+    np.testing.assert_array_equal(SharedForest(shared).predict(X), SharedForest(forest).predict(X))
+    np.testing.assert_allclose(ForestExplainer(shared).contributions(X), ForestExplainer(forest).contributions(X),
+                               rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("quantized", [False, True], ids=["pruned", "pruned_quantized"])
+def test_contributions_sum_to_prediction_after_compress(forest, X, quantized):
+    # The pruned variants exactly as compress.py builds them
+    compressed = deduplicate(collapse_leaves(select_trees(forest, X[:1000], fidelity=0.999), tolerance=500.0))
+    if quantized:
+        compressed = deduplicate(quantize(compressed, value_step=100.0))
+    explainer = ForestExplainer(compressed)
+    total = explainer.bias + explainer.contributions(X).sum(axis=1)
+    np.testing.assert_allclose(total, SharedForest(compressed).predict(X), rtol=1e-6)
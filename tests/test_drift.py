@@ -0,0 +1,32 @@
+import os
+import time
+
+import drift
+from data_generator import generate
+from model_registry import get_preprocessor
+
+
+def test_monitoring_is_off_without_a_reference(monkeypatch):
+    monkeypatch.setattr(drift, "_monitor", None)
+    monkeypatch.delenv(drift.REFERENCE_ENV, raising=False)
+    assert drift.get_drift_monitor() is None
+
+
+def test_training_data_does_not_drift_from_its_reference():
+    X, _ = generate(2000, seed=7)
+    current = drift.DriftSketch.for_preprocessor(get_preprocessor())
+    current.update(X)
+    assert drift.drift_scores(drift.sketch_training_data(), current)["status"] == "ok"
+
+
+def test_stale_snapshots_are_left_out_and_pruned(tmp_path):
+    sketch = drift.DriftSketch.for_preprocessor(get_preprocessor())
+    sketch.update(generate(100, seed=1)[0])
+    sketch.save(str(tmp_path / "live.joblib"))
+    sketch.save(str(tmp_path / "dead.joblib"))
+    stale = time.time() - 2 * drift.SNAPSHOT_MAX_AGE
+    os.utime(tmp_path / "dead.joblib", (stale, stale))
+    merged, n_snapshots = drift.merge_snapshots(str(tmp_path))
+    assert (n_snapshots, merged.rows) == (1, 100)
+    assert drift.prune_snapshots(str(tmp_path)) == 1
+    assert sorted(os.listdir(tmp_path)) == ["live.joblib"]
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from fraud_rules import DEFAULT_RULES, RuleEngine, get_rule_engine
+from model_registry import get_preprocessor, get_serving_model
+from scoring import score_matrix
+
+OCCUPATIONS = ["Salaried", "Self-employed", "Business"]
+
+
+def classify_fraud(reported_income, predicted_income, age, occupation):
+    # classify_fraud() as app.py had it before the rule engine, one row at a
+    # time, returning the risk level instead of its label
+    if reported_income > predicted_income * 2:
+        return 3
+    percentage_difference = (abs(reported_income - predicted_income) / predicted_income) * 100
+
+    def get_tax_slab(income):
+        for limit, slab in [(300000, "0%"), (600000, "5%"), (900000, "10%"), (1200000, "15%"), (1500000, "20%")]:
+            if income <= limit:
+                return slab
+        return "30%"
+
+    variance = {"Salaried": 3, "Self-employed": 7, "Business": 10}
+    indicators = 0
+    indicators += get_tax_slab(reported_income) != get_tax_slab(predicted_income)
+    indicators += percentage_difference > variance[occupation]
+    indicators += reported_income < (predicted_income * 0.95)
+    indicators += age < 30 and reported_income > 1000000
+    indicators += occupation == "Salaried" and reported_income > 2000000
+    return min(indicators, 3)
+
+
+def _reference_levels(reported, predicted, age, occupation):
+    return np.array([classify_fraud(r, p, a, o) for r, p, a, o in zip(reported, predicted, age, occupation)])
+
+
+def _random_inputs(n=20000, seed=0):
+    # Incomes spread over all slabs, plus rows sitting exactly on the slab
+    # limits and the 2x / 0.95x / variance thresholds
+    rng = np.random.default_rng(seed)
+    predicted = rng.uniform(100000, 3000000, n).round()
+    reported = predicted * rng.choice([0.3, 0.9, 0.95, 0.97, 1.0, 1.03, 1.07, 1.1, 1.5, 2.0, 2.5], n)
+    limits = np.array([300000, 600000, 900000, 1000000, 1200000, 1500000, 2000000])
+    on_limit = rng.random(n) < 0.2
+    reported[on_limit] = rng.choice(limits, on_limit.sum())
+    on_limit = rng.random(n) < 0.2
+    predicted[on_limit] = rng.choice(limits, on_limit.sum())
+    age = rng.integers(18, 70, n)
+    occupation = rng.choice(OCCUPATIONS, n)
+    return reported, predicted, age, occupation
+
+
+@pytest.mark.parametrize("engine", [RuleEngine(DEFAULT_RULES), get_rule_engine()], ids=["defaults", "config"])
+def test_engine_matches_per_row_classify_fraud(engine):
+    reported, predicted, age, occupation = _random_inputs()
+    np.testing.assert_array_equal(engine.classify(reported, predicted, age, occupation),
+                                  _reference_levels(reported, predicted, age, occupation))
+
+
+def test_scored_returns_match_per_row_classify_fraud(returns):
+    model, preprocessor = get_serving_model(), get_preprocessor()
+    scores = score_matrix(preprocessor.encode(returns), model, preprocessor)
+    expected = _reference_levels(scores["total_reported_income"], scores["predicted_income"],
+                                 returns["Age"], returns["Occupation"])
+    np.testing.assert_array_equal(scores["risk_level"], expected)
+
+
+def test_hit_bits_round_trip():
+    engine = RuleEngine(DEFAULT_RULES)
+    level, masks = engine.evaluate(*_random_inputs(2000, seed=1))
+    decoded = engine.masks_from_bits(engine.hit_bits(masks))
+    assert decoded.keys() == masks.keys()
+    for name in masks:
+        np.testing.assert_array_equal(decoded[name], masks[name])
+    assert engine.stats()["rows"] == len(level)
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_score import read_returns
+from identity_index import ID_KINDS, IdentityIndex, load_identity_index, normalize_ids
+
+
+class Linkage:
+    # Brute-force reference: union-find over normalized identifier strings,
+    # joining all identifiers of each return
+
+    def __init__(self, df):
+        self.ids = pd.DataFrame({kind: normalize_ids(df[column]) for kind, column in ID_KINDS.items()})
+        self.parent = {}
+        for row in self.ids.itertuples(index=False):
+            nodes = [(kind, value) for kind, value in zip(ID_KINDS, row) if value]
+            for node in nodes:
+                self.parent.setdefault(node, node)
+            for node in nodes[1:]:
+                self.parent[self.find(node)] = self.find(nodes[0])
+        self.cluster_pans = {}
+        for node in self.parent:
+            if node[0] == "pan":
+                self.cluster_pans[self.find(node)] = self.cluster_pans.get(self.find(node), 0) + 1
+        # PANs seen together with each Aadhaar / bank account
+        self.pans = {}
+        for row in self.ids.itertuples(index=False):
+            for kind in ("aadhaar", "bank"):
+                if row.pan and getattr(row, kind):
+                    self.pans.setdefault((kind, getattr(row, kind)), set()).add(row.pan)
+
+    def find(self, node):
+        while self.parent[node] != node:
+            self.parent[node] = self.parent[self.parent[node]]
+            node = self.parent[node]
+        return node
+
+    def features(self, frame):
+        ids = pd.DataFrame({kind: normalize_ids(frame[column]) for kind, column in ID_KINDS.items()})
+        columns = {"Aadhaar_Shared_PANs": [], "Bank_Shared_PANs": [], "Linked_Cluster_Size": []}
+        for row in ids.itertuples(index=False):
+            for kind, name in (("aadhaar", "Aadhaar_Shared_PANs"), ("bank", "Bank_Shared_PANs")):
+                pans = self.pans.get((kind, getattr(row, kind)), set())
+                columns[name].append(len(pans - {row.pan}))
+            roots = {self.find((kind, value)) for kind, value in zip(ID_KINDS, row) if (kind, value) in self.parent}
+            size = sum(self.cluster_pans.get(root, 0) for root in roots)
+            size += bool(row.pan) and ("pan", row.pan) not in self.parent
+            columns["Linked_Cluster_Size"].append(max(size, 1))
+        features = pd.DataFrame(columns, index=frame.index)
+        features["Identity_Flag"] = (features["Aadhaar_Shared_PANs"] > 0) | (features["Bank_Shared_PANs"] > 0)
+        return features
+
+    def clusters(self):
+        # {(number of PANs, rows)} over every cluster
+        members = {}
+        for i, row in enumerate(self.ids.itertuples(index=False)):
+            present = [(kind, value) for kind, value in zip(ID_KINDS, row) if value]
+            if present:
+                members.setdefault(self.find(present[0]), []).append(i)
+        return {(self.cluster_pans.get(root, 0), tuple(rows)) for root, rows in members.items()}
+
+
+def _synthetic(n=4000, seed=0):
+    # Heavily shared identifiers, some missing, some written in other case
+    # or with separators
+    rng = np.random.default_rng(seed)
+
+    def ids(prefix, n_distinct, missing):
+        values = np.array([f"{prefix}{x:05d}" for x in rng.integers(0, n_distinct, n)], dtype=object)
+        messy = rng.random(n) < 0.1
+        values[messy] = [f" {v[:3].lower()}-{v[3:]}" for v in values[messy]]
+        values[rng.random(n) < missing] = None
+        return values
+
+    return pd.DataFrame({"Name": [f"Name{i}" for i in range(n)], "PAN_Card": ids("PAN", 2000, 0.1),
+                         "Aadhar_Card": ids("AAD", 2500, 0.2), "Bank_Account_No": ids("ACC", 3000, 0.2)})
+
+
+def _probe(df, seed):
+    # Indexed returns plus returns with a new PAN on known accounts
+    probe = df.sample(min(len(df), 1500), random_state=seed)
+    probe.loc[probe.index[:200], "PAN_Card"] = [f"NEWPAN{i}" for i in range(200)]
+    probe.loc[probe.index[200:250], ["PAN_Card", "Aadhar_Card", "Bank_Account_No"]] = None
+    return probe.reset_index(drop=True)
+
+
+def _check(index, df, linkage, probe):
+    assert len(index) == len(df)
+    pd.testing.assert_frame_equal(index.features(probe), linkage.features(probe))
+    assert {(pans, tuple(rows.index)) for pans, rows in index.clusters(0)} == linkage.clusters()
+    for kind, column in ID_KINDS.items():
+        for value in df[column].dropna().iloc[::397]:
+            expected = np.flatnonzero(linkage.ids[kind] == normalize_ids([value])[0])
+            assert index.lookup(kind, value).index.tolist() == expected.tolist()
+
+
+@pytest.fixture(scope="module", params=["real", "synthetic"])
+def dataset(request):
+    if request.param == "real":
+        df = pd.concat(read_returns("income_regression_dataset3.csv"), ignore_index=True)
+    else:
+        df = _synthetic()
+    return df, Linkage(df), _probe(df, seed=1)
+
+
+def test_full_build_matches_brute_force(dataset):
+    df, linkage, probe = dataset
+    _check(IdentityIndex.from_frames(df), df, linkage, probe)
+
+
+@pytest.mark.parametrize("pieces", [2, 13, 200])
+def test_incremental_updates_match_brute_force(dataset, pieces, tmp_path):
+    df, linkage, probe = dataset
+    index = IdentityIndex()
+    for part in np.array_split(np.arange(len(df)), pieces):
+        index.update(df.iloc[part])
+    _check(index, df, linkage, probe)
+    # A saved index is re-indexed in one pass on load
+    index.save(str(tmp_path / "identity_index.joblib"))
+    _check(load_identity_index(str(tmp_path / "identity_index.joblib")), df, linkage, probe)
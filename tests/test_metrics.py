@@ -0,0 +1,41 @@
+import threading
+
+import metrics
+
+
+def _race(fn, n_threads=8):
+    # Call fn from n_threads threads released at the same moment
+    barrier = threading.Barrier(n_threads)
+    results, errors = [], []
+
+    def run():
+        barrier.wait()
+        try:
+            results.append(fn())
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run) for _ in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_sessions_share_one_server(monkeypatch):
+    monkeypatch.setattr(metrics, "_server", None)
+    servers, errors = _race(lambda: metrics.start_server(0))
+    try:
+        assert not errors
+        assert len({id(server) for server in servers}) == 1
+    finally:
+        servers[0].shutdown()
+        servers[0].server_close()
+
+
+def test_concurrent_sessions_share_one_log_dump(monkeypatch):
+    monkeypatch.setattr(metrics, "_dumper", None)
+    dumpers, errors = _race(lambda: metrics.start_log_dump(3600))
+    assert not errors
+    assert len({id(dumper) for dumper in dumpers}) == 1
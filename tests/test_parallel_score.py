@@ -0,0 +1,76 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+import bulk_jobs
+from identity_index import IdentityIndex
+from parallel_score import IDENTITY_COLUMNS, SCORE_COLUMNS, score_parallel
+
+NO_IDS = ["PAN_Card", "Aadhar_Card", "Bank_Account_No"]
+
+
+def batch_score(input_path, output_path, *options):
+    subprocess.run([sys.executable, "batch_score.py", str(input_path), "-o", str(output_path), *options],
+                   check=True, capture_output=True)
+    return output_path.read_bytes()
+
+
+def check_widths(path, columns):
+    lines = path.read_text().splitlines()
+    assert lines[0].split(",") == columns
+    assert all(line.count(",") == len(columns) - 1 for line in lines[1:])
+    return len(lines) - 1
+
+
+@pytest.mark.parametrize("drop", [[], NO_IDS], ids=["all_ids", "name_only"])
+def test_parallel_matches_batch(tmp_path, returns, drop):
+    input_path = tmp_path / "returns.csv"
+    returns.drop(columns=drop).to_csv(input_path, index=False)
+    run = score_parallel(str(input_path), str(tmp_path / "parallel.csv"), workers=2, n_shards=5)
+    assert run["rows"] == len(returns)
+    assert (tmp_path / "parallel.csv").read_bytes() == batch_score(input_path, tmp_path / "batch.csv")
+    ids = ["Name"] + [c for c in NO_IDS if c not in drop]
+    assert check_widths(tmp_path / "parallel.csv", ids + SCORE_COLUMNS) == len(returns)
+
+
+def test_parallel_identity_columns_match_batch(tmp_path, returns):
+    input_path = tmp_path / "returns.csv"
+    index_path = tmp_path / "index.joblib"
+    returns.to_csv(input_path, index=False)
+    IdentityIndex.from_frames(returns).save(str(index_path))
+    score_parallel(str(input_path), str(tmp_path / "parallel.csv"), workers=2, n_shards=3,
+                   identity_index_path=str(index_path))
+    expected = batch_score(input_path, tmp_path / "batch.csv", "--identity-index", str(index_path))
+    assert (tmp_path / "parallel.csv").read_bytes() == expected
+    columns = ["Name"] + NO_IDS + SCORE_COLUMNS + IDENTITY_COLUMNS
+    assert check_widths(tmp_path / "parallel.csv", columns) == len(returns)
+
+
+def test_bulk_upload_without_id_columns(tmp_path, returns, monkeypatch):
+    monkeypatch.setattr(bulk_jobs, "INDEX_PATH", str(tmp_path / "missing.joblib"))
+    manager = bulk_jobs.BulkJobManager(workers=1, jobs_dir=str(tmp_path / "jobs"))
+    try:
+        job = manager.submit(returns.drop(columns=NO_IDS).to_csv(index=False).encode(), "name_only.csv")
+        deadline = time.time() + 120
+        while not job.done and time.time() < deadline:
+            time.sleep(0.1)
+        assert job.status == "done", job.error
+        assert check_widths(tmp_path / "jobs" / job.id / "scored.csv", ["Name"] + SCORE_COLUMNS) == len(returns)
+        assert list(job.results().columns) == ["Name"] + SCORE_COLUMNS
+    finally:
+        if manager._pool is not None:
+            manager._pool.shutdown()
+
+
+def test_bulk_upload_needs_id_columns_with_an_index(tmp_path, returns, monkeypatch):
+    index_path = tmp_path / "index.joblib"
+    index_path.write_bytes(b"")
+    monkeypatch.setattr(bulk_jobs, "INDEX_PATH", str(index_path))
+    manager = bulk_jobs.BulkJobManager(workers=1, jobs_dir=str(tmp_path / "jobs"))
+    with pytest.raises(ValueError, match="PAN_Card, Aadhar_Card, Bank_Account_No"):
+        manager.submit(returns.drop(columns=NO_IDS).to_csv(index=False).encode(), "name_only.csv")
+    data = returns.drop(columns=["Name"]).to_csv(index=False).encode()
+    with pytest.raises(ValueError, match="missing columns: Name"):
+        bulk_jobs.BulkJobManager(workers=1, jobs_dir=str(tmp_path / "jobs")).submit(data, "no_name.csv")
@@ -0,0 +1,50 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from fraud_rules import get_rule_engine
+from model_registry import get_preprocessor, get_serving_model
+from result_cache import ResultCache
+from scoring import score_matrix
+
+
+@pytest.fixture(scope="module")
+def encoded(returns):
+    return get_preprocessor().encode(returns)
+
+
+def _stats_delta(fn):
+    engine = get_rule_engine()
+    before = engine.stats()
+    fn()
+    after = engine.stats()
+    return (after["rows"] - before["rows"],
+            {rule: n - before["hits"][rule] for rule, n in after["hits"].items()},
+            {level: n - before["levels"][level] for level, n in after["levels"].items()})
+
+
+@pytest.mark.parametrize("disk", [False, True], ids=["memory", "sqlite"])
+def test_cached_scores_and_rule_stats_match_uncached(tmp_path, encoded, disk):
+    model, preprocessor = get_serving_model(), get_preprocessor()
+    cache = ResultCache(disk_path=str(tmp_path / "results.db") if disk else None)
+    batches = [encoded[:300], encoded[200:], encoded[:300]]
+    expected = _stats_delta(lambda: [score_matrix(b, model, preprocessor) for b in batches])
+    results = []
+    assert _stats_delta(lambda: results.extend(cache.score(b, model, preprocessor) for b in batches)) == expected
+    assert cache.stats()["hits"] + cache.stats()["disk_hits"] > 0
+    for batch, scores in zip(batches, results):
+        reference = score_matrix(batch, model, preprocessor)
+        assert scores.keys() == reference.keys()
+        for name in reference:
+            np.testing.assert_array_equal(scores[name], reference[name])
+
+
+def test_disk_tier_replaces_tables_without_rule_hits(tmp_path, encoded):
+    path = tmp_path / "results.db"
+    with sqlite3.connect(path) as db:
+        db.execute("CREATE TABLE results (key BLOB PRIMARY KEY, version TEXT, expires REAL, predicted REAL, "
+                   "level INTEGER, tax REAL)")
+    cache = ResultCache(disk_path=str(path))
+    cache.score(encoded[:10], get_serving_model(), get_preprocessor())
+    assert len(cache.disk) == 10
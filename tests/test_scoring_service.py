@@ -0,0 +1,28 @@
+import asyncio
+
+from scoring_service import ScoringService
+
+
+async def _request(raw):
+    # Send raw bytes to a service with no batcher; returns everything read
+    # before the server closes the connection
+    server = await asyncio.start_server(ScoringService(None).serve_connection, "127.0.0.1", 0)
+    async with server:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(raw)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout=5)
+        writer.close()
+        return response
+
+
+def test_oversized_body_is_refused_without_reading_it():
+    # The body is never sent: the server must answer from the headers alone
+    response = asyncio.run(_request(b"POST /score HTTP/1.1\r\nContent-Length: 1000000000000\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 413 ")
+    assert b"Connection: close" in response
+
+
+def test_invalid_content_length_is_rejected():
+    response = asyncio.run(_request(b"POST /score HTTP/1.1\r\nContent-Length: lots\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 400 ")
@@ -0,0 +1,14 @@
+import numpy as np
+
+from shadow import ShadowScorer
+
+
+def test_failed_submits_release_their_slot():
+    scorer = ShadowScorer(["candidate.joblib"], max_pending=2, report_path=None)
+    scorer._executor.shutdown()
+    primary = {"total_reported_income": np.ones(1), "predicted_income": np.ones(1), "risk_level": np.zeros(1)}
+    for _ in range(5):
+        assert scorer.submit(np.zeros((1, 15)), primary) is False
+    assert (scorer.submitted, scorer.dropped) == (0, 5)
+    # Every slot is free again
+    assert all(scorer._slots.acquire(blocking=False) for _ in range(2))
@@ -0,0 +1,53 @@
+import joblib
+import numpy as np
+import pytest
+
+import forest_engine
+from data_generator import generate
+from model_registry import MODEL_PATH, SHARED_MODEL_PATH, file_digest, get_preprocessor, get_serving_model
+from shared_model import SharedForest, flatten_forest, load_shared_model
+
+
+@pytest.fixture(scope="module")
+def model():
+    return joblib.load(MODEL_PATH)
+
+
+@pytest.fixture(scope="module")
+def rows(model, returns):
+    # Generated and real returns, plus rows whose features sit exactly on a
+    # split threshold or one float32 step either side of it, where a float64
+    # comparison would route differently from sklearn
+    rng = np.random.default_rng(0)
+    X = np.vstack([generate(2000, seed=3)[0], get_preprocessor().encode(returns)])
+    edge = X[rng.integers(0, len(X), 3000)].copy()
+    for estimator in model.estimators_[:10]:
+        tree = estimator.tree_
+        inner = np.flatnonzero(tree.children_left >= 0)
+        for node in rng.choice(inner, 300):
+            t32 = np.float32(tree.threshold[node])
+            row = rng.integers(0, len(edge))
+            edge[row, tree.feature[node]] = rng.choice([np.nextafter(t32, np.float32(-np.inf)), t32,
+                                                        np.nextafter(t32, np.float32(np.inf))])
+    return np.vstack([X, edge])
+
+
+@pytest.mark.parametrize("engine", ["default", "numpy"])
+def test_shared_forest_matches_sklearn(model, rows, engine, monkeypatch):
+    if engine == "numpy":
+        monkeypatch.setattr(forest_engine, "_predict_compiled", None)
+    shared = SharedForest(flatten_forest(model))
+    np.testing.assert_array_equal(shared.predict(rows), model.predict(rows))
+    np.testing.assert_array_equal(shared.predict(rows[:1]), model.predict(rows[:1]))
+
+
+def test_exported_model_is_current_and_matches_sklearn(model, rows):
+    shared = load_shared_model(SHARED_MODEL_PATH)
+    assert shared.source_digest == file_digest(MODEL_PATH)
+    assert isinstance(get_serving_model(), SharedForest)
+    np.testing.assert_array_equal(shared.predict(rows), model.predict(rows))
+
+
+def test_rejects_wrong_width(model):
+    with pytest.raises(ValueError):
+        SharedForest(flatten_forest(model)).predict(np.zeros((2, model.n_features_in_ + 1)))
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from tax_engine import compute_tax, tax_liability
+
+
+def calculate_tax(income):
+    # calculate_tax() as app.py had it before the tax engine
+    tax_slabs = [(250000, 0.05), (500000, 0.2), (1000000, 0.3)]
+    tax = 0
+    prev_limit = 250000
+    if income <= 250000:
+        return 0
+    for limit, rate in tax_slabs:
+        if income > limit:
+            tax += (limit - prev_limit) * rate
+            prev_limit = limit
+        else:
+            tax += (income - prev_limit) * rate
+            break
+    tax += tax * 0.04
+    return round(tax, 2)
+
+
+def _incomes(n=50000, seed=0):
+    # Whole and fractional incomes up to ₹50L, plus every slab limit and its
+    # neighbours
+    rng = np.random.default_rng(seed)
+    limits = np.array([0, 250000, 500000, 1000000], dtype=np.float64)
+    edges = (limits[:, None] + np.array([-1, -0.01, 0, 0.01, 1])).ravel()
+    return np.concatenate([rng.integers(0, 5000000, n).astype(np.float64),
+                           rng.uniform(0, 5000000, n).round(2), edges[edges >= 0]])
+
+
+def test_app_regime_matches_scalar_calculate_tax():
+    incomes = _incomes()
+    expected = np.array([calculate_tax(income) for income in incomes.tolist()])
+    np.testing.assert_array_equal(compute_tax(incomes, "app"), expected)
+    for income in incomes[::997].tolist():
+        assert tax_liability(income) == calculate_tax(income)
+
+
+@pytest.mark.parametrize("regime, income, tax", [
+    ("old_fy2023", 1050000, 117000),   # 5% of 2.5-5L + 20% of 5-10L, plus cess
+    ("old_fy2023", 550000, 0),         # section 87A rebate
+    ("new_fy2023", 750000, 0),         # rebate up to ₹7L taxable
+    ("new_fy2023", 760000, 10400),     # marginal relief: tax capped at the ₹10k above the limit
+    ("new_fy2024", 1075000, 52000),    # 5% of 3-7L + 10% of 7-10L, plus cess
+])
+def test_statutory_regimes(regime, income, tax):
+    assert tax_liability(income, regime) == tax
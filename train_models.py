@@ -0,0 +1,165 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.svm import SVR
+from sklearn.tree import DecisionTreeRegressor
+
+try:
+    import resource
+except ImportError:  # Unix only; peak memory is not reported on Windows
+    resource = None
+
+from batch_score import read_returns
+from model_registry import MODEL_PATH, SHARED_MODEL_PATH, file_digest
+from outliers import OutlierFilter
+from preprocessing import FEATURE_COLUMNS
+from scoring import load_preprocessor
+from shared_model import export_shared_model
+
+TARGET_COLUMN = "Actual_Income"
+
+# Same candidates as code.ipynb (library defaults, fixed seeds where supported)
+CANDIDATES = {
+    "Decision Trees": lambda: DecisionTreeRegressor(random_state=42),
+    "Random Forest": lambda: RandomForestRegressor(random_state=42),
+    "SVM": lambda: SVR(),
+    "KNN": lambda: KNeighborsRegressor(),
+    "Gradient Boosting": lambda: GradientBoostingRegressor(random_state=42),
+}
+
+
+def load_training_frame(path, drop_outliers=False):
+    # Only the model's features and target are read (from a dataset store,
+    # just those columns' bytes)
+    columns = FEATURE_COLUMNS + [TARGET_COLUMN]
+    if drop_outliers:
+        # Two streaming passes: learn the IQR bounds, then keep inliers only
+        outlier_filter = OutlierFilter().fit(read_returns(path, columns=columns))
+        dataset = pd.concat(outlier_filter.transform(read_returns(path, columns=columns)), ignore_index=True)
+    else:
+        dataset = pd.concat(read_returns(path, columns=columns), ignore_index=True)
+    # Drop rows with missing values, as the notebook does
+    return dataset.dropna(subset=FEATURE_COLUMNS + [TARGET_COLUMN]).reset_index(drop=True)
+
+
+def prepare_split(path, split_path, test_size=0.3, seed=42, drop_outliers=False):
+    # Encode once and store the split uncompressed so every worker can
+    # memory-map the same arrays instead of receiving its own pickled copy
+    dataset = load_training_frame(path, drop_outliers)
+    X = load_preprocessor().encode(dataset)
+    y = pd.to_numeric(dataset[TARGET_COLUMN]).to_numpy(dtype=np.float64)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=seed)
+    joblib.dump({"X_train": X_train, "X_test": X_test, "y_train": y_train, "y_test": y_test},
+                split_path, compress=0)
+    return len(X_train), len(X_test)
+
+
+def _median_latency(fn, X, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(X)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def _max_rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def evaluate_candidate(name, split_path, model_dir, latency_repeats=20):
+    split = joblib.load(split_path, mmap_mode="r")
+    model = CANDIDATES[name]()
+
+    # Each candidate runs in a fresh worker, so the process high-water mark
+    # (KB on Linux) is this candidate's peak
+    rss_before_kb = _max_rss_kb()
+    start = time.perf_counter()
+    model.fit(split["X_train"], split["y_train"])
+    fit_seconds = time.perf_counter() - start
+    peak_rss_kb = _max_rss_kb()
+
+    X_test = split["X_test"]
+    start = time.perf_counter()
+    predictions = model.predict(X_test)
+    batch_seconds = time.perf_counter() - start
+    single_seconds = _median_latency(model.predict, X_test[:1], latency_repeats)
+
+    model_path = os.path.join(model_dir, name.replace(" ", "_").lower() + ".joblib")
+    joblib.dump(model, model_path)
+    return {
+        "model": name,
+        "r2": float(r2_score(split["y_test"], predictions)),
+        "mse": float(mean_squared_error(split["y_test"], predictions)),
+        "fit_seconds": round(fit_seconds, 4),
+        "predict_batch_ms": round(batch_seconds * 1e3, 4),
+        "predict_single_ms": round(single_seconds * 1e3, 4),
+        "peak_rss_mb": None if peak_rss_kb is None else round(peak_rss_kb / 1024, 1),
+        "fit_peak_memory_mb": None if peak_rss_kb is None else round((peak_rss_kb - rss_before_kb) / 1024, 1),
+        "model_size_kb": round(os.path.getsize(model_path) / 1024, 1),
+        "artifact": model_path,
+    }
+
+
+def run_selection(data_path, names, workers, model_dir, drop_outliers=False):
+    split_path = os.path.join(model_dir, "split.joblib")
+    n_train, n_test = prepare_split(data_path, split_path, drop_outliers=drop_outliers)
+    results = []
+    # Spawned (not forked) workers so ru_maxrss does not inherit the parent's peak
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1,
+                             mp_context=mp.get_context("spawn")) as pool:
+        futures = {pool.submit(evaluate_candidate, name, split_path, model_dir): name for name in names}
+        for future in as_completed(futures):
+            result = future.result()
+            print(f"{result['model']:<18} R2={result['r2']:.4f}  fit={result['fit_seconds']:.2f}s")
+            results.append(result)
+    results.sort(key=lambda r: r["r2"], reverse=True)
+    return {"train_rows": n_train, "test_rows": n_test, "leaderboard": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit candidate models in parallel and keep the best")
+    parser.add_argument("--data", default="income_regression_dataset3.csv")
+    parser.add_argument("--models", nargs="+", choices=list(CANDIDATES), default=list(CANDIDATES))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default=MODEL_PATH)
+    parser.add_argument("--leaderboard", default="leaderboard.json")
+    parser.add_argument("--drop-outliers", action="store_true",
+                        help="drop IQR outliers first, as code.ipynb does")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        report = run_selection(args.data, args.models, args.workers, model_dir, args.drop_outliers)
+        best = report["leaderboard"][0]
+        best_model = joblib.load(best["artifact"])
+        joblib.dump(best_model, args.output)
+    for entry in report["leaderboard"]:
+        del entry["artifact"]
+    report["best_model"] = best["model"]
+    with open(args.leaderboard, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.output == MODEL_PATH and isinstance(best_model, RandomForestRegressor):
+        # Keep the memory-mapped serving copy in sync with the new model
+        export_shared_model(best_model, SHARED_MODEL_PATH, source_digest=file_digest(args.output))
+
+    print(f"Best model: {best['model']} (R2={best['r2']:.4f}) -> {args.output}; "
+          f"leaderboard -> {args.leaderboard}")
+
+
+if __name__ == "__main__":
+    main()
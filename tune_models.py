@@ -0,0 +1,180 @@
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import pickle
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import r2_score
+
+from scoring import load_preprocessor
+from train_models import TARGET_COLUMN, load_training_frame
+
+# Sampled uniformly per parameter; model.py's hand-tuned forest is one point in here
+SEARCH_SPACE = {
+    "Random Forest": {
+        "n_estimators": [25, 50, 100, 150],
+        "max_depth": [6, 8, 10, 12, None],
+        "min_samples_split": [2, 5, 10, 15, 20],
+        "min_samples_leaf": [1, 2, 5, 10],
+        "max_features": [1.0, 0.6, 0.3],
+    },
+    "Gradient Boosting": {
+        "n_estimators": [50, 100, 200, 400],
+        "learning_rate": [0.03, 0.05, 0.1, 0.2],
+        "max_depth": [2, 3, 4, 5],
+        "min_samples_leaf": [1, 5, 10],
+        "subsample": [0.6, 0.8, 1.0],
+    },
+}
+ESTIMATORS = {
+    "Random Forest": RandomForestRegressor,
+    "Gradient Boosting": GradientBoostingRegressor,
+}
+
+
+def sample_configs(n_configs, seed=42):
+    rng = np.random.default_rng(seed)
+    families = list(SEARCH_SPACE)
+    configs = []
+    seen = set()
+    while len(configs) < n_configs and len(seen) < 10 * n_configs:
+        family = families[len(configs) % len(families)]
+        params = {name: values[rng.integers(len(values))] for name, values in SEARCH_SPACE[family].items()}
+        params = {k: (v.item() if isinstance(v, np.generic) else v) for k, v in params.items()}
+        key = (family, tuple(sorted(params.items(), key=lambda kv: kv[0])))
+        if key not in seen:
+            configs.append({"family": family, "params": params})
+        seen.add(key)
+    return configs
+
+
+def prepare_folds(data_path, cache_path, n_folds=3, seed=42):
+    # Encode once, fix a row order and a fold id per row, and cache it all
+    # uncompressed. Every round and every worker memory-maps the same arrays;
+    # a round with budget b simply uses the first b rows of that order, so the
+    # smaller rounds' folds are subsets of the larger rounds' folds.
+    dataset = load_training_frame(data_path)
+    X = load_preprocessor().encode(dataset)
+    y = pd.to_numeric(dataset[TARGET_COLUMN]).to_numpy(dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(X))
+    joblib.dump({
+        "X": np.ascontiguousarray(X[order]),
+        "y": np.ascontiguousarray(y[order]),
+        "fold": np.arange(len(X)) % n_folds,
+    }, cache_path, compress=0)
+    return len(X)
+
+
+def objective(r2, latency_us, size_mb, latency_weight, size_weight):
+    # Higher is better: accuracy minus serving cost
+    return r2 - latency_weight * latency_us - size_weight * size_mb
+
+
+def evaluate_config(config, cache_path, budget, latency_weight, size_weight):
+    data = joblib.load(cache_path, mmap_mode="r")
+    X, y, fold = data["X"][:budget], data["y"][:budget], data["fold"][:budget]
+    r2s, latencies, sizes, fit_seconds = [], [], [], 0.0
+    for k in np.unique(fold):
+        train, valid = fold != k, fold == k
+        model = ESTIMATORS[config["family"]](random_state=42, **config["params"])
+        start = time.perf_counter()
+        model.fit(X[train], y[train])
+        fit_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        predictions = model.predict(X[valid])
+        latencies.append((time.perf_counter() - start) / valid.sum() * 1e6)
+        r2s.append(r2_score(y[valid], predictions))
+        sizes.append(len(pickle.dumps(model)) / 2**20)
+
+    r2, latency_us, size_mb = float(np.mean(r2s)), float(np.mean(latencies)), float(np.mean(sizes))
+    return {
+        **config,
+        "budget": int(budget),
+        "r2": r2,
+        "latency_us_per_row": round(latency_us, 3),
+        "size_mb": round(size_mb, 3),
+        "fit_seconds": round(fit_seconds, 3),
+        "objective": objective(r2, latency_us, size_mb, latency_weight, size_weight),
+    }
+
+
+def budget_schedule(n_rows, n_configs, min_budget, eta):
+    # One round per 1/eta cut of the configs; the last round always uses
+    # every row and earlier rounds shrink by eta, but never below min_budget
+    n_rounds = int(math.floor(math.log(max(n_configs, 1), eta) + 1e-9)) + 1
+    return [min(n_rows, max(min_budget, n_rows // eta ** (n_rounds - 1 - r))) for r in range(n_rounds)]
+
+
+def successive_halving(cache_path, n_rows, configs, min_budget, eta, workers,
+                       latency_weight, size_weight):
+    # Cheap rounds on row subsets weed out configs; after each round only the
+    # best 1/eta by objective move on to the next, larger budget
+    survivors = configs
+    history = []
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        for round_index, budget in enumerate(budget_schedule(n_rows, len(configs), min_budget, eta)):
+            futures = [pool.submit(evaluate_config, config, cache_path, budget,
+                                   latency_weight, size_weight) for config in survivors]
+            results = sorted((f.result() for f in futures), key=lambda r: r["objective"], reverse=True)
+            for r in results:
+                r["round"] = round_index
+            history.extend(results)
+            best = results[0]
+            print(f"round {round_index}: {len(results)} configs on {budget:,} rows, "
+                  f"best objective {best['objective']:.4f} ({best['family']}, R2={best['r2']:.4f})")
+            keep = max(1, len(results) // eta)
+            survivors = [{"family": r["family"], "params": r["params"]} for r in results[:keep]]
+    return best, history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Successive-halving search over forest and boosting models")
+    parser.add_argument("--data", default="income_regression_dataset3.csv")
+    parser.add_argument("--configs", type=int, default=27)
+    parser.add_argument("--min-budget", type=int, default=500, help="rows used in the first round")
+    parser.add_argument("--eta", type=int, default=3, help="keep 1/eta of the configs per round")
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--latency-weight", type=float, default=0.002,
+                        help="objective penalty per microsecond of predict time per row")
+    parser.add_argument("--size-weight", type=float, default=0.0005,
+                        help="objective penalty per MB of pickled model")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--report", default="tuning_report.json")
+    parser.add_argument("--output", help="refit the winner on all rows and save it here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, "folds.joblib")
+        n_rows = prepare_folds(args.data, cache_path, args.folds, args.seed)
+        configs = sample_configs(args.configs, args.seed)
+        best, history = successive_halving(cache_path, n_rows, configs, args.min_budget, args.eta,
+                                           args.workers, args.latency_weight, args.size_weight)
+        if args.output:
+            data = joblib.load(cache_path, mmap_mode="r")
+            model = ESTIMATORS[best["family"]](random_state=42, **best["params"])
+            model.fit(data["X"], data["y"])
+            joblib.dump(model, args.output)
+
+    with open(args.report, "w") as f:
+        json.dump({
+            "objective": {"latency_weight": args.latency_weight, "size_weight": args.size_weight},
+            "best": best,
+            "history": history,
+        }, f, indent=2)
+    print(f"Best: {best['family']} {best['params']} -> {args.report}")
+
+
+if __name__ == "__main__":
+    main()